@@ -5,22 +5,46 @@ import os
 import logging
 import json
 import time
+import shutil
+import importlib
 import environs
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, Response, json
-import deep_lynx
 import threading
 
 # Repository Modules
-from .deep_lynx_query import query_deep_lynx
-from .deep_lynx_import import import_to_deep_lynx
-from .ml_adapter import main
+from .ingest import Ingest_Pool, create_ingest_pool
+from .retrain_scheduler import Retrain_Scheduler, create_retrain_scheduler
+from .deep_lynx_client import Deep_Lynx_Client, create_deep_lynx_client
+from .startup import Startup
 import utils
 
+# The names of the package whose modules import pandas, the Deep Lynx SDK or the pipeline, and their modules. A
+# module is imported when one of its names is first used, or by the startup thread, so that the app serves at once
+EXPORTS = {
+    "query_deep_lynx": "deep_lynx_query",
+    "queue_batch": "deep_lynx_query",
+    "export_queue": "deep_lynx_query",
+    "Ring_Buffer": "ring_buffer",
+    "create_queue_buffer": "ring_buffer",
+    "import_to_deep_lynx": "deep_lynx_import",
+    "main": "ml_adapter"
+}
+
 # Global variables
+# The Deep Lynx client shared by all threads, and its deep_lynx.ApiClient
+deep_lynx_client = None
 api_client = None
 lock_ = threading.Lock()
+# Notifies the ml_thread that data was added to the queue. Shares lock_ with the queue
+new_data_condition = threading.Condition(lock_)
+queue_buffer = None
+ingest_pool = None
+# Decides when the ml_thread starts a retrain cycle
+retrain_scheduler = None
 threads = list()
-number_of_events = 1
+# The progress of the startup thread, returned by GET /ready
+startup = None
 env = environs.Env()
 new_data = False
 
@@ -34,10 +58,24 @@ logging.basicConfig(filename='MLAdapter.log',
 print('Application started. Logging to file MLAdapter.log')
 
 
+def __getattr__(name: str):
+    """
+    Imports a name of the package, or a module of the package e.g. adapter.deep_lynx_query, when first used
+    """
+    if name in EXPORTS:
+        value = getattr(importlib.import_module("." + EXPORTS[name], __name__), name)
+    elif name in EXPORTS.values():
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    globals()[name] = value
+    return value
+
+
 def create_app():
     """ This file and aplication is the entry point for the `flask run` command """
-    global number_of_events
     global env
+    global startup
     app = Flask(os.getenv('FLASK_APP'), instance_relative_config=True)
 
     # Validate .env file exists
@@ -67,51 +105,25 @@ def create_app():
 
     # Purpose to run flask once (not twice)
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        # Instantiate deep_lynx
-        container_id, data_source_id, api_client = deep_lynx_init()
-        os.environ["CONTAINER_ID"] = container_id
-        os.environ["DATA_SOURCE_ID"] = data_source_id
-
-        # Register for events to listen for
-        register_for_event(api_client)
-
-        # Create Thread object that runs the machine learning algorithms
-        # Thread object: activity that is run in a separate thread of control
-        # Daemon: a process that runs in the background. A daemon thread will shut down immediately when the program exits.
-        ml_thread = threading.Thread(target=main, daemon=True, name="ml_thread")
-        print("Created ml_thread")
-        threads.append(ml_thread)
-        # Start the thread’s activity
-        ml_thread.start()
-
-        # File clean up
-        if os.path.exists(os.getenv("QUEUE_FILE_NAME")):
-            os.remove(os.getenv("QUEUE_FILE_NAME"))
-        if os.path.exists(os.getenv("ML_ADAPTER_OBJECT_LOCATION")):
-            f = open(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
-            ml_adapter_object = json.load(f)
-            f.close()
-            if os.path.exists(ml_adapter_object["MODEL"]["output_file"]):
-                os.remove(ml_adapter_object["MODEL"]["output_file"])
-            if os.path.exists(ml_adapter_object["DATASET"]):
-                os.remove(ml_adapter_object["DATASET"])
-            os.remove(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
-        if os.path.exists("data/training_set.csv"):
-            os.remove("data/training_set.csv")
-        if os.path.exists("data/testing_set.csv"):
-            os.remove("data/testing_set.csv")
-        if os.path.exists("data/X_train.csv"):
-            os.remove("data/X_train.csv")
-        if os.path.exists("data/X_test.csv"):
-            os.remove("data/X_test.csv")
-        if os.path.exists("data/y_train.csv"):
-            os.remove("data/y_train.csv")
-        if os.path.exists("data/y_test.csv"):
-            os.remove("data/y_test.csv")
+        # Connect to Deep Lynx and start the pipeline in the background, so that the app serves at once. GET /ready
+        # reports the progress
+        startup = Startup()
+        startup_thread = threading.Thread(target=start, args=(startup, ), daemon=True, name="startup_thread")
+        threads.append(startup_thread)
+        startup_thread.start()
+
+    @app.route('/queue', methods=['GET'])
+    def queue_file():
+        """ Exports the current queue to the QUEUE_FILE_NAME .csv file and returns it """
+        if queue_buffer is None:
+            return not_ready()
+        from .deep_lynx_query import export_queue
+        file_path = export_queue()
+        with open(file_path) as f:
+            return Response(response=f.read(), status=200, mimetype='text/csv')
 
     @app.route('/machinelearning', methods=['POST'])
     def events():
-        global number_of_events
         if 'application/json' not in request.content_type:
             logging.warning('Received request with unsupported content type')
             return Response('Unsupported Content Type. Please use application/json', status=400)
@@ -125,91 +137,288 @@ def create_app():
             # The incoming payload doesn't have what we need, but still return a 200
             return Response(response=json.dumps({'received': True}), status=200, mimetype='application/json')
 
-        # Retrieves file from Deep Lynx
-        name = "event_thread_" + str(number_of_events)
-        # Thread object: activity that is run in a separate thread of control
-        event_thread = threading.Thread(target=query_deep_lynx, args=(file_id, ), name=name)
-        print("Created ", name)
-        threads.append(event_thread)
-        number_of_events += 1
-        # Start the thread’s activity
-        event_thread.start()
-        # Join: Wait until the thread terminates. This blocks the calling thread until the thread whose join() method is called terminates.
-        event_thread.join()
-        with lock_:
-            new_data = True
-        print(name, " is done")
-
-        return Response(response=json.dumps({'received': True}), status=200, mimetype='application/json')
+        # Queue the event for an ingest thread, which retrieves the file from Deep Lynx
+        if ingest_pool is None or not ingest_pool.submit(file_id):
+            return Response(response=json.dumps({'received': False}),
+                            status=503,
+                            mimetype='application/json',
+                            headers={'Retry-After': '1'})
+
+        return Response(response=json.dumps({'received': True}), status=202, mimetype='application/json')
+
+    @app.route('/ingest', methods=['GET'])
+    def ingest_status():
+        """ Returns the depth of the ingest queue and the latency of ingested events """
+        if ingest_pool is None:
+            return not_ready()
+        return Response(response=json.dumps(ingest_pool.status()), status=200, mimetype='application/json')
+
+    @app.route('/predict', methods=['POST'])
+    def predict():
+        """ Makes a prediction on the rows of the request with a model held in memory by the model registry """
+        import pandas as pd
+        import prediction
+        if 'application/json' not in (request.content_type or ''):
+            return Response('Unsupported Content Type. Please use application/json', status=400)
+        body = request.get_json()
+        if not isinstance(body, dict) or not isinstance(body.get("model"), str):
+            return Response(response=json.dumps({'error': 'The body must be a JSON object with the name of a model'}),
+                            status=400,
+                            mimetype='application/json')
+        model_registry = prediction.get_model_registry()
+        name = body["model"]
+        if name not in model_registry:
+            return Response(response=json.dumps({'error': 'Unknown model: ' + name}),
+                            status=404,
+                            mimetype='application/json')
+        try:
+            # Records e.g. [{"x1": 1.0, "x2": 2.0}] or columns e.g. {"x1": [1.0], "x2": [2.0]}
+            X = pd.DataFrame(body["data"])
+        except KeyError as e:
+            return Response(response=json.dumps({'error': 'Missing ' + str(e)}),
+                            status=400,
+                            mimetype='application/json')
+        except (ValueError, TypeError) as e:
+            return Response(response=json.dumps({'error': 'Invalid data: ' + str(e)}),
+                            status=400,
+                            mimetype='application/json')
+        try:
+            with utils.get_metrics().timer("predict", model=name):
+                yhat, version = model_registry.predict(name, X)
+        except KeyError as e:
+            return Response(response=json.dumps({'error': 'Missing ' + str(e)}),
+                            status=400,
+                            mimetype='application/json')
+        except Exception as e:
+            logging.exception('Prediction with model ' + name + ' failed')
+            return Response(response=json.dumps({'error': repr(e)}), status=500, mimetype='application/json')
+        result = {'model': name, 'version': version, 'predictions': yhat.tolist()}
+        return Response(response=json.dumps(result), status=200, mimetype='application/json')
+
+    @app.route('/models', methods=['GET'])
+    def models_status():
+        """ Returns the models of the model registry and whether they are loaded in memory """
+        import prediction
+        return Response(response=json.dumps(prediction.get_model_registry().status()),
+                        status=200,
+                        mimetype='application/json')
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """ Returns the durations, counts and sizes of the pipeline stages in the Prometheus text format """
+        return Response(response=utils.get_metrics().render(),
+                        status=200,
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    @app.route('/retrain', methods=['GET'])
+    def retrain_status():
+        """ Returns the retrain policy and the number of pending, started and skipped retrain cycles """
+        if retrain_scheduler is None:
+            return not_ready()
+        return Response(response=json.dumps(retrain_scheduler.status()), status=200, mimetype='application/json')
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        """ Returns the progress of the startup, with status 200 once the pipeline runs and 503 before """
+        if startup is None:
+            return not_ready()
+        status = startup.status()
+        return Response(response=json.dumps(status),
+                        status=200 if status["ready"] else 503,
+                        mimetype='application/json')
+
+    def not_ready():
+        """ The response of a request that needs the pipeline before it runs """
+        status = startup.status() if startup is not None else {"ready": False, "step": None}
+        return Response(response=json.dumps(status),
+                        status=503,
+                        mimetype='application/json',
+                        headers={'Retry-After': '1'})
 
     return app
 
 
-def register_for_event(api_client: deep_lynx.ApiClient, iterations=30):
+def start(startup: Startup):
+    """
+    Connects to Deep Lynx, starts the pipeline and registers for events, run by the startup thread. An error stops the
+    startup, and is reported by GET /ready
+
+    Args
+        startup (Startup): the progress of the startup
+    """
+    global api_client
+    global deep_lynx_client
+    global queue_buffer
+    global ingest_pool
+    global retrain_scheduler
+    try:
+        # Import the pipeline now rather than on the first event
+        from .deep_lynx_query import query_deep_lynx, queue_batch
+        from .ring_buffer import create_queue_buffer
+        from .ml_adapter import main
+        import prediction
+
+        # Instantiate deep_lynx
+        startup.advance("connecting")
+        container_id, data_source_id, client = deep_lynx_init()
+        if client is None or not container_id:
+            error = 'Cannot connect to Deep Lynx, or container {0} not found'.format(os.getenv('CONTAINER_NAME'))
+            logging.error('{0}: {1}'.format('RuntimeError', error))
+            raise RuntimeError(error)
+        deep_lynx_client = client
+        api_client = deep_lynx_client.api_client
+        os.environ["CONTAINER_ID"] = container_id
+        os.environ["DATA_SOURCE_ID"] = data_source_id
+
+        startup.advance("starting")
+        # Create the queue before any data is received
+        queue_buffer = create_queue_buffer()
+
+        # Create the ingest threads that retrieve the files of received events from Deep Lynx in batches
+        ingest_pool = create_ingest_pool(query_deep_lynx, queue_batch)
+        threads.extend(ingest_pool.threads)
+
+        # Create the scheduler of the retrain cycles before the ml_thread starts
+        retrain_scheduler = create_retrain_scheduler()
+
+        # Create Thread object that runs the machine learning algorithms
+        # Thread object: activity that is run in a separate thread of control
+        # Daemon: a process that runs in the background. A daemon thread will shut down immediately when the program exits.
+        ml_thread = threading.Thread(target=main, daemon=True, name="ml_thread")
+        print("Created ml_thread")
+        threads.append(ml_thread)
+        # Start the thread’s activity
+        ml_thread.start()
+
+        # File clean up
+        clean_up()
+
+        # Register for events to listen for
+        startup.advance("registering")
+        register_for_event(deep_lynx_client, startup=startup)
+        startup.advance("ready")
+    except Exception as e:
+        startup.fail(e)
+
+
+def clean_up():
+    """ Removes the files of a previous run of the adapter """
+    if os.path.exists(os.getenv("QUEUE_FILE_NAME")):
+        os.remove(os.getenv("QUEUE_FILE_NAME"))
+    if os.path.exists(os.getenv("ML_ADAPTER_OBJECT_LOCATION")):
+        f = open(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
+        ml_adapter_object = json.load(f)
+        f.close()
+        if os.path.exists(ml_adapter_object["MODEL"]["output_file"]):
+            os.remove(ml_adapter_object["MODEL"]["output_file"])
+        if os.path.exists(ml_adapter_object["DATASET"]):
+            os.remove(ml_adapter_object["DATASET"])
+        os.remove(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
+    shutil.rmtree(os.path.join("data", "adapters"), ignore_errors=True)
+    if os.path.exists("data/training_set.csv"):
+        os.remove("data/training_set.csv")
+    if os.path.exists("data/testing_set.csv"):
+        os.remove("data/testing_set.csv")
+    if os.path.exists("data/X_train.csv"):
+        os.remove("data/X_train.csv")
+    if os.path.exists("data/X_test.csv"):
+        os.remove("data/X_test.csv")
+    if os.path.exists("data/y_train.csv"):
+        os.remove("data/y_train.csv")
+    if os.path.exists("data/y_test.csv"):
+        os.remove("data/y_test.csv")
+
+
+def register_for_event(deep_lynx_client: Deep_Lynx_Client, iterations=30, startup: Startup = None):
     """
     Register with Deep Lynx to receive data_ingested events on applicable data sources
+
+        1. The data sources of the container are listed until all DATA_SOURCES are found
+        2. The event actions are listed once per attempt, and indexed by destination, event type and data source id
+        3. The missing event actions are created at the same time by REGISTER_WORKERS threads. A data source whose
+           event action could not be created is attempted again after REGISTER_WAIT_SECONDS
     
     Args
-        api_client (deep_lynx.ApiClient): deep lynx api client
+        deep_lynx_client (Deep_Lynx_Client): deep lynx client
         iterations (integer): the number of interations to try registering for events
+        startup (Startup): the progress of the startup, to which each attempt is reported, or None
+    Return
+        registered (boolean): whether the event actions of all DATA_SOURCES exist
     """
+    import deep_lynx
+
     registered = False
 
-    # List of adapters to receive events from
-    data_ingested_adapters = json.loads(os.getenv("DATA_SOURCES"))
+    # List of adapters to receive events from, and the data sources found by name
+    data_ingested_adapters = list(dict.fromkeys(json.loads(os.getenv("DATA_SOURCES"))))
+    data_sources = dict()
+    destination = "http://" + os.getenv('FLASK_RUN_HOST') + ":" + os.getenv('FLASK_RUN_PORT') + "/machinelearning"
+    workers = max(1, int(os.getenv("REGISTER_WORKERS", "4")))
+
+    def create_event_action(data_source):
+        """ Creates the event action of a data source. Returns the error, or None """
+        event_action = deep_lynx.CreateEventActionRequest(data_source.container_id, data_source.id,
+                                                          "file_created", "send_data", None, destination,
+                                                          os.getenv("DATA_SOURCE_ID"), True)
+        try:
+            result = deep_lynx_client.call(deep_lynx_client.events.create_event_action, event_action, idempotent=False)
+        except Exception as e:
+            return repr(e)
+        return result.error if result.is_error else None
 
     # Register events for listening from other data sources
     while registered == False and iterations > 0:
-        # Get a list of data sources and validate that no error occurred
-        datasource_api = deep_lynx.DataSourcesApi(api_client)
-        data_sources = datasource_api.list_data_sources(os.getenv("CONTAINER_ID"))
-
-        if data_sources.is_error == False and len(data_sources.value) > 0:
-            #data_sources = data_sources.to_dict()["value"]
-            for data_source in data_sources.value:
-                # If the data source is found, create a registered event
-                if data_source.name in data_ingested_adapters:
-
-                    events_api = deep_lynx.EventsApi(api_client)
-
-                    # verify that this event action does not already exist
-                    # by comparing to the established event action we would like to create
-
-                    event_action = deep_lynx.CreateEventActionRequest(
-                        data_source.container_id, data_source.id, "file_created", "send_data", None, "http://" +
-                        os.getenv('FLASK_RUN_HOST') + ":" + os.getenv('FLASK_RUN_PORT') + "/machinelearning",
-                        os.getenv("DATA_SOURCE_ID"), True)
-
-                    actions = events_api.list_event_actions()
-                    for action in actions.value:
-
-                        # if destination, event_type, and data_source_id match, we know that this
-                        # event action already exists
-                        if action.destination == event_action.destination and action.event_type == event_action.event_type \
-                            and action.data_source_id == event_action.data_source_id:
-                            # this exact event action already exists, remove data source from list
-                            logging.info('Event action on ' + data_source.name + ' already exists')
-                            data_ingested_adapters.remove(data_source.name)
-
-                    # continue event action creation if the same was not already found
+        # Get a list of data sources and validate that no error occurred, until all data sources are found
+        if any(name not in data_sources for name in data_ingested_adapters):
+            datasource_api = deep_lynx_client.data_sources
+            listed = deep_lynx_client.call(datasource_api.list_data_sources, os.getenv("CONTAINER_ID"))
+            if listed.is_error == False:
+                for data_source in listed.value:
                     if data_source.name in data_ingested_adapters:
-                        create_action_result = events_api.create_event_action(event_action)
-
-                        if create_action_result.is_error:
-                            logging.warning('Error creating event action: ' + create_action_result.error)
-                        else:
-                            logging.info('Successful creation of event action on ' + data_source.name + ' datasource')
-                            data_ingested_adapters.remove(data_source.name)
-
-                    # If all events are registered
-                    if len(data_ingested_adapters) == 0:
-                        registered = True
-                        logging.info('Successful registration on all adapters')
-                        return registered
+                        data_sources.setdefault(data_source.name, data_source)
+
+        found = [data_sources[name] for name in data_ingested_adapters if name in data_sources]
+        actions = deep_lynx_client.call(deep_lynx_client.events.list_event_actions) if found else None
+        if actions is not None and actions.is_error:
+            # Without the existing event actions, the missing ones are not known: creating them could duplicate them
+            logging.warning('Error listing event actions: ' + str(actions.error))
+        elif actions is not None:
+            # Index the existing event actions by destination, event type and data source id
+            existing = set((action.destination, action.event_type, action.data_source_id) for action in actions.value)
+
+            missing = list()
+            for data_source in found:
+                if (destination, "file_created", data_source.id) in existing:
+                    # this exact event action already exists, remove data source from list
+                    logging.info('Event action on ' + data_source.name + ' already exists')
+                    data_ingested_adapters.remove(data_source.name)
+                else:
+                    missing.append(data_source)
+
+            # Create the missing event actions at the same time
+            if missing:
+                with ThreadPoolExecutor(max_workers=min(workers, len(missing)),
+                                        thread_name_prefix="register_thread") as executor:
+                    errors = list(executor.map(create_event_action, missing))
+                for data_source, error in zip(missing, errors):
+                    if error is not None:
+                        logging.warning('Error creating event action on ' + data_source.name + ': ' + str(error))
+                    else:
+                        logging.info('Successful creation of event action on ' + data_source.name + ' datasource')
+                        data_ingested_adapters.remove(data_source.name)
+
+        # If all events are registered
+        if len(data_ingested_adapters) == 0:
+            registered = True
+            logging.info('Successful registration on all adapters')
+        if startup is not None:
+            startup.registration_attempt(registered)
+        if registered:
+            return registered
 
         # If the desired data source and container is not found, repeat
         logging.info(
-            f'Datasource(s) {", ".join(data_ingested_adapters)} not found. Next event registration attempt in {os.getenv("REGISTER_WAIT_SECONDS")} seconds.'
+            f'Datasource(s) {", ".join(data_ingested_adapters)} not registered. Next event registration attempt in {os.getenv("REGISTER_WAIT_SECONDS")} seconds.'
         )
         time.sleep(float(os.getenv('REGISTER_WAIT_SECONDS')))
         iterations -= 1
@@ -219,41 +428,34 @@ def register_for_event(api_client: deep_lynx.ApiClient, iterations=30):
 
 def deep_lynx_init():
     """ 
-    Returns the container id, data source id, and api client for use with the DeepLynx SDK.
-    Assumes token authentication. 
+    Returns the container id, data source id, and Deep Lynx client for use with the DeepLynx SDK.
+    Assumes token authentication. The token is refreshed by the client before it expires
 
     Args
         None
     Return
-        container_id (str), data_source_id (str), api_client (ApiClient)
+        container_id (str), data_source_id (str), deep_lynx_client (Deep_Lynx_Client)
     """
-    # initialize an ApiClient for use with deep_lynx APIs
-    configuration = deep_lynx.configuration.Configuration()
-    configuration.host = os.getenv('DEEP_LYNX_URL')
-    api_client = deep_lynx.ApiClient(configuration)
+    import deep_lynx
+
+    # initialize the Deep Lynx client shared by the threads of the adapter
+    deep_lynx_client = create_deep_lynx_client()
 
     # perform API token authentication only if values are provided
     if os.getenv('DEEP_LYNX_API_KEY') != '' and os.getenv('DEEP_LYNX_API_KEY') is not None:
 
         # authenticate via an API key and secret
-        auth_api = deep_lynx.AuthenticationApi(api_client)
-
         try:
-            token = auth_api.retrieve_o_auth_token(x_api_key=os.getenv('DEEP_LYNX_API_KEY'),
-                                                   x_api_secret=os.getenv('DEEP_LYNX_API_SECRET'),
-                                                   x_api_expiry='12h')
+            deep_lynx_client.authenticate()
         except TypeError:
             print("ERROR: Cannot connect to DeepLynx.")
             logging.error("Cannot connect to DeepLynx.")
             return '', '', None
 
-        # update header
-        api_client.set_default_header('Authorization', 'Bearer {}'.format(token))
-
     # get container ID
     container_id = None
-    container_api = deep_lynx.ContainersApi(api_client)
-    containers = container_api.list_containers()
+    container_api = deep_lynx_client.containers
+    containers = deep_lynx_client.call(container_api.list_containers)
     for container in containers.value:
         if container.name == os.getenv('CONTAINER_NAME'):
             container_id = container.id
@@ -265,15 +467,18 @@ def deep_lynx_init():
 
     # get data source ID, create if necessary
     data_source_id = None
-    datasources_api = deep_lynx.DataSourcesApi(api_client)
+    datasources_api = deep_lynx_client.data_sources
 
-    datasources = datasources_api.list_data_sources(container_id)
+    datasources = deep_lynx_client.call(datasources_api.list_data_sources, container_id)
     for datasource in datasources.value:
         if datasource.name == os.getenv('DATA_SOURCE_NAME'):
             data_source_id = datasource.id
     if data_source_id is None:
-        datasource = datasources_api.create_data_source(
-            deep_lynx.CreateDataSourceRequest(os.getenv('DATA_SOURCE_NAME'), 'standard', True), container_id)
+        datasource = deep_lynx_client.call(datasources_api.create_data_source,
+                                           deep_lynx.CreateDataSourceRequest(os.getenv('DATA_SOURCE_NAME'), 'standard',
+                                                                             True),
+                                           container_id,
+                                           idempotent=False)
         data_source_id = datasource.value.id
 
-    return container_id, data_source_id, api_client
+    return container_id, data_source_id, deep_lynx_client
@@ -0,0 +1,215 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import re
+import time
+import random
+import logging
+import threading
+import urllib3
+
+# Repository Modules
+import utils
+
+# HTTP status codes of errors that are worth retrying
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+# HTTP status codes of requests that the server did not process, retried even if the request is not idempotent
+UNPROCESSED_STATUSES = (429, 503)
+# Seconds of each unit of a token expiry e.g. 12h
+EXPIRY_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_expiry(expiry: str):
+    """
+    Returns the number of seconds of a token expiry
+    Args
+        expiry (string): the expiry passed to retrieve_o_auth_token e.g. 12h, 30m
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', str(expiry))
+    if match is None:
+        error = 'Invalid token expiry: \'{0}\'. Provide a number of seconds, minutes, hours or days e.g. 12h'.format(
+            expiry)
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    return float(match.group(1)) * EXPIRY_UNITS[match.group(2) or 's']
+
+
+class Deep_Lynx_Client():
+    """
+    A single Deep Lynx client shared by the threads of the adapter
+
+        1. One deep_lynx.ApiClient, whose pool of keep-alive HTTP connections holds a connection per concurrent caller
+        2. The Deep Lynx APIs e.g. DataSourcesApi are created once
+        3. Transient errors (connection errors, 408, 429, 5xx) are retried with exponential backoff and full jitter
+        4. The OAuth token is refreshed before it expires, and after a 401 response
+
+    Args
+        host (string): the url of Deep Lynx
+        pool_size (integer): the maximum number of HTTP connections kept open to Deep Lynx
+        api_key (string): the API key. No authentication if empty
+        api_secret (string): the API secret
+        token_expiry (string): the expiry of OAuth tokens e.g. 12h
+        retries (integer): the number of times a failed request is retried
+        backoff_seconds (float): the maximum wait before the first retry, doubled for each next retry
+        max_backoff_seconds (float): the maximum wait before a retry
+    """
+
+    def __init__(self,
+                 host: str,
+                 pool_size: int,
+                 api_key: str = None,
+                 api_secret: str = None,
+                 token_expiry: str = '12h',
+                 retries: int = 3,
+                 backoff_seconds: float = 0.5,
+                 max_backoff_seconds: float = 30):
+        # The Deep Lynx SDK is imported by the first client, so that the adapter can serve before it is loaded
+        import deep_lynx
+
+        configuration = deep_lynx.configuration.Configuration()
+        configuration.host = host
+        configuration.connection_pool_maxsize = max(1, pool_size)
+        self.api_client = deep_lynx.ApiClient(configuration)
+        self.api_client.set_default_header('Connection', 'keep-alive')
+        # Errors are retried with backoff by call, instead of immediately by urllib3
+        no_retries = urllib3.util.Retry(connect=0, read=0, status=0, other=0, redirect=3)
+        self.api_client.rest_client.pool_manager.connection_pool_kw['retries'] = no_retries
+
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.token_expiry = token_expiry
+        self.token_seconds = parse_expiry(token_expiry)
+        # The token is refreshed when a tenth of its lifetime is left, at most 10 minutes before it expires
+        self.refresh_margin = min(self.token_seconds / 10, 600)
+        self.token_expires = None
+        self.token_lock = threading.Lock()
+
+        self.retries = max(0, retries)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self.authentication = deep_lynx.AuthenticationApi(self.api_client)
+        self.containers = deep_lynx.ContainersApi(self.api_client)
+        self.data_sources = deep_lynx.DataSourcesApi(self.api_client)
+        self.events = deep_lynx.EventsApi(self.api_client)
+        self.metatypes = deep_lynx.MetatypesApi(self.api_client)
+
+    def authenticate(self):
+        """
+        Retrieves an OAuth token with the API key and secret and sets it as the Authorization header. Does nothing if no
+        API key is provided
+        """
+        if not self.api_key:
+            return
+        with self.token_lock:
+            self.refresh_token()
+
+    def refresh_token(self):
+        """
+        Retrieves a new OAuth token. Called with the token lock held
+        """
+        token = self.authentication.retrieve_o_auth_token(x_api_key=self.api_key,
+                                                          x_api_secret=self.api_secret,
+                                                          x_api_expiry=self.token_expiry)
+        self.api_client.set_default_header('Authorization', 'Bearer {}'.format(token))
+        self.token_expires = time.monotonic() + self.token_seconds
+        logging.info('Retrieved a Deep Lynx OAuth token')
+
+    def ensure_token(self, expired: bool = False):
+        """
+        Refreshes the OAuth token if it is about to expire
+        Args
+            expired (boolean): True to refresh the token anyway e.g. after a 401 response
+        """
+        if not self.api_key:
+            return
+        token_expires = self.token_expires
+        if not expired and token_expires is not None and time.monotonic() < token_expires - self.refresh_margin:
+            return
+        with self.token_lock:
+            # Another thread may have refreshed the token while this thread waited for the lock
+            if self.token_expires == token_expires:
+                self.refresh_token()
+
+    def backoff(self, attempt: int):
+        """
+        Returns the number of seconds to wait before a retry: a random duration up to the exponential backoff
+        Args
+            attempt (integer): the number of failed attempts, from 1
+        """
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2**(attempt - 1)))
+
+    @staticmethod
+    def is_transient(error: Exception, idempotent: bool = True):
+        """
+        Returns True if a failed request may succeed when retried
+        Args
+            error (Exception): the error raised by the request
+            idempotent (boolean): False if retrying a request that reached the server may repeat its effect
+        """
+        from deep_lynx.rest import ApiException
+
+        if isinstance(error, ApiException):
+            # Status 0 is an SSL error raised before the request is sent
+            if error.status in UNPROCESSED_STATUSES or error.status == 0:
+                return True
+            return idempotent and error.status in TRANSIENT_STATUSES
+        if isinstance(error, urllib3.exceptions.MaxRetryError):
+            error = error.reason
+        if isinstance(error, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError)):
+            return True
+        return idempotent and isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError))
+
+    def call(self, function, *args, idempotent: bool = True, **kwargs):
+        """
+        Calls a Deep Lynx API method, refreshing the OAuth token and retrying transient errors
+
+        Example
+            client.call(client.data_sources.retrieve_file, container_id, file_id)
+        Args
+            function (function): the API method e.g. client.data_sources.retrieve_file
+            idempotent (boolean): False for requests that must not be repeated once processed e.g. uploads. They are
+                only retried if the server did not process them
+            *args, **kwargs: the arguments of the API method
+        Return
+            result: the result of the API method
+        """
+        from deep_lynx.rest import ApiException
+
+        name = getattr(function, '__name__', str(function))
+        metrics = utils.get_metrics()
+        expired = False
+        attempt = 0
+        while True:
+            self.ensure_token(expired)
+            try:
+                with metrics.timer("deep_lynx_request", request=name):
+                    return function(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                expired = isinstance(e, ApiException) and e.status == 401 and bool(self.api_key)
+                if attempt > self.retries or not (expired or self.is_transient(e, idempotent)):
+                    raise
+                delay = 0 if expired else self.backoff(attempt)
+                metrics.increment("ml_adapter_deep_lynx_retries_total", request=name)
+                logging.warning('Deep Lynx request ' + name + ' failed (' + type(e).__name__ + '). Retry ' +
+                                str(attempt) + ' of ' + str(self.retries) + ' in ' + str(round(delay, 3)) + ' seconds')
+                time.sleep(delay)
+
+
+def create_deep_lynx_client():
+    """
+    Creates the Deep Lynx client from the environment variables. The connection pool holds a connection for each ingest
+    thread (INGEST_WORKERS) and each ML Adapter object importing results (ML_ADAPTER_WORKERS)
+    Return
+        deep_lynx_client (Deep_Lynx_Client): the Deep Lynx client, not yet authenticated
+    """
+    pool_size = int(os.getenv("INGEST_WORKERS", "4")) + int(os.getenv("ML_ADAPTER_WORKERS", "1"))
+    return Deep_Lynx_Client(os.getenv('DEEP_LYNX_URL'),
+                            pool_size,
+                            api_key=os.getenv('DEEP_LYNX_API_KEY'),
+                            api_secret=os.getenv('DEEP_LYNX_API_SECRET'),
+                            token_expiry=os.getenv('DEEP_LYNX_TOKEN_EXPIRY', '12h'),
+                            retries=int(os.getenv('DEEP_LYNX_RETRIES', '3')),
+                            backoff_seconds=float(os.getenv('DEEP_LYNX_BACKOFF_SECONDS', '0.5')))
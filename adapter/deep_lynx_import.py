@@ -9,6 +9,9 @@ import json
 import time
 import adapter
 
+# Repository Modules
+import utils
+
 
 def import_to_deep_lynx(import_file: str):
     """
@@ -17,7 +20,7 @@ def import_to_deep_lynx(import_file: str):
         import_file (string): the file path to import into Deep Lynx
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
@@ -30,7 +33,7 @@ def import_to_deep_lynx(import_file: str):
         if os.path.exists(path):
             logging.info(f'Found {import_file}.')
             # Import data into Deep Lynx
-            data_sources_api = deep_lynx.DataSourcesApi(api_client)
+            data_sources_api = deep_lynx_client.data_sources
             info = upload_file(data_sources_api, import_file)
             logging.info('Success: Run complete. Output data sent.')
             done = True
@@ -64,15 +67,19 @@ def upload_file(data_sources_api: deep_lynx.DataSourcesApi, file_path: str):
         file_path (string): the file path to import into Deep Lynx
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
-    file_return = data_sources_api.upload_file(container_id,
-                                               data_source_id,
-                                               file=file_path,
-                                               metadata=os.getenv("METADATA"),
-                                               async_req=False)
+    utils.get_metrics().increment("ml_adapter_upload_bytes_total", os.path.getsize(file_path))
+    # An upload is only retried if Deep Lynx did not process it, so that the data is not imported twice
+    file_return = deep_lynx_client.call(data_sources_api.upload_file,
+                                        container_id,
+                                        data_source_id,
+                                        file=file_path,
+                                        metadata=os.getenv("METADATA"),
+                                        async_req=False,
+                                        idempotent=False)
     print(file_return)
     if len(file_return["value"]) > 0:
         logging.info("Successfully imported data to deep lynx")
@@ -91,14 +98,16 @@ def create_manual_import(data_sources_api: deep_lynx.DataSourcesApi = None, payl
         payload (list): a list of payloads to import into deep lynx
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
     if data_sources_api and payload:
-        return data_sources_api.create_manual_import(body=payload,
-                                                     container_id=container_id,
-                                                     data_source_id=data_source_id)
+        return deep_lynx_client.call(data_sources_api.create_manual_import,
+                                     body=payload,
+                                     container_id=container_id,
+                                     data_source_id=data_source_id,
+                                     idempotent=False)
 
 
 def generate_payload(data_file):
@@ -125,19 +134,20 @@ def validate_payload(payload: dict):
         is_valid (boolean): whether the payload is valid or not
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
     # Create deep lynx validator object
-    metatypes_api = deep_lynx.MetatypesApi(api_client)
+    metatypes_api = deep_lynx_client.metatypes
     is_valid = True
     for metatype, nodes in payload.items():
+        # assumes the first return is the desired metatype
+        metatype_id = deep_lynx_client.call(metatypes_api.list_metatypes, container_id, name=metatype)[0].id
         for node in nodes:
             # For each node, validate the its properies
-            # assumes the first return is the desired metatype
-            metatype_id = metatypes_api.list_metatypes(container_id, name=metatype)[0].id
-            json_error = metatypes_api.validate_metatype_properties(container_id, metatype_id, node)
+            json_error = deep_lynx_client.call(metatypes_api.validate_metatype_properties, container_id, metatype_id,
+                                               node)
             json_error = json.loads(json_error)
             if json_error["isError"]:
                 for error in json_error["error"]:
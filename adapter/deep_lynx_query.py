@@ -1,52 +1,176 @@
 # Copyright 2021, Battelle Energy Alliance, LLC
 
 # Python Packages
+import io
 import os
+import time
+import logging
+from collections import deque
 import pandas as pd
 import deep_lynx
 import adapter
-import pandas as pd
 
 # Repository Modules
 import settings
+import utils
+from .ring_buffer import create_queue_buffer
 
 
 def query_deep_lynx(file_id: str):
     """
-    Retrieve data from Deep Lynx
+    Retrieve data from Deep Lynx. The data is added to the queue by the ingest pool with the data of the other files of
+    its batch, see queue_batch
+
+    With INGEST_MODE download, the file is streamed from the Deep Lynx API, so that the adapter can run on another host.
+    The stream is parsed in chunks of INGEST_CHUNK_ROWS rows and only the rows that fit in the queue are kept.
+    Otherwise, only the last rows of the file are read from the Deep Lynx file system, see read_tail
     Args
         file_id (string): the id of a file stored in Deep Lynx
+    Return
+        query_df (DataFrame): the last rows of the file that fit in the queue
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
+    rows = int(os.getenv("QUEUE_LENGTH"))
+    chunk_rows = int(os.getenv("INGEST_CHUNK_ROWS", "10000"))
 
     # Retrieve file from Deep Lynx
-    data_sources_api = deep_lynx.DataSourcesApi(api_client)
-    dl_file_path = retrieve_file(data_sources_api, file_id)
+    metrics = utils.get_metrics()
+    data_sources_api = deep_lynx_client.data_sources
+    with metrics.timer("ingest_fetch"):
+        if os.getenv("INGEST_MODE", "path").strip().lower() == "download":
+            response = download_file(data_sources_api, file_id)
+            try:
+                query_df = read_window(response, rows, chunk_rows)
+            finally:
+                response.release_conn()
+        else:
+            dl_file_path = retrieve_file(data_sources_api, file_id)
+            metrics.increment("ml_adapter_ingest_bytes_total", os.path.getsize(dl_file_path))
+            query_df = read_tail(dl_file_path, rows, chunk_rows)
+    metrics.increment("ml_adapter_ingest_rows_total", query_df.shape[0])
+
+    return query_df
+
+
+def read_window(file, rows: int, chunk_rows: int):
+    """
+    Parses a .csv file in chunks and keeps the last rows only, so that memory does not grow with the size of the file
+    Args
+        file (string or file-like object): the path of the .csv file, or a stream of its content
+        rows (integer): the number of rows to keep e.g. QUEUE_LENGTH
+        chunk_rows (integer): the number of rows parsed at a time
+    Return
+        query_df (DataFrame): the last rows of the file
+    """
+    chunks = deque()
+    kept = 0
+    with pd.read_csv(file, chunksize=max(1, chunk_rows)) as reader:
+        for chunk in reader:
+            chunks.append(chunk)
+            kept += chunk.shape[0]
+            # Drop the oldest chunks once the newer chunks fill the window
+            while len(chunks) > 1 and kept - chunks[0].shape[0] >= rows:
+                kept -= chunks.popleft().shape[0]
+    if len(chunks) == 1:
+        return chunks[0].tail(rows)
+    return pd.concat(chunks, ignore_index=True).tail(rows)
+
+
+def read_tail(file_path: str, rows: int, chunk_rows: int, block_size: int = 1 << 16):
+    """
+    Reads the last rows of a file, so that the cost does not grow with the size of the file
+        * .parquet: only the last row groups are read
+        * .feather, .arrow: only the last record batches are read
+        * .csv: blocks are read backwards from the end of the file until they hold enough lines. A file with quoted
+          fields, which may contain line breaks, is parsed in chunks instead (read_window)
+    Args
+        file_path (string): the path of the file
+        rows (integer): the number of rows to keep e.g. QUEUE_LENGTH
+        chunk_rows (integer): the number of rows parsed at a time by read_window
+        block_size (integer): the number of bytes read at a time from the end of a .csv file
+    Return
+        query_df (DataFrame): the last rows of the file
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.parquet':
+        pyarrow = utils.dataset_io.import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(file_path)
+        groups = list()
+        kept = 0
+        for group in reversed(range(parquet_file.num_row_groups)):
+            if kept >= rows:
+                break
+            groups.insert(0, group)
+            kept += parquet_file.metadata.row_group(group).num_rows
+        return parquet_file.read_row_groups(groups).to_pandas().tail(rows)
+    if extension in ('.feather', '.arrow'):
+        pyarrow = utils.dataset_io.import_pyarrow()
+        with pyarrow.memory_map(file_path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            batches = list()
+            kept = 0
+            for batch in reversed(range(reader.num_record_batches)):
+                if kept >= rows:
+                    break
+                batches.insert(0, reader.get_batch(batch))
+                kept += batches[0].num_rows
+            return pyarrow.Table.from_batches(batches, schema=reader.schema).to_pandas().tail(rows)
 
-    # Write csv to local repository
-    query_df = pd.read_csv(dl_file_path)
-    queue(query_df)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        header_end = f.tell()
+        # Read blocks backwards until they hold rows complete lines, or reach the header
+        end = f.seek(0, os.SEEK_END)
+        # A line break at the end of the file does not start a new row
+        f.seek(max(end - 1, header_end))
+        if f.read(1) == b'\n':
+            end -= 1
+        start = end
+        blocks = deque()
+        lines = 0
+        while start > header_end and lines < rows:
+            size = min(block_size, start - header_end)
+            start -= size
+            f.seek(start)
+            block = f.read(size)
+            blocks.appendleft(block)
+            lines += block.count(b'\n')
+        tail = b''.join(blocks)
+
+    if b'"' in header or b'"' in tail:
+        logging.info('Quoted fields in ' + file_path + '. Parsing the whole file in chunks')
+        return read_window(file_path, rows, chunk_rows)
+    # Drop the partial first line, unless the blocks start right after the header
+    if start > header_end:
+        tail = tail[tail.index(b'\n') + 1:]
+    query_df = pd.read_csv(io.BytesIO(header + tail))
+    if query_df.shape[0] < rows and start > header_end:
+        # Blank lines were counted as rows
+        return read_window(file_path, rows, chunk_rows)
+    return query_df.tail(rows)
 
 
 def download_file(dl_service: deep_lynx.DataSourcesApi, file_id: str):
     """
-    Downloads a file from Deep Lynx
+    Downloads a file from Deep Lynx as a stream
     Args
         dl_service (deep_lynx.DataSourcesApi): deep lynx data source api
         file_id (string): the id of a file
+    Return
+        response (urllib3.HTTPResponse): the unread response, read in chunks. Call release_conn once read
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
-    download_file = dl_service.download_file(container_id, file_id)
-
-    if not download_file.is_error:
-        return download_file
+    # Without preloading, the response body is not read into memory nor written to a temporary file
+    response = deep_lynx_client.call(dl_service.download_file, container_id, file_id, _preload_content=False)
+    response.decode_content = True
+    return response
 
 
 def retrieve_file(data_sources_api: deep_lynx.DataSourcesApi, file_id: str):
@@ -58,11 +182,11 @@ def retrieve_file(data_sources_api: deep_lynx.DataSourcesApi, file_id: str):
         container_id (str): deep lynx container id
     """
     # Get deep lynx environment variables
-    api_client = adapter.api_client
+    deep_lynx_client = adapter.deep_lynx_client
     container_id = os.environ["CONTAINER_ID"]
     data_source_id = os.environ["DATA_SOURCE_ID"]
 
-    retrieve_file = data_sources_api.retrieve_file(container_id, file_id)
+    retrieve_file = deep_lynx_client.call(data_sources_api.retrieve_file, container_id, file_id)
 
     if not retrieve_file.is_error:
         retrieve_file = retrieve_file.to_dict()["value"]
@@ -72,24 +196,65 @@ def retrieve_file(data_sources_api: deep_lynx.DataSourcesApi, file_id: str):
 
 def queue(query_df: pd.DataFrame or pd.Series):
     """
-    Maintains a queue file of a given length via the First In First Out (FIFO) data structure
+    Maintains a queue of a given length via the First In First Out (FIFO) data structure
     Args
         query_df (DataFrame or Series): data to add to the queue
     """
+    queue_batch([query_df])
+
+
+def queue_batch(query_dfs: list):
+    """
+    Adds the data of a batch of files to the queue at once, under one lock and with a single wakeup of the ml_thread
+    Args
+        query_dfs (list): data to add to the queue (DataFrame or Series), from the oldest to the newest
+    """
+    # Data overwritten by newer data of the batch is not copied into the queue
+    capacity = int(os.getenv("QUEUE_LENGTH"))
+    rows = 0
+    for first in reversed(range(len(query_dfs))):
+        if rows >= capacity:
+            query_dfs = query_dfs[first + 1:]
+            break
+        rows += query_dfs[first].shape[0]
+
     # Applies a lock for threading
+    metrics = utils.get_metrics()
+    metrics.set("ml_adapter_ingest_batch_files", len(query_dfs))
+    start = time.time()
+    with adapter.lock_, metrics.timer("queue_commit"):
+        metrics.record("queue_lock_wait", time.time() - start)
+        if adapter.queue_buffer is None:
+            adapter.queue_buffer = create_queue_buffer()
+        # Append query data to the queue, the oldest rows are overwritten once the queue is full
+        for query_df in query_dfs:
+            adapter.queue_buffer.append(query_df)
+        metrics.set("ml_adapter_queue_rows", len(adapter.queue_buffer))
+        # Wake up the ml_thread
+        if rows > 0:
+            if adapter.retrain_scheduler is not None:
+                adapter.retrain_scheduler.record()
+            adapter.new_data = True
+            adapter.new_data_condition.notify_all()
+
+
+def export_queue(file_path: str = None):
+    """
+    Writes the current queue to a .csv file
+    Args
+        file_path (string): the file path of the .csv file. Defaults to the QUEUE_FILE_NAME environment variable
+    Return
+        file_path (string): the file path of the .csv file
+    """
+    if file_path is None:
+        file_path = os.getenv("QUEUE_FILE_NAME")
+    utils.validate_extension('.csv', file_path)
     with adapter.lock_:
-        if os.path.exists(os.getenv("QUEUE_FILE_NAME")):
-            # Read master queue file
-            queue_df = pd.read_csv(os.getenv("QUEUE_FILE_NAME"))
-            # Append query file to queue
-            queue_df = queue_df.append(query_df, ignore_index=True)
-        else:
-            # If queue file does not exist
-            queue_df = query_df
-        new_queue_length = queue_df.shape[0]
-        # Keep queue at given length
-        if new_queue_length > int(os.getenv("QUEUE_LENGTH")):
-            subtract_length = new_queue_length - int(os.getenv("QUEUE_LENGTH"))
-            queue_df.drop([i for i in range(subtract_length)], axis=0, inplace=True)
-        # Write queue to csv
-        queue_df.to_csv(os.getenv("QUEUE_FILE_NAME"), index=False)
+        if adapter.queue_buffer is None:
+            adapter.queue_buffer = create_queue_buffer()
+        queue_df = adapter.queue_buffer.snapshot()
+    path = os.path.split(os.path.abspath(file_path))
+    if not os.path.exists(path[0]):
+        os.makedirs(path[0])
+    queue_df.to_csv(file_path, index=False)
+    return file_path
@@ -0,0 +1,193 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Ingest_Pool():
+    """
+    A bounded queue of received events, coalesced into batches that are retrieved concurrently
+
+        1. The /machinelearning endpoint submits the file id of an event and returns immediately
+        2. The batcher thread waits for the first event, then collects events until max_delay seconds have passed or
+           max_batch events are collected. Repeated file ids of a batch are retrieved once
+        3. The files of a batch are retrieved at the same time by the ingest threads e.g. query_deep_lynx
+        4. The retrieved data is committed to the queue at once, in the order the events were received, e.g. queue_batch
+        5. The queue depth, the batch sizes and the latency of each event are recorded for the /ingest endpoint
+
+    Args
+        target (function): the function called with the file id of each event, which returns its data
+        commit (function): the function called with the list of data retrieved for a batch
+        workers (integer): the number of ingest threads
+        max_queue_size (integer): the maximum number of events waiting for an ingest thread
+        max_delay (float): the maximum number of seconds an event waits for other events of its batch
+        max_batch (integer): the maximum number of events of a batch
+    """
+
+    def __init__(self, target, commit, workers: int, max_queue_size: int, max_delay: float = 0.5, max_batch: int = 50):
+        self.target = target
+        self.commit = commit
+        self.workers = workers
+        self.max_delay = max(0.0, max_delay)
+        self.max_batch = max(1, max_batch)
+        self.events = queue.Queue(maxsize=max_queue_size)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest_thread")
+        self.threads = list()
+
+        # Statistics
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_wait = 0.0
+
+        # Daemon: a daemon thread will shut down immediately when the program exits
+        thread = threading.Thread(target=self.work, daemon=True, name="ingest_batcher")
+        self.threads.append(thread)
+        thread.start()
+
+    def submit(self, file_id: str):
+        """
+        Adds an event to the queue without blocking
+        Args
+            file_id (string): the id of a file stored in Deep Lynx
+        Return
+            accepted (boolean): False if the queue is full
+        """
+        try:
+            self.events.put_nowait((file_id, time.time()))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            logging.warning('Ingest queue is full. Rejected event with file id ' + str(file_id))
+            return False
+        with self.lock:
+            self.received += 1
+        return True
+
+    def next_batch(self):
+        """
+        Waits for the next batch of events
+        Return
+            batch (dictionary): the time each file id of the batch was first received, in the order received
+            events (integer): the number of events of the batch, including repeated file ids
+        """
+        file_id, received_time = self.events.get()
+        batch = {file_id: received_time}
+        events = 1
+        deadline = time.monotonic() + self.max_delay
+        while events < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                file_id, received_time = self.events.get(timeout=timeout) if timeout > 0 else self.events.get_nowait()
+            except queue.Empty:
+                break
+            batch.setdefault(file_id, received_time)
+            events += 1
+        return batch, events
+
+    def work(self):
+        """
+        Retrieves the files of each batch of events and commits their data
+        """
+        while True:
+            batch, events = self.next_batch()
+            start = time.time()
+            futures = [(file_id, self.executor.submit(self.target, file_id)) for file_id in batch]
+            results = list()
+            failed = 0
+            for file_id, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception:
+                    failed += 1
+                    logging.exception('Ingest of file id ' + str(file_id) + ' failed')
+            try:
+                if results:
+                    self.commit(results)
+            except Exception:
+                failed = len(batch)
+                logging.exception('Commit of ' + str(len(results)) + ' ingested files failed')
+            finally:
+                end = time.time()
+                latencies = [end - received_time for received_time in batch.values()]
+                with self.lock:
+                    self.processed += len(batch)
+                    self.failed += failed
+                    self.deduplicated += events - len(batch)
+                    self.batches += 1
+                    self.last_batch_size = len(batch)
+                    self.max_batch_size = max(self.max_batch_size, len(batch))
+                    self.last_latency = max(latencies)
+                    self.total_latency += sum(latencies)
+                    self.max_latency = max(self.max_latency, self.last_latency)
+                    self.total_wait += sum(start - received_time for received_time in batch.values())
+                logging.info('Ingested ' + str(len(batch)) + ' file ids of ' + str(events) + ' events in ' +
+                             str(round(end - start, 3)) + ' seconds (' + str(round(max(latencies), 3)) +
+                             ' seconds since received)')
+                for i in range(events):
+                    self.events.task_done()
+
+    def status(self):
+        """
+        Returns the queue depth, batch sizes and latency statistics of the ingest threads
+        Return
+            status (dictionary): e.g. {"queue_depth": 0, "processed": 10, "latency": {"mean": 0.5}}
+        """
+        with self.lock:
+            processed = max(self.processed, 1)
+            return {
+                "workers": self.workers,
+                "queue_depth": self.events.qsize(),
+                "max_queue_size": self.events.maxsize,
+                "received": self.received,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "deduplicated": self.deduplicated,
+                "batches": {
+                    "count": self.batches,
+                    "last_size": self.last_batch_size,
+                    "mean_size": self.processed / max(self.batches, 1),
+                    "max_size": self.max_batch_size,
+                    "max_delay": self.max_delay,
+                    "max_batch": self.max_batch
+                },
+                "latency": {
+                    "last": self.last_latency,
+                    "mean": self.total_latency / processed,
+                    "max": self.max_latency,
+                    "mean_queue_wait": self.total_wait / processed
+                }
+            }
+
+
+def create_ingest_pool(target, commit):
+    """
+    Creates the ingest threads from the INGEST_WORKERS, INGEST_QUEUE_SIZE, INGEST_BATCH_DELAY_SECONDS and
+    INGEST_MAX_BATCH environment variables
+    Args
+        target (function): the function called with the file id of each event, which returns its data e.g.
+            query_deep_lynx
+        commit (function): the function called with the list of data retrieved for a batch e.g. queue_batch
+    Return
+        ingest_pool (Ingest_Pool): the started ingest threads
+    """
+    workers = int(os.getenv("INGEST_WORKERS", "4"))
+    max_queue_size = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+    max_delay = float(os.getenv("INGEST_BATCH_DELAY_SECONDS", "0.5"))
+    max_batch = int(os.getenv("INGEST_MAX_BATCH", "50"))
+    return Ingest_Pool(target, commit, workers, max_queue_size, max_delay, max_batch)
@@ -5,15 +5,25 @@ import os
 import json
 import pandas as pd
 import time
+import shutil
+import inspect
+import logging
+import numpy as np
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Repository Modules
 import utils
 import model
+import split
+import prediction
 import settings
 
 api_client = None
 
 import adapter
+from .retrain_scheduler import create_retrain_scheduler
 
 
 class ML_Adapter():
@@ -22,28 +32,91 @@ class ML_Adapter():
         1. Generates training and testing sets
         2. Perform variable selection to determine the independent and dependent variables
         3. Create ML_Model objects with different independent and dependent variables
+
+    Each ML Adapter object runs in its own workspace directory data/adapters/<name>, which holds its data (the
+    ML_ADAPTER_OBJECT_LOCATION file of its notebooks), training and testing sets, variable selection file and ML
+    results, so that ML Adapter objects can run at the same time. The training and testing sets are parsed once into a
+    dataset cache, which provides the columns of each model and is released at the end of the cycle
+
+    With a stage cache (STAGE_CACHE_MAX_MB), the split indices and the variable selection file are reused when the
+    queue snapshot, the split method and its parameters, the notebooks and kernels, and the ML Adapter data are the
+    same as in an earlier cycle
+
+    Args
+        name (string): the name of the ML Adapter object in ML_ADAPTER_OBJECTS
+        data (dictionary): the data of the ML Adapter object in ML_ADAPTER_OBJECTS
+        dataset (DataFrame): the queue data. Read from the query file if None
+        query_file_name (string): the file of the queue data in the dataset format. QUERY_FILE_NAME if None
     """
 
-    def __init__(self, name, data):
+    def __init__(self, name, data, dataset=None, query_file_name=None):
         self.name = name
         self.data = data
+        self.dataset = dataset
+        self.query_file_name = query_file_name or os.getenv("QUERY_FILE_NAME")
+        self.workspace = os.path.join("data", "adapters", name)
         self.models = list()
+        self.dataset_cache = model.Dataset_Cache(self.workspace)
+        self.stage_cache = utils.get_stage_cache()
+        # Stage cache key of the training and testing sets, None if they are not cached
+        self.split_key = None
+        # Seconds spent in each step e.g. {"split": 1.2, "variable_selection": 3.4, "models": 56.7, "import": 0.8}
+        self.timings = dict()
+
+        os.makedirs(self.workspace, exist_ok=True)
+        self.file_path = self.write_ml_adapter_object_location_to_file()
+        # Environment variables of the notebooks of this ML Adapter object
+        self.env = {"ML_ADAPTER_OBJECT_LOCATION": self.file_path}
+        try:
+            self.timed("split", self.generate_training_testing_sets, self.data["SPLIT_METHOD"])
+            self.timed("variable_selection", self.variable_selection)
+            self.create_models()
+        finally:
+            self.dataset_cache.release()
+            self.remove_workspace_files()
+
+    def timed(self, step: str, function, *args):
+        """
+        Calls a function and records its duration in the timings of the ML Adapter object and in the metrics
+        Args
+            step (string): the name of the step e.g. split
+            function (function): the function to call
+        """
+        start = time.time()
+        error = True
+        try:
+            result = function(*args)
+            error = False
+            return result
+        finally:
+            self.timings[step] = time.time() - start
+            utils.get_metrics().record(step, self.timings[step], error, adapter=self.name)
 
-        self.write_ml_adapter_object_location_to_file()
-        self.generate_training_testing_sets(self.data["SPLIT_METHOD"])
-        self.variable_selection()
-        self.create_models()
+    def workspace_file(self, file_path: str):
+        """
+        Returns the path of a file in the workspace
+        Args
+            file_path (string): the path of the file outside of the workspace e.g. data/variable_selection.json
+        """
+        return os.path.join(self.workspace, os.path.basename(file_path))
 
     def write_ml_adapter_object_location_to_file(self):
         """
-        Writes the data for the ML_Adapter object to a JSON file
+        Writes the data for the ML_Adapter object to a JSON file in the workspace. The WORKSPACE key is the workspace
+        directory, and the output files of VARIABLE_SELECTION and MODEL are in the workspace
 
         Note: equivalent to a single JSON object in ML_ADAPTER_OBJECTS environment variable located in the .env file
+        Return
+            file_path (string): the path of the JSON file
         """
-        self.data["DATASET"] = os.getenv("QUERY_FILE_NAME")
-        self.data["MODEL"]["output_file"] = os.getenv("IMPORT_FILE_NAME")
+        self.data["DATASET"] = self.query_file_name
+        self.data["WORKSPACE"] = self.workspace
+        self.data["VARIABLE_SELECTION"]["output_file"] = self.workspace_file(
+            self.data["VARIABLE_SELECTION"]["output_file"])
+        file_name = os.path.splitext(os.path.basename(self.query_file_name))[0]
+        self.data["MODEL"]["output_file"] = self.workspace_file("ML_" + file_name + ".csv")
         # Validate path exists
-        file_path = os.path.abspath(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
+        file_path = os.path.abspath(self.workspace_file(os.getenv("ML_ADAPTER_OBJECT_LOCATION")))
         utils.validate_extension('.json', file_path)
         path = os.path.split(file_path)
         utils.validate_paths_exist(path[0])
@@ -51,16 +124,45 @@ class ML_Adapter():
         # Write dictionary to JSON file
         with open(file_path, 'w') as fp:
             json.dump(self.data, fp)
+        return file_path
 
     def generate_training_testing_sets(self, type: str):
         """
         Generates the the training and testing sets from the dataset
+
+        Split methods registered in the split package run in-process on the dataset. Other split methods, or any
+        split method when SPLIT_NOTEBOOK is true, run the Jupyter Notebook split/<type>.ipynb, which writes the
+        training and testing sets to the WORKSPACE directory
         Args
             type (string): the type of split method e.g. none, random, hierarchical_clustering, kennard_stone, sequential
         """
-        if type == "none":
-            dataset = pd.read_csv(os.getenv("QUERY_FILE_NAME"))
-            dataset.to_csv("data/training_set.csv")
+        params = json.loads(os.getenv("SPLIT")).get(type)
+        if type in split.SPLIT_METHODS and not self.data.get("SPLIT_NOTEBOOK", False):
+            dataset = self.dataset
+            if dataset is None:
+                dataset = utils.read_dataset(self.query_file_name)
+            key = self.stage_cache_key("split", type, params,
+                                       utils.Stage_Cache.hash_file(inspect.getsourcefile(split.SPLIT_METHODS[type])))
+            indices = dict()
+
+            def read_indices(directory):
+                with np.load(os.path.join(directory, "split_indices.npz")) as npz:
+                    indices.update(npz)
+
+            hit = self.stage_cache.get(key, read_indices) if key else False
+            if hit:
+                print(self.name + ": Split from stage cache")
+                train_index, test_index = indices["train_index"], indices["test_index"]
+            else:
+                train_index, test_index = split.split_dataset(type, dataset, params)
+
+            # Write the training and testing sets to files
+            utils.write_dataset(dataset.iloc[train_index], utils.dataset_file("training_set", self.workspace))
+            utils.write_dataset(dataset.iloc[test_index], utils.dataset_file("testing_set", self.workspace))
+            if key and not hit:
+                indices = {"train_index": train_index, "test_index": test_index}
+                self.stage_cache_put(
+                    key, lambda directory: np.savez(os.path.join(directory, "split_indices.npz"), **indices))
         else:
             # Determine name of split file
             file = ".".join([type, "ipynb"])
@@ -71,10 +173,30 @@ class ML_Adapter():
             utils.validate_extension('.ipynb', file_path)
 
             # Run Jupyter Notebook
-            if type == "random" or type == "hierarchical_clustering" or type == "sequential":
-                utils.run_jupyter_notebook(file_path, 'python3')
-            elif type == "kennard_stone":
-                utils.run_jupyter_notebook(file_path, 'ir')
+            if type == "kennard_stone":
+                kernel = self.data.get("SPLIT_KERNEL", "ir")
+            else:
+                kernel = self.data.get("SPLIT_KERNEL", "python3")
+
+            # The notebook writes the training and testing sets, which are cached as files
+            files = [utils.dataset_file(name, self.workspace) for name in ["training_set", "testing_set"]]
+            key = self.stage_cache_key("split_notebook", type, params, utils.Stage_Cache.hash_file(file_path), kernel)
+
+            def read_files(directory):
+                for file in files:
+                    shutil.copyfile(os.path.join(directory, os.path.basename(file)), file)
+
+            hit = self.stage_cache.get(key, read_files) if key else False
+            if hit:
+                print(self.name + ": Split from stage cache")
+            else:
+                labels = {"adapter": self.name, "stage": "split"}
+                utils.run_jupyter_notebook(file_path, kernel, env=self.env, labels=labels)
+                if key:
+                    self.stage_cache_put(
+                        key, lambda directory:
+                        [shutil.copyfile(file, os.path.join(directory, os.path.basename(file))) for file in files])
+        self.split_key = key
 
     def variable_selection(self):
         """
@@ -84,9 +206,59 @@ class ML_Adapter():
         utils.validate_extension('.ipynb', file_path)
         utils.validate_paths_exist(file_path)
         kernel = self.data["VARIABLE_SELECTION"]["kernel"]
+        output_file = self.data["VARIABLE_SELECTION"]["output_file"]
+
+        # The variable selection depends on the training and testing sets, the notebook and the ML Adapter data
+        key = None
+        if self.split_key:
+            key = self.stage_cache.key("variable_selection", self.split_key, utils.Stage_Cache.hash_file(file_path),
+                                       kernel, json.dumps(self.data, sort_keys=True))
+        hit = self.stage_cache.get(
+            key, lambda directory: shutil.copyfile(os.path.join(directory, "variable_selection.json"), output_file)
+        ) if key else False
+        if hit:
+            print(self.name + ": Variable selection from stage cache")
+            return
 
         # Run Jupyter Notebook
-        utils.run_jupyter_notebook(file_path, kernel)
+        labels = {"adapter": self.name, "stage": "variable_selection"}
+        utils.run_jupyter_notebook(file_path, kernel, env=self.env, labels=labels)
+        if key and os.path.exists(output_file):
+            self.stage_cache_put(
+                key, lambda directory: shutil.copyfile(output_file, os.path.join(directory, "variable_selection.json")))
+
+    def stage_cache_key(self, stage: str, type: str, params, *sources):
+        """
+        Returns the stage cache key of the training and testing sets, from the queue snapshot, the split method and
+        its parameters, and the source of the split method
+        Args
+            stage (string): split for a split method of the split package, split_notebook for a Jupyter Notebook
+            type (string): the type of split method e.g. random
+            params (dictionary): the parameters of the split method from the SPLIT environment variable
+            *sources (string): the hash of the split method's source, and the kernel of a Jupyter Notebook
+        Return
+            key (string): the key, or None without a stage cache
+        """
+        if self.stage_cache is None:
+            return None
+        if self.dataset is not None:
+            dataset_hash = utils.Stage_Cache.hash_dataset(self.dataset)
+        else:
+            dataset_hash = utils.Stage_Cache.hash_file(self.query_file_name)
+        return self.stage_cache.key(stage, dataset_hash, type, json.dumps(params, sort_keys=True),
+                                    utils.dataset_format(), *sources)
+
+    def stage_cache_put(self, key: str, write):
+        """
+        Adds an entry to the stage cache. A failure to cache is logged, and does not fail the ML Adapter object
+        Args
+            key (string): the key of the entry
+            write (function): the function called with the directory of the entry, which writes the entry's files
+        """
+        try:
+            self.stage_cache.put(key, write)
+        except Exception:
+            logging.getLogger(__name__).exception(self.name + ': could not add stage cache entry ' + key)
 
     def create_models(self):
         """
@@ -102,67 +274,232 @@ class ML_Adapter():
             models = json.load(f)
             f.close()
 
-        # Create list of models
-        for i in range(len(models)):
-            self.models.append(
-                model.ML_Model(independent_variables=models[i]["independent_variables"],
-                               dependent_variables=models[i]["dependent_variables"]))
-            print(self.models)
+        # Create list of models, in worker processes if MODEL_WORKERS is set
+        self.timed("models", self.run_models, model.get_model_pool(), models)
 
         # Import the results to deep lynx
-        print("Begin import to deep lynx")
-        did_succeed = adapter.import_to_deep_lynx(self.data["MODEL"]["output_file"])
-        print("Deep Lynx Import", did_succeed)
+        print(self.name + ": Begin import to deep lynx")
+        if not os.path.exists(self.data["MODEL"]["output_file"]):
+            print(self.name + ": No model results to import")
+            did_succeed = False
+        else:
+            did_succeed = self.timed("import", adapter.import_to_deep_lynx, self.data["MODEL"]["output_file"])
+        print(self.name + ": Deep Lynx Import", did_succeed)
 
         # File clean up
         if did_succeed and os.path.exists(self.data["MODEL"]["output_file"]):
             os.remove(self.data["MODEL"]["output_file"])
-        if did_succeed and os.path.exists(self.data["DATASET"]):
-            os.remove(self.data["DATASET"])
-        if did_succeed and os.path.exists(os.getenv("ML_ADAPTER_OBJECT_LOCATION")):
-            os.remove(os.getenv("ML_ADAPTER_OBJECT_LOCATION"))
-        if os.path.exists("data/training_set.csv"):
-            os.remove("data/training_set.csv")
-        if os.path.exists("data/testing_set.csv"):
-            os.remove("data/testing_set.csv")
+
+    def remove_workspace_files(self):
+        """
+        Removes the data, training and testing sets and variable selection file of the ML Adapter object
+        """
+        for path in [
+                self.file_path, self.data["VARIABLE_SELECTION"]["output_file"],
+                utils.dataset_file("training_set", self.workspace),
+                utils.dataset_file("testing_set", self.workspace)
+        ]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run_models(self, model_pool, models: list):
+        """
+        Runs the models, each model in its own workspace <workspace>/models/<index>, and merges the ML results of the
+        models that succeeded into the MODEL output file
+        Args
+            model_pool (ProcessPoolExecutor): the process pool that trains models, or None to train the models one
+                after another in this process
+            models (list): the independent and dependent variables of each model from the variable selection file
+        """
+        results = list()
+        for i in range(len(models)):
+            workspace = os.path.join(self.workspace, "models", str(i))
+            independent_variables = models[i]["independent_variables"]
+            dependent_variables = models[i]["dependent_variables"]
+            # Columns missing from the datasets are left out of the projections, and reported by the model
+            training_set = self.dataset_cache.get("training_set")
+            columns = [column for column in independent_variables + dependent_variables if column in training_set]
+            training_set = self.dataset_cache.project("training_set", columns)
+            testing_set = self.dataset_cache.project("testing_set", columns)
+            args = (independent_variables, dependent_variables, self.data, workspace, training_set, testing_set)
+            labels = {"adapter": self.name, "model": i}
+            if model_pool is None:
+                results.append(model.run_model(*args, labels=labels))
+            else:
+                results.append(model_pool.submit(model.run_model, *args, labels=labels))
+
+        output_files = list()
+        broken = False
+        metrics = utils.get_metrics()
+        for i, result in enumerate(results):
+            try:
+                output_file, error, timings = result if model_pool is None else result.result()
+            except Exception as e:
+                # The worker process died e.g. it ran out of memory
+                output_file, error, timings = None, repr(e), dict()
+                broken = broken or isinstance(e, BrokenProcessPool)
+            # The models record their timings in the worker processes, so they are recorded here
+            for step, seconds in timings.items():
+                metrics.record(step, seconds, error is not None, adapter=self.name, model=i)
+            metrics.increment("ml_adapter_models_total", adapter=self.name, result="failed" if error else "succeeded")
+            if error is not None:
+                print(self.name, "model", i, "failed:", error)
+            elif os.path.exists(output_file):
+                output_files.append(output_file)
+                self.models.append(models[i])
+                self.register_model(i, models[i])
+            else:
+                print(self.name, "model", i, "did not write", output_file)
+        if broken:
+            model.shutdown_model_pool()
+        print(self.name + ":", len(output_files), "of", len(models), "models succeeded")
+
+        if output_files:
+            self.merge_outputs(output_files, self.data["MODEL"]["output_file"])
+        for output_file in output_files:
+            os.remove(output_file)
+
+    def register_model(self, index: int, variables: dict):
+        """
+        Registers the serialized model of a model that succeeded for the /predict endpoint, which swaps in the new
+        model for the model of the previous cycle. Does nothing without a model_serialization_file
+        Args
+            index (integer): the index of the model in the variable selection file
+            variables (dictionary): the independent and dependent variables of the model
+        """
+        if not self.data["MODEL"].get("model_serialization_file"):
+            return
+        workspace = os.path.join(self.workspace, "models", str(index))
+        serialization_file = os.path.join(workspace, os.path.basename(self.data["MODEL"]["model_serialization_file"]))
+        if not os.path.exists(serialization_file):
+            return
+        standardization_file = None
+        if self.data["MODEL"].get("standardization_file"):
+            standardization_file = os.path.join(workspace, os.path.basename(self.data["MODEL"]["standardization_file"]))
+        try:
+            prediction.get_model_registry().register(self.name + "/" + str(index), serialization_file,
+                                                     standardization_file, variables["independent_variables"],
+                                                     variables["dependent_variables"])
+        except Exception:
+            logging.getLogger(__name__).exception(self.name + ': could not register model ' + str(index))
+
+    @staticmethod
+    def merge_outputs(output_files: list, file_path: str):
+        """
+        Merges the ML results of several models into a single file. JSON results are merged into a list of JSON objects,
+        other results are concatenated as .csv files
+        Args
+            output_files (list): the ML results of each model
+            file_path (string): the path of the merged ML results
+        """
+        if os.path.splitext(file_path)[1] == '.json':
+            results = list()
+            for output_file in output_files:
+                with open(output_file) as f:
+                    result = json.load(f)
+                if isinstance(result, list):
+                    results.extend(result)
+                else:
+                    results.append(result)
+            with open(file_path, 'w') as f:
+                json.dump(results, f)
+        else:
+            pd.concat([pd.read_csv(output_file) for output_file in output_files]).to_csv(file_path, index=False)
+
+
+def run_ml_adapter(name: str, data: dict, dataset: pd.DataFrame, query_file_name: str):
+    """
+    Runs an ML Adapter object, in a thread of the ML Adapter pool. Errors are returned instead of raised, so that a
+    failed ML Adapter object does not affect the other ML Adapter objects
+
+    Args
+        name (string): the name of the ML Adapter object
+        data (dictionary): the data of the ML Adapter object
+        dataset (DataFrame): the queue data
+        query_file_name (string): the file of the queue data in the dataset format
+    Return
+        timings (dictionary): the seconds spent in each step of the ML Adapter object, and in total
+        error (string): the traceback of the error, or None if the ML Adapter object succeeded
+    """
+    start = time.time()
+    ml_adapter = None
+    error = None
+    try:
+        ml_adapter = ML_Adapter(name, data, dataset, query_file_name)
+    except Exception:
+        error = traceback.format_exc()
+        logging.getLogger(__name__).error('ML Adapter object ' + name + ' failed: ' + error)
+    timings = dict(ml_adapter.timings) if ml_adapter is not None else dict()
+    timings["total"] = time.time() - start
+    return timings, error
+
+
+def print_timings(timings: dict):
+    """
+    Prints the seconds spent by each ML Adapter object of a retrain cycle
+    Args
+        timings (dictionary): the timings of each ML Adapter object by name, and the error of the failed ones
+    """
+    for name, (steps, error) in timings.items():
+        steps = ", ".join("{0} {1:.2f}s".format(step, seconds) for step, seconds in steps.items())
+        print("{0}: {1}{2}".format(name, steps, "" if error is None else " (failed)"))
 
 
 def main():
     """
     Main entry point for script
     """
+    # Runs the ML Adapter objects of a retrain cycle at the same time
+    adapter_pool = ThreadPoolExecutor(max_workers=max(1, int(os.getenv("ML_ADAPTER_WORKERS", "1"))),
+                                      thread_name_prefix="ml_adapter")
+    if adapter.retrain_scheduler is None:
+        adapter.retrain_scheduler = create_retrain_scheduler()
+    scheduler = adapter.retrain_scheduler
     while True:
-        if os.path.exists(os.getenv("QUEUE_FILE_NAME")) and adapter.new_data:
-            # Apply a lock
-            with adapter.lock_:
+        # Sleep until the queue is full and the retrain scheduler starts a cycle
+        with adapter.new_data_condition:
+            while True:
+                wait_seconds = scheduler.wait_seconds(adapter.queue_buffer)
+                if wait_seconds == 0:
+                    break
+                adapter.new_data_condition.wait_for(lambda: adapter.new_data, timeout=wait_seconds)
                 adapter.new_data = False
-                # Read master queue file
-                queue_df = pd.read_csv(os.getenv("QUEUE_FILE_NAME"))
-            # Only execute if queue reaches optimal length
-            if queue_df.shape[0] == int(os.getenv("QUEUE_LENGTH")):
-                # TODO: Change to customized name
-                file_name = None
-
-                # File paths for local files
-                query_file_name = "data/" + file_name
-                import_file_name = "data/ML_" + file_name
-
-                #Set environment variables
-                os.environ["QUERY_FILE_NAME"] = query_file_name
-                os.environ["IMPORT_FILE_NAME"] = import_file_name
-
-                # Write csv
-                queue_df.to_csv(query_file_name, index=False)
-
-                # Create ML Adapter objects
-                start = time.time()
-                ml_adapter_objects = json.loads(os.getenv("ML_ADAPTER_OBJECTS"))
-                for ml_adapter in ml_adapter_objects:
-                    name = list(ml_adapter.keys())[0]
-                    data = ml_adapter[name]
-                    ml_adapter = ML_Adapter(name, data)
-                end = time.time()
-                print(end - start)
+            adapter.new_data = False
+            # Copy the current window of the queue
+            queue_df = adapter.queue_buffer.snapshot()
+            scheduler.start(adapter.queue_buffer)
+        try:
+            # File name of the queue snapshot e.g. queue
+            file_name = os.path.splitext(os.path.basename(os.getenv("QUEUE_FILE_NAME")))[0]
+
+            # File path of the queue snapshot in the dataset format, read by every ML Adapter object
+            query_file_name = utils.dataset_file(file_name)
+
+            # Write the queue snapshot e.g. data/queue.csv
+            metrics = utils.get_metrics()
+            metrics.set("ml_adapter_snapshot_rows", queue_df.shape[0])
+            with metrics.timer("snapshot"):
+                utils.write_dataset(queue_df, query_file_name, index=False)
+
+            # Run the ML Adapter objects, each with its own data and workspace
+            start = time.time()
+            ml_adapter_objects = json.loads(os.getenv("ML_ADAPTER_OBJECTS"))
+            futures = dict()
+            for ml_adapter in ml_adapter_objects:
+                name = list(ml_adapter.keys())[0]
+                data = ml_adapter[name]
+                futures[name] = adapter_pool.submit(run_ml_adapter, name, data, queue_df, query_file_name)
+            timings = {name: future.result() for name, future in futures.items()}
+            print_timings(timings)
+            print("Retrain cycle: {0:.2f}s".format(time.time() - start))
+            metrics.record("retrain_cycle",
+                           time.time() - start, any(error is not None for steps, error in timings.values()))
+
+            # File clean up
+            if all(error is None for steps, error in timings.values()) and os.path.exists(query_file_name):
+                os.remove(query_file_name)
+        finally:
+            scheduler.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import time
+import threading
+
+
+class Retrain_Scheduler():
+    """
+    Decides when the ml_thread starts a retrain cycle
+
+        1. No cycle starts before the queue is full (QUEUE_LENGTH rows)
+        2. A cycle starts once every_rows rows were added to the queue since the last cycle, or once interval_seconds
+           have passed since the last cycle and at least one row was added
+        3. Cycles start at least min_gap_seconds apart
+        4. Data added while a cycle is running does not start cycles of its own: the next cycle uses the latest
+           snapshot of the queue
+        5. The number of pending, started and skipped cycles is recorded for the /retrain endpoint
+
+    Args
+        every_rows (integer): the number of new rows that starts a cycle. 1 retrains on every new row
+        interval_seconds (float): the number of seconds after which any new row starts a cycle. 0 to disable
+        min_gap_seconds (float): the minimum number of seconds between the start of two cycles
+    """
+
+    def __init__(self, every_rows: int = 1, interval_seconds: float = 0, min_gap_seconds: float = 0):
+        self.every_rows = max(1, every_rows)
+        self.interval_seconds = max(0.0, interval_seconds)
+        self.min_gap_seconds = max(0.0, min_gap_seconds)
+        self.lock = threading.Lock()
+
+        # State
+        self.running = False
+        # The number of rows added to the queue when the last cycle started
+        self.trained_rows = 0
+        self.last_start = None
+        self.last_duration = 0.0
+        # The number of queue commits since the last cycle started
+        self.pending_commits = 0
+        self.pending_rows = 0
+
+        # Statistics
+        self.commits = 0
+        self.cycles = 0
+        self.skipped = 0
+        self.superseded = 0
+
+    def record(self):
+        """
+        Records data added to the queue e.g. by queue_batch
+        """
+        with self.lock:
+            self.commits += 1
+            self.pending_commits += 1
+            if self.running:
+                self.superseded += 1
+
+    def wait_seconds(self, queue_buffer):
+        """
+        Returns how long to wait before the next cycle
+        Args
+            queue_buffer (Ring_Buffer): the queue
+        Return
+            seconds (float): 0 if a cycle is due, the seconds until the next cycle may be due, or None to wait for data
+        """
+        if queue_buffer is None or queue_buffer.size < queue_buffer.capacity:
+            return None
+        with self.lock:
+            # The queue was cleared
+            if queue_buffer.total_rows < self.trained_rows:
+                self.trained_rows = 0
+            self.pending_rows = queue_buffer.total_rows - self.trained_rows
+            if self.pending_rows <= 0:
+                return None
+
+            now = time.monotonic()
+            since_start = None if self.last_start is None else now - self.last_start
+            if self.pending_rows < self.every_rows:
+                if self.interval_seconds <= 0:
+                    return None
+                if since_start is not None and since_start < self.interval_seconds:
+                    return self.interval_seconds - since_start
+            if since_start is not None and since_start < self.min_gap_seconds:
+                return self.min_gap_seconds - since_start
+            return 0
+
+    def start(self, queue_buffer):
+        """
+        Records the start of a cycle on the current snapshot of the queue
+        Args
+            queue_buffer (Ring_Buffer): the queue
+        """
+        with self.lock:
+            self.running = True
+            self.trained_rows = queue_buffer.total_rows
+            self.last_start = time.monotonic()
+            self.cycles += 1
+            # Commits that did not start a cycle of their own
+            self.skipped += max(0, self.pending_commits - 1)
+            self.pending_commits = 0
+            self.pending_rows = 0
+
+    def finish(self):
+        """
+        Records the end of a cycle
+        """
+        with self.lock:
+            self.running = False
+            self.last_duration = time.monotonic() - self.last_start
+
+    def status(self):
+        """
+        Returns the policy, state and statistics of the scheduler
+        Return
+            status (dictionary): e.g. {"running": False, "cycles": 3, "skipped": 12, "pending": {"rows": 5}}
+        """
+        with self.lock:
+            return {
+                "every_rows": self.every_rows,
+                "interval_seconds": self.interval_seconds,
+                "min_gap_seconds": self.min_gap_seconds,
+                "running": self.running,
+                "commits": self.commits,
+                "cycles": self.cycles,
+                "skipped": self.skipped,
+                "superseded": self.superseded,
+                "pending": {
+                    "commits": self.pending_commits,
+                    "rows": self.pending_rows
+                },
+                "seconds_since_last_start": None if self.last_start is None else time.monotonic() - self.last_start,
+                "last_duration": self.last_duration
+            }
+
+
+def create_retrain_scheduler():
+    """
+    Creates the retrain scheduler from the RETRAIN_EVERY_ROWS, RETRAIN_INTERVAL_SECONDS and RETRAIN_MIN_GAP_SECONDS
+    environment variables
+    Return
+        retrain_scheduler (Retrain_Scheduler): the retrain scheduler
+    """
+    every_rows = int(os.getenv("RETRAIN_EVERY_ROWS", "1"))
+    interval_seconds = float(os.getenv("RETRAIN_INTERVAL_SECONDS", "0"))
+    min_gap_seconds = float(os.getenv("RETRAIN_MIN_GAP_SECONDS", "0"))
+    return Retrain_Scheduler(every_rows, interval_seconds, min_gap_seconds)
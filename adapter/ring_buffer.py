@@ -0,0 +1,192 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+
+class Ring_Buffer():
+    """
+    A fixed capacity First In First Out (FIFO) queue of rows stored as one array per column
+
+        1. Appending a batch writes the rows into the next slots and overwrites the oldest rows, O(batch)
+        2. A snapshot copies the current window (oldest to newest) into a DataFrame, O(window)
+        3. Columns of a fixed width dtype (numbers, booleans, dates) can be memory-mapped to .npy files
+
+    Args
+        capacity (integer): the maximum number of rows kept in the queue e.g. QUEUE_LENGTH
+        directory (string): directory of the memory-mapped column files. If None, the columns are kept in memory
+    """
+
+    def __init__(self, capacity: int, directory: str = None):
+        if capacity <= 0:
+            error = "capacity must be greater than 0, not {0}".format(capacity)
+            raise ValueError(error)
+        self.capacity = capacity
+        self.directory = directory
+        self.columns = list()
+        self.arrays = dict()
+        self.head = 0
+        self.size = 0
+        self.total_rows = 0
+        self.file_count = 0
+
+        if self.directory:
+            # Remove column files left over from a previous run
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+            os.makedirs(self.directory)
+
+    def append(self, query_df: pd.DataFrame or pd.Series):
+        """
+        Appends rows to the queue, dropping the oldest rows once the capacity is reached
+        Args
+            query_df (DataFrame or Series): data to add to the queue
+        """
+        if isinstance(query_df, pd.Series):
+            query_df = query_df.to_frame().T
+        rows = query_df.shape[0]
+        if rows == 0:
+            return
+        self.total_rows += rows
+
+        # Only the last rows of a batch larger than the queue survive
+        if rows > self.capacity:
+            query_df = query_df.iloc[rows - self.capacity:]
+            rows = self.capacity
+
+        for column in query_df.columns:
+            self._add_column(column, query_df[column].dtype)
+
+        # Slots to write: from the head to the end of the arrays, then wrap around to the start
+        first = min(rows, self.capacity - self.head)
+        for column in self.columns:
+            array = self.arrays[column]
+            if column in query_df.columns:
+                values = query_df[column].to_numpy()
+                if not np.can_cast(values.dtype, array.dtype, casting='safe') and array.dtype != object:
+                    array = self._promote(column, np.result_type(values.dtype, array.dtype))
+            else:
+                if array.dtype.kind in 'biu':
+                    array = self._promote(column, np.float64)
+                values = self._missing(array.dtype, rows)
+            array[self.head:self.head + first] = values[:first]
+            array[:rows - first] = values[first:]
+
+        self.head = (self.head + rows) % self.capacity
+        self.size = min(self.size + rows, self.capacity)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current window, ordered from the oldest to the newest row
+        Return
+            queue_df (DataFrame): the rows in the queue
+        """
+        start = (self.head - self.size) % self.capacity
+        window = dict()
+        for column in self.columns:
+            array = self.arrays[column]
+            if start + self.size <= self.capacity:
+                window[column] = np.array(array[start:start + self.size])
+            else:
+                window[column] = np.concatenate((array[start:], array[:self.head]))
+        return pd.DataFrame(window, columns=self.columns)
+
+    def clear(self):
+        """
+        Removes all rows and columns from the queue
+        """
+        self.columns = list()
+        self.arrays = dict()
+        self.head = 0
+        self.size = 0
+        self.total_rows = 0
+        if self.directory and os.path.exists(self.directory):
+            shutil.rmtree(self.directory)
+            os.makedirs(self.directory)
+
+    def __len__(self):
+        return self.size
+
+    def _add_column(self, column: str, dtype: np.dtype):
+        """
+        Creates the array of a column that is not yet in the queue. Rows already in the queue are set to missing
+        Args
+            column (string): the name of the column
+            dtype (dtype): the dtype of the column in the incoming data
+        """
+        if column in self.arrays:
+            return
+        dtype = np.dtype(dtype) if isinstance(dtype, np.dtype) else np.dtype(object)
+        if self.size > 0 and dtype.kind in 'biu':
+            dtype = np.dtype(np.float64)
+        array = self._allocate(dtype)
+        array[:] = self._missing(dtype, self.capacity)
+        self.columns.append(column)
+        self.arrays[column] = array
+
+    def _promote(self, column: str, dtype: np.dtype):
+        """
+        Copies the array of a column to a wider dtype e.g. int64 to float64 when missing values arrive
+        Args
+            column (string): the name of the column
+            dtype (dtype): the new dtype of the column
+        Return
+            array (ndarray): the new array of the column
+        """
+        dtype = np.dtype(dtype)
+        if dtype.kind not in 'biufcmM':
+            dtype = np.dtype(object)
+        logging.info('Queue column ' + str(column) + ' promoted from ' + str(self.arrays[column].dtype) + ' to ' +
+                     str(dtype))
+        array = self._allocate(dtype)
+        array[:] = self.arrays[column].astype(dtype)
+        self.arrays[column] = array
+        return array
+
+    def _allocate(self, dtype: np.dtype):
+        """
+        Allocates a column array with one slot per row of the queue
+        Args
+            dtype (dtype): the dtype of the array
+        Return
+            array (ndarray or memmap): the column array
+        """
+        # Python objects (e.g. strings) cannot be memory-mapped
+        if self.directory and dtype.kind in 'biufcmM':
+            file_path = os.path.join(self.directory, "column_{0}.npy".format(self.file_count))
+            self.file_count += 1
+            return np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=(self.capacity, ))
+        return np.empty(self.capacity, dtype=dtype)
+
+    @staticmethod
+    def _missing(dtype: np.dtype, length: int):
+        """
+        Returns an array of missing values for a dtype
+        Args
+            dtype (dtype): the dtype of the array
+            length (integer): the length of the array
+        """
+        if dtype.kind in 'fc':
+            return np.full(length, np.nan, dtype=dtype)
+        if dtype.kind in 'mM':
+            return np.full(length, np.datetime64('NaT') if dtype.kind == 'M' else np.timedelta64('NaT'), dtype=dtype)
+        # Integer and boolean slots are only unset while the queue is empty
+        if dtype.kind in 'biu':
+            return np.zeros(length, dtype=dtype)
+        return np.full(length, None, dtype=object)
+
+
+def create_queue_buffer():
+    """
+    Creates the queue from the QUEUE_LENGTH and QUEUE_BUFFER_DIRECTORY environment variables
+    Return
+        queue_buffer (Ring_Buffer): an empty queue
+    """
+    directory = os.getenv("QUEUE_BUFFER_DIRECTORY")
+    if directory:
+        directory = os.path.abspath(directory)
+    return Ring_Buffer(int(os.getenv("QUEUE_LENGTH")), directory or None)
@@ -0,0 +1,95 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import time
+import logging
+import threading
+
+# Repository Modules
+import utils
+
+
+class Startup():
+    """
+    The progress of the startup of the adapter, run by the startup thread so that the HTTP server serves at once
+
+        1. importing: the modules of the pipeline e.g. pandas and the Deep Lynx SDK are imported
+        2. connecting: the Deep Lynx client authenticates, and the container and data source are resolved
+        3. starting: the queue, the ingest threads and the ml_thread are created
+        4. registering: event actions are created on the DATA_SOURCES data sources, attempted every
+           REGISTER_WAIT_SECONDS
+        5. ready, or failed if a step raised an error
+
+    The adapter is ready once the pipeline runs, from the registering step on: a received event is ingested. Whether
+    the event actions were created is reported by registered. The seconds of each step are recorded as the
+    startup stage of the metrics
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.step = "importing"
+        self.step_start = time.monotonic()
+        self.steps = dict()
+        self.ready = False
+        self.registered = False
+        self.registration_attempts = 0
+        self.error = None
+
+    def advance(self, step: str):
+        """
+        Finishes the current step and starts the next one
+        Args
+            step (string): the next step e.g. connecting
+        """
+        with self.lock:
+            seconds = time.monotonic() - self.step_start
+            self.steps[self.step] = seconds
+            finished, self.step, self.step_start = self.step, step, time.monotonic()
+            if step in ("registering", "ready"):
+                self.ready = True
+        utils.get_metrics().record("startup", seconds, step=finished)
+        logging.info('Startup: ' + finished + ' took ' + str(round(seconds, 3)) + ' seconds, ' + step)
+
+    def registration_attempt(self, registered: bool):
+        """
+        Records an attempt to register for events
+        Args
+            registered (boolean): whether the event actions of all DATA_SOURCES exist
+        """
+        with self.lock:
+            self.registration_attempts += 1
+            self.registered = registered
+
+    def fail(self, error: Exception):
+        """
+        Finishes the current step with an error. The adapter is not ready
+        Args
+            error (Exception): the error raised by the step
+        """
+        with self.lock:
+            seconds = time.monotonic() - self.step_start
+            self.steps[self.step] = seconds
+            self.error = self.step + ': ' + repr(error)
+            failed, self.step = self.step, "failed"
+            self.ready = False
+        utils.get_metrics().record("startup", seconds, error=True, step=failed)
+        logging.error('Startup failed: ' + self.error)
+
+    def status(self):
+        """
+        Returns the progress of the startup
+        Return
+            status (dictionary): e.g. {"ready": True, "step": "registering", "registered": False,
+                "registration_attempts": 2, "seconds": 61.2, "steps": {"importing": 1.1, "connecting": 0.2}}
+        """
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "step": self.step,
+                "registered": self.registered,
+                "registration_attempts": self.registration_attempts,
+                "error": self.error,
+                "seconds": time.time() - self.started,
+                "steps": dict(self.steps)
+            }
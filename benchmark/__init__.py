@@ -0,0 +1,4 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+from .fake_deep_lynx import Fake_Deep_Lynx
+from .generate_data import generate_dataset, generate_file
@@ -0,0 +1,258 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from flask import Flask, request, Response, json, send_file
+from werkzeug.serving import make_server
+
+
+class Fake_Deep_Lynx():
+    """
+    A local stand-in for the Deep Lynx API, serving the requests made by the adapter so that it can be benchmarked
+    without a Deep Lynx deployment
+
+        1. Containers, data sources and event actions are kept in memory
+        2. Files added with add_file are served in place: retrieve_file returns their path on this host, and
+           download_file streams their content
+        3. Uploaded files (the ML results) are written to the uploads directory
+        4. Every response is delayed by latency_seconds, to emulate a remote Deep Lynx, and the requests are counted by
+           endpoint
+
+    Args
+        directory (string): the directory of the uploaded files
+        container_name (string): the name of the container, see CONTAINER_NAME
+        data_sources (list): the names of the data sources that exist from the start, see DATA_SOURCES
+        latency_seconds (float): the delay added to each response
+    """
+
+    def __init__(self,
+                 directory: str,
+                 container_name: str = "Benchmark",
+                 data_sources: list = None,
+                 latency_seconds: float = 0.0):
+        self.directory = os.path.abspath(directory)
+        self.uploads_directory = os.path.join(self.directory, "uploads")
+        self.latency_seconds = max(0.0, latency_seconds)
+        self.lock = threading.Lock()
+        self.container = {
+            "id": self.new_id(),
+            "name": container_name,
+            "description": "Benchmark container",
+            "created_at": self.now(),
+            "created_by": "benchmark"
+        }
+        self.data_sources = dict()
+        self.event_actions = dict()
+        self.files = dict()
+        self.uploads = list()
+        # Number of requests by endpoint e.g. {"retrieve_file": 10}
+        self.requests = dict()
+        for name in data_sources or list():
+            self.add_data_source(name)
+
+        os.makedirs(self.uploads_directory, exist_ok=True)
+        self.app = self.create_app()
+        self.server = None
+        self.thread = None
+        self.url = None
+
+    @staticmethod
+    def new_id():
+        return str(uuid.uuid4())
+
+    @staticmethod
+    def now():
+        return datetime.now(timezone.utc).isoformat()
+
+    @staticmethod
+    def respond(value, status: int = 200):
+        """
+        Returns a response in the format of the Deep Lynx API e.g. {"value": [...], "isError": false}
+        """
+        body = json.dumps({"value": value, "isError": False})
+        return Response(response=body, status=status, mimetype='application/json')
+
+    def add_data_source(self, name: str, adapter_type: str = "standard"):
+        """
+        Adds a data source to the container
+        Args
+            name (string): the name of the data source
+            adapter_type (string): the type of the data source
+        Return
+            data_source_id (string): the id of the data source
+        """
+        data_source = {
+            "id": self.new_id(),
+            "container_id": self.container["id"],
+            "name": name,
+            "adapter_type": adapter_type,
+            "active": True,
+            "status": "ready",
+            "created_at": self.now(),
+            "created_by": "benchmark"
+        }
+        with self.lock:
+            self.data_sources[data_source["id"]] = data_source
+        return data_source["id"]
+
+    def add_event_action(self, data_source_id: str, destination: str, event_type: str = "file_created"):
+        """
+        Adds an event action, as if it was created before e.g. by another adapter
+        Args
+            data_source_id (string): the id of the data source whose events are sent
+            destination (string): the URL the events are sent to
+            event_type (string): the type of the events
+        Return
+            event_action_id (string): the id of the event action
+        """
+        event_action = {
+            "id": self.new_id(),
+            "container_id": self.container["id"],
+            "data_source_id": data_source_id,
+            "event_type": event_type,
+            "action_type": "send_data",
+            "destination": destination,
+            "active": True,
+            "created_at": self.now(),
+            "created_by": "benchmark"
+        }
+        with self.lock:
+            self.event_actions[event_action["id"]] = event_action
+        return event_action["id"]
+
+    def add_file(self, file_path: str, data_source_id: str = None):
+        """
+        Adds a file to the container, as if a data source imported it. The file is served in place
+        Args
+            file_path (string): the path of the file
+            data_source_id (string): the id of the data source of the file. The first data source if None
+        Return
+            file_id (string): the id of the file, sent in the fileID of file_created events
+        """
+        file_path = os.path.abspath(file_path)
+        with self.lock:
+            if data_source_id is None:
+                data_source_id = next(iter(self.data_sources), "")
+            file_id = self.new_id()
+            self.files[file_id] = {
+                "id": file_id,
+                "container_id": self.container["id"],
+                "data_source_id": data_source_id,
+                "file_name": os.path.basename(file_path),
+                "file_size": os.path.getsize(file_path),
+                # retrieve_file joins the path and the name of the file without a separator
+                "adapter_file_path": os.path.dirname(file_path) + os.sep,
+                "adapter": "filesystem",
+                "created_at": self.now(),
+                "created_by": "benchmark"
+            }
+        return file_id
+
+    def count(self, endpoint: str):
+        """
+        Counts a request and waits for the emulated latency
+        """
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def create_app(self):
+        """
+        Returns the Flask application of the endpoints used by the adapter
+        """
+        app = Flask(__name__)
+
+        @app.route('/oauth/token', methods=['GET'])
+        def retrieve_o_auth_token():
+            self.count("retrieve_o_auth_token")
+            return Response(response=json.dumps("benchmark-token"), status=200, mimetype='application/json')
+
+        @app.route('/containers', methods=['GET'])
+        def list_containers():
+            self.count("list_containers")
+            return self.respond([self.container])
+
+        @app.route('/containers/<container_id>/import/datasources', methods=['GET', 'POST'])
+        def data_sources(container_id):
+            if request.method == 'GET':
+                self.count("list_data_sources")
+                with self.lock:
+                    return self.respond([ds for ds in self.data_sources.values() if ds["container_id"] == container_id])
+            self.count("create_data_source")
+            body = request.get_json(force=True)
+            data_source_id = self.add_data_source(body["name"], body.get("adapter_type") or "standard")
+            return self.respond(self.data_sources[data_source_id])
+
+        @app.route('/containers/<container_id>/files/<file_id>', methods=['GET'])
+        def retrieve_file(container_id, file_id):
+            self.count("retrieve_file")
+            if file_id not in self.files:
+                return Response(response=json.dumps({"isError": True, "error": "file not found"}), status=404)
+            return self.respond(self.files[file_id])
+
+        @app.route('/containers/<container_id>/files/<file_id>/download', methods=['GET'])
+        def download_file(container_id, file_id):
+            self.count("download_file")
+            if file_id not in self.files:
+                return Response(response=json.dumps({"isError": True, "error": "file not found"}), status=404)
+            info = self.files[file_id]
+            return send_file(info["adapter_file_path"] + info["file_name"], mimetype='text/csv')
+
+        @app.route('/containers/<container_id>/import/datasources/<data_source_id>/files', methods=['POST'])
+        def upload_file(container_id, data_source_id):
+            self.count("upload_file")
+            uploaded = list()
+            for field, storage in request.files.items(multi=True):
+                file_id = self.new_id()
+                file_path = os.path.join(self.uploads_directory, file_id + "_" + os.path.basename(storage.filename))
+                storage.save(file_path)
+                uploaded.append({"id": file_id, "file_name": storage.filename, "field": field})
+            with self.lock:
+                self.uploads.extend(uploaded)
+            return self.respond(uploaded)
+
+        @app.route('/event_actions', methods=['GET', 'POST'])
+        def event_actions():
+            if request.method == 'GET':
+                self.count("list_event_actions")
+                with self.lock:
+                    return self.respond(list(self.event_actions.values()))
+            self.count("create_event_action")
+            event_action = dict(request.get_json(force=True))
+            event_action.update({"id": self.new_id(), "created_at": self.now(), "created_by": "benchmark"})
+            with self.lock:
+                self.event_actions[event_action["id"]] = event_action
+            return self.respond(event_action)
+
+        return app
+
+    def start(self, host: str = "127.0.0.1", port: int = 0):
+        """
+        Serves the API in a daemon thread
+        Args
+            host (string): the host to listen on
+            port (integer): the port to listen on. 0 picks a free port
+        Return
+            url (string): the url of the API, see DEEP_LYNX_URL
+        """
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.url = "http://{0}:{1}".format(host, self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="fake_deep_lynx")
+        self.thread.start()
+        logging.info('Fake Deep Lynx listening on ' + self.url)
+        return self.url
+
+    def stop(self):
+        """
+        Stops serving the API
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.server = None
@@ -0,0 +1,118 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+
+# Repository Modules
+import utils
+
+
+def column_names(columns: int):
+    """
+    Returns the names of the independent variables of a generated dataset e.g. x000, x001, ...
+    Args
+        columns (integer): the number of independent variables
+    """
+    width = len(str(max(columns - 1, 0)))
+    return ["x" + str(i).zfill(width) for i in range(columns)]
+
+
+def generate_dataset(rows: int, columns: int, seed: int = 0, noise: float = 0.1, weights: np.ndarray = None):
+    """
+    Generates a wide numeric dataset: columns independent variables drawn from a standard normal distribution and a
+    dependent variable y, a linear combination of the independent variables with noise
+    Args
+        rows (integer): the number of rows
+        columns (integer): the number of independent variables
+        seed (integer): the seed of the random number generator, so that the dataset can be generated again
+        noise (float): the standard deviation of the noise of y
+        weights (ndarray): the weight of each independent variable in y. Drawn from the seed if None
+    Return
+        dataset (DataFrame): the columns x000, x001, ... and y
+    """
+    rng = np.random.default_rng(seed)
+    if weights is None:
+        weights = rng.standard_normal(columns)
+    X = rng.standard_normal((rows, columns))
+    dataset = pd.DataFrame(X, columns=column_names(columns))
+    dataset["y"] = X @ weights + rng.normal(0, noise, rows)
+    return dataset
+
+
+def generate_file(file_path: str, rows: int, columns: int, seed: int = 0, chunk_rows: int = 100000):
+    """
+    Writes a generated dataset to a file, in chunks so that files larger than memory can be generated
+        * .csv: the chunks are appended to the file
+        * .feather, .arrow: each chunk is a record batch
+        * .parquet: each chunk is a row group
+    Args
+        file_path (string): the path of the file
+        rows (integer): the number of rows
+        columns (integer): the number of independent variables
+        seed (integer): the seed of the random number generator
+        chunk_rows (integer): the number of rows generated at a time
+    Return
+        file_path (string): the path of the file
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in ('.csv', '.feather', '.arrow', '.parquet'):
+        error = 'Unknown file extension: \'{0}\'. Choose one of .csv, .feather, .arrow, .parquet'.format(extension)
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    chunk_rows = max(1, chunk_rows)
+    weights = np.random.default_rng(seed).standard_normal(columns)
+
+    # Each chunk is drawn from its own seed with the same weights, so that y depends on x alike in every chunk
+    chunks = (generate_dataset(min(chunk_rows, rows - start), columns, seed + 1 + i, weights=weights)
+              for i, start in enumerate(range(0, rows, chunk_rows)))
+    if extension == '.csv':
+        with open(file_path, 'w', newline='') as f:
+            for chunk in chunks:
+                chunk.to_csv(f, header=f.tell() == 0, index=False)
+        return file_path
+
+    pyarrow = utils.dataset_io.import_pyarrow()
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                if extension == '.parquet':
+                    writer = pyarrow.parquet.ParquetWriter(file_path, table.schema)
+                else:
+                    writer = pyarrow.ipc.new_file(file_path, table.schema)
+            if extension == '.parquet':
+                writer.write_table(table)
+            else:
+                writer.write_table(table, max_chunksize=chunk_rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return file_path
+
+
+def main():
+    """
+    Generates a dataset file from the command line e.g.
+        python -m benchmark.generate_data data/benchmark/wide.csv --rows 100000 --columns 200
+    """
+    parser = argparse.ArgumentParser(description="Generates a wide numeric dataset for benchmarks")
+    parser.add_argument("file_path", help="the file to write: .csv, .feather, .arrow or .parquet")
+    parser.add_argument("--rows", type=int, default=10000, help="the number of rows")
+    parser.add_argument("--columns", type=int, default=20, help="the number of independent variables")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random number generator")
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="the number of rows generated at a time")
+    args = parser.parse_args()
+    generate_file(args.file_path, args.rows, args.columns, args.seed, args.chunk_rows)
+    print("Wrote {0} ({1} rows, {2} columns, {3:.1f} MB)".format(args.file_path, args.rows, args.columns + 1,
+                                                                 os.path.getsize(args.file_path) / 1024 / 1024))
+
+
+if __name__ == "__main__":
+    main()
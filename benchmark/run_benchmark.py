@@ -0,0 +1,522 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import numpy as np
+
+# Repository Modules
+import settings
+import utils
+import split
+import adapter
+from adapter.ml_adapter import ML_Adapter
+from .fake_deep_lynx import Fake_Deep_Lynx
+from .generate_data import generate_dataset, generate_file
+
+SCENARIOS = ("single_event", "event_burst", "large_file", "queue", "split", "many_models", "registration")
+
+# Parameters of the split methods if SPLIT is not set, see .env_sample
+DEFAULT_SPLIT = {
+    "random": {
+        "test_size": 0.2
+    },
+    "hierarchical_clustering": {
+        "N": 1000,
+        "max_clusters": 10,
+        "test_size": 0.2
+    },
+    "kennard_stone": {
+        "N": 40000,
+        "k": 6000
+    },
+    "sequential": {
+        "test_size": {
+            "N": 600,
+            "percent": 0.1
+        }
+    },
+    "none": None
+}
+
+# Environment variables of the adapter that the benchmark reports, so that results can be compared
+REPORTED_ENVIRONMENT = ("INGEST_WORKERS", "INGEST_BATCH_DELAY_SECONDS", "INGEST_MAX_BATCH", "INGEST_CHUNK_ROWS",
+                        "DATASET_FORMAT", "DATASET_MEMORY_MAP", "QUEUE_BUFFER_DIRECTORY", "KERNEL_POOL_SIZE",
+                        "NOTEBOOK_EXECUTION", "MODEL_WORKERS", "STAGE_CACHE_MAX_MB", "REGISTER_WORKERS")
+
+
+def latency_summary(seconds: list):
+    """
+    Returns the mean, median, 95th percentile and maximum of durations
+    Args
+        seconds (list): the durations in seconds
+    """
+    if not seconds:
+        return dict()
+    seconds = np.asarray(seconds, dtype=float)
+    return {
+        "mean": float(seconds.mean()),
+        "p50": float(np.percentile(seconds, 50)),
+        "p95": float(np.percentile(seconds, 95)),
+        "max": float(seconds.max())
+    }
+
+
+def metrics_summary(snapshot: dict):
+    """
+    Returns the count, total and mean seconds of each pipeline stage, and the counters, from a snapshot of the metrics
+    Args
+        snapshot (dictionary): see Metrics.snapshot
+    Return
+        stages (dictionary): e.g. {"deep_lynx_request request=retrieve_file": {"count": 10, "total": 0.1, ...}}
+        counters (dictionary): e.g. {"ml_adapter_ingest_rows_total": 10000}
+    """
+    stages = dict()
+    histogram = snapshot.get("ml_adapter_stage_seconds", {"values": dict()})
+    for labels, value in sorted(histogram["values"].items()):
+        labels = dict(labels)
+        name = " ".join([labels.pop("stage")] + ["{0}={1}".format(*label) for label in sorted(labels.items())])
+        total, count = value["sum"], value["count"]
+        stages[name] = {
+            "count": count,
+            "total": total,
+            "mean": total / count if count else 0.0,
+            "per_second": count / total if total else None
+        }
+    counters = dict()
+    for metric, series in sorted(snapshot.items()):
+        if series["type"] != "counter":
+            continue
+        for labels, value in sorted(series["values"].items()):
+            counters[metric + utils.Metrics.format_labels(labels)] = value
+    return stages, counters
+
+
+def flatten(results: dict, prefix: str = ""):
+    """
+    Returns the numbers of nested results by their path e.g. {"event_burst/rows_per_second": 40000.0}
+    """
+    flat = dict()
+    for key, value in results.items():
+        path = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+class Benchmark():
+    """
+    Runs scripted scenarios against a fake Deep Lynx and reports the throughput and latency of each pipeline stage
+
+        * single_event: one file_created event at a time, from receiving the event to the data in the queue
+        * event_burst: many events at once, coalesced into batches by the ingest threads
+        * large_file: the retrieval of a large file, read from the file system (INGEST_MODE path) and downloaded
+          (INGEST_MODE download)
+        * queue: many small appends to the queue with queue()
+        * split: each split method of the split package on a queue snapshot
+        * many_models: an ML Adapter object whose variable selection creates many models, from the split to the
+          upload of the ML results
+        * registration: the registration for events on many data sources of a container holding many event actions
+
+    The metrics of the adapter (utils.get_metrics) are reset before each scenario, so that each scenario reports the
+    stages it ran
+
+    Args
+        args (Namespace): the command line arguments, see main
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.directory = os.path.abspath(args.directory)
+        self.files_directory = os.path.join(self.directory, "files")
+        self.metrics = utils.get_metrics()
+        self.server = None
+        self.ingest_pool = None
+        self.results = dict()
+
+    def file_path(self, name: str):
+        """
+        Returns the path of a generated file in the format of the --file-format argument
+        """
+        return os.path.join(self.files_directory, name + "." + self.args.file_format)
+
+    def setup(self):
+        """
+        Starts the fake Deep Lynx, sets the environment variables of the adapter, and initializes the Deep Lynx client,
+        the queue and the ingest threads as the Flask application does
+        """
+        os.makedirs(self.files_directory, exist_ok=True)
+        self.server = Fake_Deep_Lynx(os.path.join(self.directory, "deep_lynx"),
+                                     data_sources=["Benchmark"],
+                                     latency_seconds=self.args.latency_ms / 1000)
+        url = self.server.start()
+
+        metadata = os.path.join(self.directory, "metadata.json")
+        with open(metadata, 'w') as f:
+            json.dump(list(), f)
+        os.environ.update({
+            "DEEP_LYNX_URL": url,
+            "DEEP_LYNX_API_KEY": "",
+            "CONTAINER_NAME": "Benchmark",
+            "DATA_SOURCE_NAME": "MLAdapter",
+            "DATA_SOURCES": json.dumps(["Benchmark"]),
+            "FLASK_RUN_HOST": "127.0.0.1",
+            "FLASK_RUN_PORT": "5000",
+            "REGISTER_WAIT_SECONDS": "0",
+            "IMPORT_FILE_WAIT_SECONDS": "1",
+            "QUEUE_LENGTH": str(self.args.rows),
+            "QUEUE_FILE_NAME": os.path.join("data", "benchmark_queue.csv"),
+            "ML_ADAPTER_OBJECT_LOCATION": os.path.join("data", "ml_adapter_object_location.json"),
+            "METADATA": metadata
+        })
+        os.environ.setdefault("SPLIT", json.dumps(DEFAULT_SPLIT))
+
+        container_id, data_source_id, adapter.deep_lynx_client = adapter.deep_lynx_init()
+        adapter.api_client = adapter.deep_lynx_client.api_client
+        os.environ["CONTAINER_ID"] = container_id
+        os.environ["DATA_SOURCE_ID"] = data_source_id
+        if not adapter.register_for_event(adapter.deep_lynx_client, iterations=1):
+            raise RuntimeError('Could not register for events with the fake Deep Lynx')
+        adapter.queue_buffer = adapter.create_queue_buffer()
+        self.ingest_pool = adapter.ingest_pool = adapter.create_ingest_pool(adapter.query_deep_lynx,
+                                                                            adapter.queue_batch)
+
+    def teardown(self):
+        """
+        Stops the fake Deep Lynx and removes the generated files, unless --keep is set
+        """
+        if self.server is not None:
+            self.server.stop()
+        if not self.args.keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def run(self):
+        """
+        Runs the scenarios of the --scenarios argument
+        Return
+            results (dictionary): the results of each scenario
+        """
+        self.setup()
+        try:
+            for scenario in self.args.scenarios:
+                print("Running " + scenario)
+                self.metrics.reset()
+                start = time.time()
+                result = getattr(self, scenario)()
+                result["scenario_seconds"] = time.time() - start
+                result["stages"], result["counters"] = metrics_summary(self.metrics.snapshot())
+                self.results[scenario] = result
+        finally:
+            self.teardown()
+        return self.results
+
+    def ingest(self, file_ids: list):
+        """
+        Submits events for files as the /machinelearning endpoint does, and waits until their data is in the queue.
+        Events rejected by a full ingest queue are submitted again, as Deep Lynx retries them after a 503 response
+        Args
+            file_ids (list): the file id of each event
+        Return
+            seconds (float): the seconds from the first event to the data of the last event in the queue
+            rejected (integer): the number of rejected events
+        """
+        rejected = 0
+        start = time.time()
+        for file_id in file_ids:
+            while not self.ingest_pool.submit(file_id):
+                rejected += 1
+                time.sleep(0.01)
+        self.ingest_pool.events.join()
+        return time.time() - start, rejected
+
+    def single_event(self):
+        """
+        Ingests the file of a single event at a time
+        """
+        file_id = self.server.add_file(
+            generate_file(self.file_path("single_event"), self.args.rows, self.args.columns, self.args.seed))
+        latencies = [self.ingest([file_id])[0] for i in range(self.args.iterations)]
+        return {
+            "events": self.args.iterations,
+            "rows_per_event": self.args.rows,
+            "latency": latency_summary(latencies),
+            "batch_delay_seconds": self.ingest_pool.max_delay
+        }
+
+    def event_burst(self):
+        """
+        Ingests the files of many events received at once
+        """
+        file_ids = [
+            self.server.add_file(
+                generate_file(self.file_path("event_burst_" + str(i)), self.args.burst_rows, self.args.columns,
+                              self.args.seed + i)) for i in range(self.args.events)
+        ]
+        batches = self.ingest_pool.status()["batches"]["count"]
+        seconds, rejected = self.ingest(file_ids)
+        rows = self.args.events * self.args.burst_rows
+        return {
+            "events": self.args.events,
+            "rows": rows,
+            "seconds": seconds,
+            "events_per_second": self.args.events / seconds,
+            "rows_per_second": rows / seconds,
+            "batches": self.ingest_pool.status()["batches"]["count"] - batches,
+            "rejected": rejected
+        }
+
+    def large_file(self):
+        """
+        Retrieves a large file from the file system and downloads it, keeping the last QUEUE_LENGTH rows
+        """
+        file_path = generate_file(self.file_path("large_file"), self.args.large_rows, self.args.columns, self.args.seed)
+        file_id = self.server.add_file(file_path)
+        megabytes = os.path.getsize(file_path) / 1024 / 1024
+        result = {"rows": self.args.large_rows, "megabytes": megabytes}
+        ingest_mode = os.getenv("INGEST_MODE")
+        try:
+            for mode in ("path", "download"):
+                # The download mode parses .csv streams only
+                if mode == "download" and self.args.file_format != "csv":
+                    continue
+                os.environ["INGEST_MODE"] = mode
+                start = time.time()
+                query_df = adapter.query_deep_lynx(file_id)
+                seconds = time.time() - start
+                result[mode] = {
+                    "seconds": seconds,
+                    "megabytes_per_second": megabytes / seconds,
+                    "rows_kept": query_df.shape[0]
+                }
+        finally:
+            if ingest_mode is None:
+                os.environ.pop("INGEST_MODE", None)
+            else:
+                os.environ["INGEST_MODE"] = ingest_mode
+        return result
+
+    def queue(self):
+        """
+        Appends many small DataFrames to the queue, one queue() call each
+        """
+        query_df = generate_dataset(self.args.queue_rows, self.args.columns, self.args.seed)
+        start = time.time()
+        for i in range(self.args.queue_calls):
+            adapter.deep_lynx_query.queue(query_df)
+        seconds = time.time() - start
+        return {
+            "calls": self.args.queue_calls,
+            "rows_per_call": self.args.queue_rows,
+            "seconds": seconds,
+            "calls_per_second": self.args.queue_calls / seconds,
+            "rows_per_second": self.args.queue_calls * self.args.queue_rows / seconds
+        }
+
+    def split(self):
+        """
+        Splits a queue snapshot with each split method of the split package, with the parameters of SPLIT
+        """
+        dataset = generate_dataset(self.args.rows, self.args.columns, self.args.seed)
+        params = json.loads(os.getenv("SPLIT"))
+        result = dict()
+        for method in split.SPLIT_METHODS:
+            start = time.time()
+            try:
+                # The first call imports the dependencies of the split method, and is not timed
+                split.split_dataset(method, dataset, params.get(method))
+                start = time.time()
+                train_index, test_index = split.split_dataset(method, dataset, params.get(method))
+            except Exception as e:
+                self.metrics.record("split", time.time() - start, True, method=method)
+                result[method] = {"error": repr(e)}
+                continue
+            seconds = time.time() - start
+            self.metrics.record("split", seconds, method=method)
+            result[method] = {
+                "seconds": seconds,
+                "rows_per_second": dataset.shape[0] / seconds if seconds else None,
+                "training_rows": len(train_index),
+                "testing_rows": len(test_index)
+            }
+        return result
+
+    def many_models(self):
+        """
+        Runs an ML Adapter object whose variable selection creates --models models, and uploads the ML results to the
+        fake Deep Lynx
+        """
+        dataset = generate_dataset(self.args.rows, self.args.columns, self.args.seed)
+        query_file_name = utils.dataset_file("benchmark_queue")
+        utils.write_dataset(dataset, query_file_name, index=False)
+        notebooks = os.path.join(os.path.dirname(os.path.abspath(__file__)), "notebooks")
+        data = {
+            "SPLIT_METHOD": self.args.split_method,
+            "VARIABLE_SELECTION": {
+                "notebook": os.path.join(notebooks, "variable_selection.ipynb"),
+                "kernel": "python3",
+                "output_file": "data/benchmark_variable_selection.json",
+                "models": self.args.models,
+                "features": self.args.features
+            },
+            "MODEL": {
+                "notebook": os.path.join(notebooks, "model.ipynb"),
+                "kernel": "python3",
+                "output_file": "data/benchmark_results.csv",
+                "model_serialization_file": "data/benchmark_model.pickle",
+                "standardization_file": "data/benchmark_standardization.json"
+            }
+        }
+        uploads = len(self.server.uploads)
+        start = time.time()
+        try:
+            ml_adapter = ML_Adapter("benchmark", data, dataset, query_file_name)
+        finally:
+            seconds = time.time() - start
+            if os.path.exists(query_file_name):
+                os.remove(query_file_name)
+            shutil.rmtree(os.path.join("data", "adapters", "benchmark"), ignore_errors=True)
+        return {
+            "models": self.args.models,
+            "models_succeeded": len(ml_adapter.models),
+            "seconds": seconds,
+            "models_per_second": self.args.models / ml_adapter.timings["models"],
+            "timings": ml_adapter.timings,
+            "uploads": len(self.server.uploads) - uploads
+        }
+
+    def registration(self):
+        """
+        Registers for events on --data-sources data sources of a container holding --event-actions event actions of
+        other adapters. The event actions of half of the data sources exist, the other half are created
+        """
+        names = ["Registration_" + str(i) for i in range(self.args.data_sources)]
+        data_source_ids = [self.server.add_data_source(name) for name in names]
+        destination = "http://" + os.getenv("FLASK_RUN_HOST") + ":" + os.getenv("FLASK_RUN_PORT") + "/machinelearning"
+        for i in range(self.args.event_actions):
+            self.server.add_event_action(data_source_ids[i % len(data_source_ids)], "http://other-" + str(i))
+        for data_source_id in data_source_ids[::2]:
+            self.server.add_event_action(data_source_id, destination)
+
+        requests = dict(self.server.requests)
+        data_sources = os.environ["DATA_SOURCES"]
+        os.environ["DATA_SOURCES"] = json.dumps(names)
+        start = time.time()
+        try:
+            registered = adapter.register_for_event(adapter.deep_lynx_client, iterations=1)
+        finally:
+            seconds = time.time() - start
+            os.environ["DATA_SOURCES"] = data_sources
+        return {
+            "data_sources": len(names),
+            "event_actions": self.args.event_actions + len(data_source_ids[::2]),
+            "registered": registered,
+            "seconds": seconds,
+            "requests": {
+                endpoint: count - requests.get(endpoint, 0)
+                for endpoint, count in self.server.requests.items() if count != requests.get(endpoint, 0)
+            }
+        }
+
+
+def print_results(results: dict, baseline: dict = None):
+    """
+    Prints the results of each scenario, and their change from a baseline
+    Args
+        results (dictionary): the results of each scenario, see Benchmark.run
+        baseline (dictionary): the results of an earlier run, or None
+    """
+    baseline = flatten(baseline["results"]) if baseline else dict()
+    for scenario, result in results.items():
+        print("\n== " + scenario)
+        for path, value in flatten({k: v for k, v in result.items() if k not in ("stages", "counters")}).items():
+            print("  {0:<44} {1:>14.4g}{2}".format(path, value, change(baseline.get(scenario + "/" + path), value)))
+        if result["stages"]:
+            print("  {0:<56} {1:>7} {2:>10} {3:>10}".format("stage", "count", "total s", "mean ms"))
+            for name, stage in result["stages"].items():
+                previous = baseline.get(scenario + "/stages/" + name + "/mean")
+                print("  {0:<56} {1:>7} {2:>10.3f} {3:>10.3f}{4}".format(name, stage["count"], stage["total"],
+                                                                         stage["mean"] * 1000,
+                                                                         change(previous, stage["mean"])))
+        for name, value in result["counters"].items():
+            print("  {0:<56} {1:>14.6g}".format(name, value))
+
+
+def change(previous, value):
+    """
+    Returns the change of a value from its baseline e.g. " (+12.3%)", or an empty string without a baseline
+    """
+    if previous is None or not previous:
+        return ""
+    return " ({0:+.1f}%)".format((value - previous) / previous * 100)
+
+
+def main():
+    """
+    Runs the benchmark from the project directory e.g.
+        python -m benchmark.run_benchmark --scenarios event_burst split --output data/benchmark.json
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks the ML Adapter against a fake Deep Lynx")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--rows", type=int, default=1000, help="the rows of the queue (QUEUE_LENGTH)")
+    parser.add_argument("--columns", type=int, default=20, help="the independent variables of the datasets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--file-format",
+                        choices=("csv", "feather", "parquet"),
+                        default="csv",
+                        help="the format of the files of the events")
+    parser.add_argument("--iterations", type=int, default=10, help="single_event: the number of events")
+    parser.add_argument("--events", type=int, default=50, help="event_burst: the number of events")
+    parser.add_argument("--burst-rows", type=int, default=100, help="event_burst: the rows of each file")
+    parser.add_argument("--large-rows", type=int, default=200000, help="large_file: the rows of the file")
+    parser.add_argument("--queue-calls", type=int, default=1000, help="queue: the number of queue() calls")
+    parser.add_argument("--queue-rows", type=int, default=10, help="queue: the rows of each queue() call")
+    parser.add_argument("--models", type=int, default=8, help="many_models: the number of models")
+    parser.add_argument("--features", type=int, default=5, help="many_models: the independent variables per model")
+    parser.add_argument("--split-method", default="random", help="many_models: the SPLIT_METHOD")
+    parser.add_argument("--data-sources", type=int, default=200, help="registration: the number of data sources")
+    parser.add_argument("--event-actions",
+                        type=int,
+                        default=2000,
+                        help="registration: the number of event actions of other adapters")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="the latency of the fake Deep Lynx")
+    parser.add_argument("--directory",
+                        default=os.path.join("data", "benchmark"),
+                        help="the directory of the generated files")
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    parser.add_argument("--output", help="a .json file of the results")
+    parser.add_argument("--baseline", help="a .json file of earlier results to compare with")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = Benchmark(args).run()
+    print_results(results, baseline)
+
+    if args.output:
+        environment = {name: os.getenv(name) for name in REPORTED_ENVIRONMENT}
+        output = {
+            "time": time.time(),
+            "arguments": vars(args),
+            "environment": environment,
+            "python": sys.version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "results": results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print("\nWrote " + args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+# Python Packages
+import os
+import ast
+import copy
+import json
+import argparse
+from collections import namedtuple
+from statistics import mode
+import numpy as np
+import pandas as pd
+
+# Repository Modules
+from split import hierarchical_clustering
+
+NOTEBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "split",
+                        "hierarchical_clustering.ipynb")
+
+
+def notebook_int(value=0):
+    """
+    int() of the notebook: converts an array of one element, as numpy did before 2.0 e.g. int(np.where(...)[0])
+    """
+    if isinstance(value, np.ndarray):
+        return int(value.item())
+    return int(value)
+
+
+def notebook_functions(file_path: str = NOTEBOOK):
+    """
+    Returns the functions of split/hierarchical_clustering.ipynb: the cells that only define functions, classes or
+    constants are run, and not the cells that read the environment or the dataset
+    Args
+        file_path (string): the path of the Jupyter Notebook
+    """
+    with open(file_path) as f:
+        nb = json.load(f)
+    namespace = {"np": np, "pd": pd, "copy": copy, "namedtuple": namedtuple, "mode": mode, "int": notebook_int}
+    for cell in nb["cells"]:
+        source = "".join(cell["source"])
+        if cell["cell_type"] != "code" or not source.strip():
+            continue
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            # A cell with IPython-only lines e.g. %dotenv
+            continue
+        if all(isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Assign)) for node in tree.body):
+            exec(compile(tree, file_path, "exec"), namespace)
+    return namespace
+
+
+def random_samples(rows: int, columns: int, seed: int, discrete: bool):
+    """
+    Returns random samples, of continuous values or of small integers whose distances tie often
+    """
+    rng = np.random.default_rng(seed)
+    if discrete:
+        return rng.integers(0, 4, size=(rows, columns)).astype(np.float64)
+    return rng.normal(size=(rows, columns))
+
+
+def notebook_assignments(notebook: dict, dataset: np.ndarray, sample_index: np.ndarray, k_clusters: int):
+    """
+    Returns the merges, prototypes and cluster assignments of the notebook's hierarchical clustering
+    """
+    dist_matrix = notebook["distance_matrix"](dataset[sample_index])
+    retired_clusters = notebook["nearest_neighbor"](dist_matrix)
+    merges = [(cluster.id, list(cluster.previous_id)) for cluster in retired_clusters]
+    clusters = notebook["get_clusters"](copy.deepcopy(retired_clusters), k_clusters)
+    pruned_clusters, prototype_ids = notebook["prune_clusters"](clusters)
+    assignments = notebook["assign_clusters"](dataset, sample_index.tolist(), pruned_clusters)
+    prototype_ids = [int(i) for i in prototype_ids]
+    return merges, prototype_ids, assignments["prototype_id"].to_numpy(), assignments["assigned_id"].to_numpy()
+
+
+def port_assignments(dataset: np.ndarray, sample_index: np.ndarray, k_clusters: int, memory_bytes: int):
+    """
+    Returns the merges, prototypes and cluster assignments of split/hierarchical_clustering.py
+    """
+    linkage = hierarchical_clustering.Minimax_Linkage(dataset[sample_index], memory_bytes)
+    retired_clusters = linkage.nearest_neighbor()
+    merges = [(cluster.id, list(cluster.previous_id)) for cluster in retired_clusters]
+    clusters = hierarchical_clustering.get_clusters(retired_clusters, k_clusters)
+    pruned_clusters, prototype_ids = hierarchical_clustering.prune_clusters(linkage, clusters)
+    prototype_id, assigned_id = hierarchical_clustering.assign_clusters(dataset, sample_index, pruned_clusters,
+                                                                        memory_bytes)
+    return merges, [int(i) for i in prototype_ids], prototype_id, assigned_id
+
+
+def compare(args):
+    """
+    Clusters random datasets with the notebook and with the split method, and returns the trials that differ
+
+    Each trial clusters N rows sampled from a dataset of --rows rows, like the split method, and compares the merges,
+    the prototypes and the cluster assigned to each row of the dataset. The split method is run with the full distance
+    matrix and with a memory budget small enough that the distances are computed in chunks
+    Return
+        mismatches (list): e.g. [{"seed": 41, "discrete": False, "memory_bytes": 512, "differs": ["merges"]}]
+    """
+    notebook = notebook_functions()
+    mismatches = list()
+    for seed in range(args.seed, args.seed + args.trials):
+        discrete = seed % 2 == 1
+        dataset = random_samples(args.rows, args.columns, seed, discrete)
+        if args.rows > args.N:
+            sample_index = pd.Series(np.arange(args.rows)).sample(n=args.N, random_state=1).to_numpy()
+        else:
+            sample_index = np.arange(args.rows)
+        expected = notebook_assignments(notebook, dataset, sample_index, args.max_clusters)
+        for memory_bytes in (512 * 1024 * 1024, 8 * len(sample_index) * 4):
+            try:
+                result = port_assignments(dataset, sample_index, args.max_clusters, memory_bytes)
+            except Exception as e:
+                mismatches.append({"seed": seed, "discrete": discrete, "memory_bytes": memory_bytes, "error": repr(e)})
+                continue
+            differs = [
+                name for name, a, b in zip(("merges", "prototype_ids", "prototype_id", "assigned_id"), expected, result)
+                if not np.array_equal(np.asarray(a, dtype=object), np.asarray(b, dtype=object))
+            ]
+            if differs:
+                mismatches.append({
+                    "seed": seed,
+                    "discrete": discrete,
+                    "memory_bytes": memory_bytes,
+                    "differs": differs
+                })
+    return mismatches
+
+
+def main():
+    """
+    Checks that the hierarchical_clustering split method clusters like split/hierarchical_clustering.ipynb, from the
+    project directory e.g.
+        python -m benchmark.split_parity --trials 60
+    """
+    parser = argparse.ArgumentParser(description="Compares the hierarchical_clustering split method to its notebook")
+    parser.add_argument("--trials", type=int, default=60, help="the number of random datasets")
+    parser.add_argument("--rows", type=int, default=60, help="the rows of each dataset")
+    parser.add_argument("--columns", type=int, default=4, help="the columns of each dataset")
+    parser.add_argument("--N", type=int, default=41, help="the rows that are clustered")
+    parser.add_argument("--max-clusters", type=int, default=4, help="the number of clusters")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the first dataset")
+    args = parser.parse_args()
+
+    mismatches = compare(args)
+    for mismatch in mismatches:
+        print(mismatch)
+    print("{0} of {1} trials differ from the notebook".format(len({m["seed"] for m in mismatches}), args.trials))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
 # Copyright 2021, Battelle Energy Alliance, LLC
 
-from .ml_model import ML_Model
+from .ml_model import ML_Model, run_model
+from .model_pool import get_model_pool, shutdown_model_pool
+from .dataset_cache import Dataset_Cache
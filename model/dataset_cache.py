@@ -0,0 +1,56 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import pandas as pd
+
+import utils
+
+
+class Dataset_Cache():
+    """
+    Keeps the training and testing sets of an ML Adapter object in memory for a retrain cycle
+
+        1. A dataset is parsed from its file the first time it is requested e.g. training_set
+        2. Models get projections of the columns they use, which share the memory of the cached dataset
+        3. The datasets are released at the end of the cycle
+
+    Args
+        directory (string): the directory of the datasets e.g. the workspace of the ML Adapter object
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.datasets = dict()
+
+    def get(self, name: str):
+        """
+        Returns a dataset, parsed from its file on first use
+        Args
+            name (string): the name of the dataset without extension e.g. training_set
+        Return
+            dataset (DataFrame): the dataset
+        """
+        if name not in self.datasets:
+            file_path = os.path.abspath(utils.dataset_file(name, self.directory))
+            utils.validate_paths_exist(file_path)
+            self.datasets[name] = utils.read_dataset(file_path)
+        return self.datasets[name]
+
+    def project(self, name: str, columns: list):
+        """
+        Returns the columns of a dataset without copying them. The projection must not be modified in place with
+        pandas < 2, which has no copy-on-write
+        Args
+            name (string): the name of the dataset without extension e.g. training_set
+            columns (list): the columns of the projection
+        Return
+            projection (DataFrame): the columns of the dataset, with the index of the dataset
+        """
+        dataset = self.get(name)
+        return pd.DataFrame({column: dataset[column] for column in columns}, index=dataset.index, copy=False)
+
+    def release(self):
+        """
+        Releases the cached datasets
+        """
+        self.datasets.clear()
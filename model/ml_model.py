@@ -2,6 +2,9 @@
 
 import os
 import json
+import time
+import logging
+import traceback
 import pandas as pd
 
 import utils
@@ -13,17 +16,46 @@ class ML_Model():
     Split into predictors/response for the training and testing datasets that are used by the Jupyter Notebook to create a machine learning model
 
         1. Select independent and dependent variables from the training and testing set
-        2. Creates .csv files of the predictors/response for the training and testing sets e.g. X_train.csv, X_test.csv, y_train.csv, y_test.csv
+        2. Creates files of the predictors/response for the training and testing sets in the dataset format (DATASET_FORMAT) e.g. X_train.csv, X_test.csv, y_train.csv, y_test.csv
         3. Run the customized machine learning Jupyter Notebook
+
+    The training and testing sets are read from the WORKSPACE directory of the ML Adapter data, the data directory by
+    default, unless the ML Adapter object provides them from its dataset cache. With a workspace, the files and
+    the outputs of the Jupyter Notebook are written to the workspace directory, so that models can be trained at the
+    same time. The Jupyter Notebook reads a copy of the ML Adapter data where the output files of MODEL are in the
+    workspace, and whose WORKSPACE key is the workspace directory
+
+    Args
+        independent_variables (list): the independent variables (Features, X, Predictors) of the model
+        dependent_variables (list): the dependent variables (Response, y, Label) of the model
+        data (dictionary): the data of the ML Adapter object. Read from ML_ADAPTER_OBJECT_LOCATION if None
+        workspace (string): the directory of the model's files. The data directory if None
+        training_set (DataFrame): the columns of the training set used by the model. Read from file if None
+        testing_set (DataFrame): the columns of the testing set used by the model. Read from file if None
+        labels (dictionary): the labels of the notebook profile e.g. {"adapter": "ML_Object_1", "model": 0}
     
     Return
         Generates a machine learning serialized model and ML results
 
     """
 
-    def __init__(self, independent_variables, dependent_variables):
+    def __init__(self,
+                 independent_variables,
+                 dependent_variables,
+                 data: dict = None,
+                 workspace: str = None,
+                 training_set: pd.DataFrame = None,
+                 testing_set: pd.DataFrame = None,
+                 labels: dict = None):
         self.independent_variables = independent_variables
         self.dependent_variables = dependent_variables
+        self.data = data
+        self.workspace = workspace
+        self.training_set = training_set
+        self.testing_set = testing_set
+        self.labels = dict(labels or dict(), stage="model")
+        # Seconds spent in each step e.g. {"model_files": 0.1, "model_notebook": 12.3}
+        self.timings = dict()
 
         self.create_model()
 
@@ -31,16 +63,19 @@ class ML_Model():
         """
         Creates a machine learning model and produces ML results
         """
-        # Preprocess data
-        training_path = os.path.abspath(os.path.join("data", "training_set.csv"))
-        utils.validate_extension('.csv', training_path)
-        utils.validate_paths_exist(training_path)
-        training_set = pd.read_csv(training_path, 'r', delimiter=',')
-
-        testing_path = os.path.abspath(os.path.join("data", "testing_set.csv"))
-        utils.validate_extension('.csv', testing_path)
-        utils.validate_paths_exist(testing_path)
-        testing_set = pd.read_csv(testing_path, 'r', delimiter=',')
+        # Preprocess data, from the workspace of the ML Adapter object unless provided
+        data_path = (self.data or dict()).get("WORKSPACE", "data")
+        training_set = self.training_set
+        if training_set is None:
+            training_path = os.path.abspath(utils.dataset_file("training_set", data_path))
+            utils.validate_paths_exist(training_path)
+            training_set = utils.read_dataset(training_path)
+
+        testing_set = self.testing_set
+        if testing_set is None:
+            testing_path = os.path.abspath(utils.dataset_file("testing_set", data_path))
+            utils.validate_paths_exist(testing_path)
+            testing_set = utils.read_dataset(testing_path)
 
         # Determine independent variables dataset (Features, X, Predictors)
         X_train = training_set[self.independent_variables]
@@ -55,30 +90,77 @@ class ML_Model():
             y_test = testing_set[self.dependent_variables]
 
         # Write X_train, X_test, y_train, y_test to .csv files
+        start = time.time()
         self.create_training_testing_files(X_train, X_test, y_train, y_test)
+        self.timings["model_files"] = time.time() - start
 
         # Run the Jupyter Notebook
         print("Begin forecasting notebook")
-        with open(os.getenv("ML_ADAPTER_OBJECT_LOCATION"), 'r') as fp:
-            data = json.load(fp)
-        utils.run_jupyter_notebook(data["MODEL"]["notebook"], data["MODEL"]["kernel"])
-
-        # File clean up
-        if os.path.exists("data/X_train.csv"):
-            os.remove("data/X_train.csv")
-        if os.path.exists("data/X_test.csv"):
-            os.remove("data/X_test.csv")
-        if os.path.exists("data/y_train.csv"):
-            os.remove("data/y_train.csv")
-        if os.path.exists("data/y_test.csv"):
-            os.remove("data/y_test.csv")
-        if os.path.exists(data["VARIABLE_SELECTION"]["output_file"]):
-            os.remove(data["VARIABLE_SELECTION"]["output_file"])
+        start = time.time()
+        if self.workspace is None:
+            with open(os.getenv("ML_ADAPTER_OBJECT_LOCATION"), 'r') as fp:
+                data = json.load(fp)
+            utils.run_jupyter_notebook(data["MODEL"]["notebook"], data["MODEL"]["kernel"], labels=self.labels)
+        else:
+            data = self.data
+            file_path = self.write_workspace_data()
+            try:
+                utils.run_jupyter_notebook(data["MODEL"]["notebook"],
+                                           data["MODEL"]["kernel"],
+                                           env={"ML_ADAPTER_OBJECT_LOCATION": file_path},
+                                           labels=self.labels)
+            finally:
+                os.remove(file_path)
+                self.remove_training_testing_files()
+        self.timings["model_notebook"] = time.time() - start
+
+        # File clean up. The files of a workspace are removed above, and the variable selection file is shared by the
+        # models of a workspace, removed by the ML Adapter
+        if self.workspace is None:
+            self.remove_training_testing_files()
+            if os.path.exists(data["VARIABLE_SELECTION"]["output_file"]):
+                os.remove(data["VARIABLE_SELECTION"]["output_file"])
+
+    def remove_training_testing_files(self):
+        """
+        Removes the files of the predictors/response for the training and testing sets
+        """
+        dir_path = self.workspace or "data"
+        for name in ['X_train', 'X_test', 'y_train', 'y_test']:
+            if os.path.exists(utils.dataset_file(name, dir_path)):
+                os.remove(utils.dataset_file(name, dir_path))
+
+    def write_workspace_data(self):
+        """
+        Writes the data of the ML Adapter object for the model's Jupyter Notebook, with the output files of MODEL in
+        the workspace
+
+        Return
+            file_path (string): the path of the JSON file
+        """
+        data = json.loads(json.dumps(self.data))
+        data["WORKSPACE"] = self.workspace
+        for key in ["output_file", "model_serialization_file", "standardization_file"]:
+            if data["MODEL"].get(key):
+                data["MODEL"][key] = self.workspace_file(data["MODEL"][key])
+
+        file_path = os.path.join(self.workspace, "ml_adapter_object.json")
+        with open(file_path, 'w') as fp:
+            json.dump(data, fp)
+        return file_path
+
+    def workspace_file(self, file_path: str):
+        """
+        Returns the path of a file in the workspace
+        Args
+            file_path (string): the path of the file outside of the workspace e.g. data/ML_queue.csv
+        """
+        return os.path.join(self.workspace, os.path.basename(file_path))
 
     def create_training_testing_files(self, X_train: pd.DataFrame or pd.Series, X_test: pd.DataFrame or pd.Series,
                                       y_train: pd.DataFrame or pd.Series, y_test: pd.DataFrame or pd.Series):
         """
-        Creates .csv files of the predictors/response for the training and testing sets
+        Creates files of the predictors/response for the training and testing sets in the dataset format
         
         Args
             X_train (DataFrame or Series): a subset of the Features, X, Predictors dataset used for training
@@ -88,23 +170,57 @@ class ML_Model():
         """
         # If supervised learning
         if y_train is not None and y_test is not None:
-            paths = ['X_train.csv', 'X_test.csv', 'y_train.csv', 'y_test.csv']
+            names = ['X_train', 'X_test', 'y_train', 'y_test']
             sets = [X_train, X_test, y_train, y_test]
         # Else unsupervised learning
         else:
-            paths = ['X_train.csv', 'X_test.csv']
+            names = ['X_train', 'X_test']
             sets = [X_train, X_test]
 
-        # Validate extension and path existance before creation
-        for path in paths:
-            utils.validate_extension('.csv', path)
-        dir_path = os.path.abspath('data')
+        # Validate path existance before creation
+        dir_path = os.path.abspath(self.workspace or 'data')
         utils.validate_paths_exist(dir_path)
 
-        # Write files to .csv file
-        for i in range(len(paths)):
-            file_path = os.path.join(dir_path, paths[i])
-            sets[i].to_csv(file_path)
+        # Write files in the dataset format
+        for i in range(len(names)):
+            utils.write_dataset(sets[i], utils.dataset_file(names[i], dir_path))
+
+
+def run_model(independent_variables: list,
+              dependent_variables: list,
+              data: dict,
+              workspace: str,
+              training_set: pd.DataFrame = None,
+              testing_set: pd.DataFrame = None,
+              labels: dict = None):
+    """
+    Creates a model in its workspace, in a worker process of the model pool or in this process. Errors are returned
+    instead of raised, so that a failed model does not affect the other models
+
+    Args
+        independent_variables (list): the independent variables (Features, X, Predictors) of the model
+        dependent_variables (list): the dependent variables (Response, y, Label) of the model
+        data (dictionary): the data of the ML Adapter object
+        workspace (string): the directory of the model's files
+        training_set (DataFrame): the columns of the training set used by the model. Read from file if None
+        testing_set (DataFrame): the columns of the testing set used by the model. Read from file if None
+        labels (dictionary): the labels of the notebook profile e.g. {"adapter": "ML_Object_1", "model": 0}
+    Return
+        output_file (string): the path of the model's ML results, or None if the model failed
+        error (string): the traceback of the error, or None if the model succeeded
+        timings (dictionary): the seconds spent by the model in each step, and in total
+    """
+    start = time.time()
+    try:
+        os.makedirs(workspace, exist_ok=True)
+        ml_model = ML_Model(independent_variables, dependent_variables, data, workspace, training_set, testing_set,
+                            labels)
+        return ml_model.workspace_file(data["MODEL"]["output_file"]), None, dict(ml_model.timings,
+                                                                                 model=time.time() - start)
+    except Exception:
+        error = traceback.format_exc()
+        logging.getLogger(__name__).error('Model in ' + workspace + ' failed: ' + error)
+        return None, error, {"model": time.time() - start}
 
 
 def main():
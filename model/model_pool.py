@@ -0,0 +1,41 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+model_pool = None
+model_pool_lock = threading.Lock()
+
+
+def get_model_pool():
+    """
+    Returns the process pool that trains models, configured by the MODEL_WORKERS environment variable
+
+    Worker processes are spawned rather than forked, since the adapter process runs threads
+    Return
+        model_pool (ProcessPoolExecutor): the process pool, or None if MODEL_WORKERS is 0 or not set
+    """
+    global model_pool
+    workers = int(os.getenv("MODEL_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    with model_pool_lock:
+        if model_pool is None:
+            model_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(shutdown_model_pool)
+        return model_pool
+
+
+def shutdown_model_pool():
+    """
+    Shuts down the process pool, e.g. after a worker process died. The next call to get_model_pool starts a new pool
+    """
+    global model_pool
+    with model_pool_lock:
+        pool = model_pool
+        model_pool = None
+    if pool is not None:
+        pool.shutdown(wait=False)
@@ -1,3 +1,5 @@
 # Copyright 2021, Battelle Energy Alliance, LLC
 
 from .ml_prediction import ML_Prediction
+from .model_registry import Model_Registry, Registered_Model, get_model_registry
+from .batch_scoring import score_dataset
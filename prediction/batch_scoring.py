@@ -0,0 +1,123 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+import utils
+from .model_registry import Registered_Model
+
+# The model of a worker process, loaded once by load_worker_model
+worker_model = None
+
+
+def load_worker_model(serialization_file: str, standardization_file: str, independent_variables: list,
+                      dependent_variables: list):
+    """
+    Loads the model of a worker process of the scoring pool. See Registered_Model for the arguments
+    """
+    global worker_model
+    worker_model = Registered_Model("batch", 0, serialization_file, standardization_file, independent_variables,
+                                    dependent_variables)
+
+
+def score_chunk(X: pd.DataFrame):
+    """
+    Makes a prediction on a chunk of the dataset with the model of the worker process
+    Args
+        X (DataFrame): a chunk of the dataset
+    Return
+        yhat (ndarray): the prediction of each row
+    """
+    return worker_model.predict(X)
+
+
+def prediction_frame(yhat: np.ndarray, dependent_variables: list):
+    """
+    Returns the predictions of a chunk as a DataFrame, with a column per dependent variable
+    Args
+        yhat (ndarray): the prediction of each row
+        dependent_variables (list): the predicted columns
+    Return
+        predictions (DataFrame): the predictions
+    """
+    yhat = np.asarray(yhat)
+    if yhat.ndim == 1:
+        yhat = yhat.reshape(-1, 1)
+    if dependent_variables and len(dependent_variables) == yhat.shape[1]:
+        columns = dependent_variables
+    elif yhat.shape[1] == 1:
+        columns = ["prediction"]
+    else:
+        columns = ["prediction_" + str(i) for i in range(yhat.shape[1])]
+    return pd.DataFrame(yhat, columns=columns)
+
+
+def score_dataset(dataset: str,
+                  output_file: str,
+                  serialization_file: str,
+                  standardization_file: str = None,
+                  independent_variables: list = None,
+                  dependent_variables: list = None,
+                  chunk_rows: int = 100000,
+                  workers: int = 0):
+    """
+    Scores a dataset in chunks and streams the predictions to a .csv file
+
+        1. The dataset is read in chunks of chunk_rows rows, with the independent variables only
+        2. The chunks are scored by a pool of worker processes, each of which loads the model once
+        3. The predictions are appended to the output file in the order of the rows of the dataset. At most two chunks
+           per worker are in flight, so that memory does not grow with the size of the dataset
+
+    Args
+        dataset (string): the dataset in the dataset format
+        output_file (string): the .csv file of the predictions
+        serialization_file (string): the pickle file of the model
+        standardization_file (string): the JSON file of the standardization information, or None
+        independent_variables (list): the columns passed to the model, in order
+        dependent_variables (list): the columns of the predictions
+        chunk_rows (integer): the number of rows scored at a time
+        workers (integer): the number of worker processes. 0 scores the chunks one after another in this process
+    Return
+        rows (integer): the number of rows scored
+    """
+    utils.validate_paths_exist(dataset)
+    utils.validate_extension('.csv', output_file)
+    start = time.time()
+    chunks = utils.read_dataset_chunks(dataset, chunk_rows, independent_variables)
+    model_args = (serialization_file, standardization_file, independent_variables, dependent_variables)
+
+    rows = 0
+    with open(output_file, 'w', newline='') as f:
+
+        def write(yhat):
+            nonlocal rows
+            # The header is written with the first chunk
+            prediction_frame(yhat, dependent_variables).to_csv(f, header=f.tell() == 0, index=False)
+            rows += len(yhat)
+
+        if workers <= 0:
+            model = Registered_Model("batch", 0, *model_args)
+            for chunk in chunks:
+                write(model.predict(chunk))
+        else:
+            # Worker processes are spawned rather than forked, since the adapter process runs threads
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=load_worker_model,
+                                     initargs=model_args) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.submit(score_chunk, chunk))
+                    if len(in_flight) >= 2 * workers:
+                        write(in_flight.popleft().result())
+                while in_flight:
+                    write(in_flight.popleft().result())
+
+    logging.getLogger(__name__).info('Scored ' + str(rows) + ' rows of ' + dataset + ' in ' +
+                                     str(round(time.time() - start, 3)) + ' seconds')
+    return rows
@@ -7,6 +7,7 @@ import pandas as pd
 import utils
 import model
 import settings
+from .batch_scoring import score_dataset
 
 
 class ML_Prediction():
@@ -14,8 +15,12 @@ class ML_Prediction():
     Make a prediction on incoming data using an existing model file
 
         1. Select independent variables from the testing set
-        2. Write the test file 
+        2. Write the test file in the dataset format (DATASET_FORMAT) e.g. test.csv
         3. Run the customized prediction Jupyter Notebook
+
+    In batch scoring mode (PREDICTION_CHUNK_ROWS greater than 0), the dataset is scored in chunks by
+    PREDICTION_WORKERS worker processes with the model_serialization_file of MODEL instead, and the predictions are
+    streamed to the output_file of PREDICTION, a .csv file
     """
 
     def __init__(self, ml_model):
@@ -34,31 +39,42 @@ class ML_Prediction():
         with open(os.getenv("ML_ADAPTER_OBJECT_LOCATION"), 'r') as fp:
             data = json.load(fp)
         dataset = data["DATASET"]
-        test_data = pd.read_csv(dataset)
-        test_data = test_data[independent_variables]
 
-        # Write test.csv file
+        chunk_rows = int(os.getenv("PREDICTION_CHUNK_ROWS", "0"))
+        if chunk_rows > 0:
+            score_dataset(dataset,
+                          data["PREDICTION"]["output_file"],
+                          data["MODEL"]["model_serialization_file"],
+                          data["MODEL"].get("standardization_file"),
+                          independent_variables,
+                          self.ml_model.dependent_variables,
+                          chunk_rows=chunk_rows,
+                          workers=int(os.getenv("PREDICTION_WORKERS", "0")))
+            return
+
+        test_data = utils.read_dataset(dataset, columns=independent_variables)
+
+        # Write test file
         self.create_test_file(test_data)
 
         # Call Jupyter Notebook
-        utils.run_jupyter_notebook(data["PREDICTION"]["notebook"], data["PREDICTION"]["kernel"])
+        utils.run_jupyter_notebook(data["PREDICTION"]["notebook"],
+                                   data["PREDICTION"]["kernel"],
+                                   labels={"stage": "prediction"})
 
     def create_test_file(self, test_data: pd.DataFrame or pd.Series):
         """
-        Creates a test.csv file of the incoming data
+        Creates a test file of the incoming data in the dataset format e.g. data/test.csv
         Args
             test_data (DataFrame or Series): a subset of the Features, X, Predictors dataset used for testing
         """
-        # Validate extension and path existance before creation
-        path = 'test.csv'
-        utils.validate_extension('.csv', path)
+        # Validate path existance before creation
         dir_path = os.path.abspath('data')
         utils.validate_paths_exist(dir_path)
 
-        key = path.split('.')[0]
-        file_path = os.path.join(dir_path, path)
+        file_path = utils.dataset_file('test', dir_path)
         print(file_path)
-        test_data.to_csv(file_path, index=False)
+        utils.write_dataset(test_data, file_path, index=False)
 
 
 def main():
@@ -0,0 +1,320 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import json
+import time
+import queue
+import pickle
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import utils
+
+model_registry = None
+model_registry_lock = threading.Lock()
+
+
+class Registered_Model():
+    """
+    A deserialized model and its standardization information, kept in memory by the model registry
+
+    Args
+        name (string): the name of the model e.g. <ML Adapter object name>/<model index>
+        version (integer): the number of times a model was registered under this name
+        serialization_file (string): the pickle file of the model (model_serialization_file of MODEL)
+        standardization_file (string): the JSON file of the mean and standard deviation of X_train and y_train
+            (standardization_file of MODEL), or None if the data is not standardized
+        independent_variables (list): the columns passed to the model, in order. All columns if None
+        dependent_variables (list): the predicted columns
+    """
+
+    def __init__(self,
+                 name: str,
+                 version: int,
+                 serialization_file: str,
+                 standardization_file: str = None,
+                 independent_variables: list = None,
+                 dependent_variables: list = None):
+        self.name = name
+        self.version = version
+        self.serialization_file = serialization_file
+        self.independent_variables = independent_variables
+        self.dependent_variables = dependent_variables
+        self.loaded = time.time()
+
+        with open(serialization_file, 'rb') as f:
+            content = f.read()
+        self.model = pickle.loads(content)
+        # The size of the pickle estimates the memory held by the model
+        self.size = len(content)
+
+        self.X_mean, self.X_std, self.y_mean, self.y_std = None, None, None, None
+        if standardization_file and os.path.exists(standardization_file):
+            with open(standardization_file) as f:
+                standardize = json.load(f)
+            # Either the standardize dictionary of sample_model.ipynb, or nested under "data"
+            standardize = standardize.get("data", standardize)
+            self.X_mean = self.standardization(standardize["mean"].get("X_train"))
+            self.X_std = self.standardization(standardize["std"].get("X_train"))
+            self.y_mean = self.standardization(standardize["mean"].get("y_train"))
+            self.y_std = self.standardization(standardize["std"].get("y_train"))
+
+    def standardization(self, values):
+        """
+        Returns the mean or standard deviation of the columns in a form that broadcasts over the data
+        Args
+            values (number, list or dictionary): the value of each column, in order or by column name
+        """
+        if isinstance(values, dict):
+            return pd.Series(values)
+        if isinstance(values, list):
+            return np.asarray(values, dtype=float)
+        return values
+
+    def predict(self, X: pd.DataFrame):
+        """
+        Standardizes the data, makes a prediction and unstandardizes the prediction, like sample_prediction.ipynb
+        Args
+            X (DataFrame): the incoming data
+        Return
+            yhat (ndarray): the prediction of each row
+        """
+        if self.independent_variables:
+            X = X[self.independent_variables]
+        if self.X_mean is not None and self.X_std is not None:
+            X = (X - self.X_mean) / self.X_std
+        yhat = np.asarray(self.model.predict(X))
+        if self.y_mean is not None and self.y_std is not None:
+            yhat = yhat * np.asarray(self.y_std) + np.asarray(self.y_mean)
+        return yhat
+
+
+class Model_Registry():
+    """
+    Keeps deserialized models in memory and answers prediction requests in micro-batches
+
+        1. A model is loaded when registered e.g. after a retrain, and replaces the previous version of the model
+           without interrupting the predictions already made with it
+        2. The least recently used models are evicted once the models take more than max_bytes, and loaded again from
+           their files on the next request
+        3. Concurrent requests received within batch_delay seconds are grouped by model, and each model makes a single
+           vectorized predict call on the rows of its requests
+
+    Args
+        max_bytes (integer): the memory budget of the models, estimated from the size of their serialization files
+        batch_delay (float): the maximum number of seconds a request waits for other requests of its batch
+        max_batch_rows (integer): the maximum number of rows of a batch
+    """
+
+    def __init__(self, max_bytes: int, batch_delay: float = 0.005, max_batch_rows: int = 10000):
+        self.max_bytes = max_bytes
+        self.batch_delay = max(0.0, batch_delay)
+        self.max_batch_rows = max(1, max_batch_rows)
+        # Loaded models, from the least to the most recently used
+        self.models = OrderedDict()
+        # The arguments of Registered_Model of every registered model, to load evicted models again
+        self.sources = dict()
+        self.versions = dict()
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.requests = queue.Queue()
+
+        # Statistics
+        self.loads = 0
+        self.evictions = 0
+        self.swaps = 0
+        self.predictions = 0
+        self.batches = 0
+
+        # Daemon: a daemon thread will shut down immediately when the program exits
+        self.thread = threading.Thread(target=self.work, daemon=True, name="predict_batcher")
+        self.thread.start()
+
+    def __contains__(self, name: str):
+        with self.lock:
+            return name in self.sources
+
+    def register(self,
+                 name: str,
+                 serialization_file: str,
+                 standardization_file: str = None,
+                 independent_variables: list = None,
+                 dependent_variables: list = None):
+        """
+        Loads a model and swaps it in for the previous version of the model
+        Args
+            name (string): the name of the model e.g. <ML Adapter object name>/<model index>
+            serialization_file (string): the pickle file of the model
+            standardization_file (string): the JSON file of the standardization information, or None
+            independent_variables (list): the columns passed to the model, in order
+            dependent_variables (list): the predicted columns
+        Return
+            registered_model (Registered_Model): the loaded model
+        """
+        with self.lock:
+            version = self.versions.get(name, 0) + 1
+        source = (serialization_file, standardization_file, independent_variables, dependent_variables)
+        registered_model = Registered_Model(name, version, *source)
+        with self.lock:
+            self.versions[name] = version
+            self.sources[name] = source
+            if self.models.pop(name, None) is not None:
+                self.swaps += 1
+            self.add(registered_model)
+        logging.info('Registered model ' + name + ' version ' + str(version))
+        return registered_model
+
+    def get(self, name: str):
+        """
+        Returns a model, loaded again from its files if it was evicted
+        Args
+            name (string): the name of the model
+        Return
+            registered_model (Registered_Model): the model
+        """
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                return self.models[name]
+            if name not in self.sources:
+                raise KeyError('Unknown model: \'{0}\''.format(name))
+        # One model is loaded at a time, so that concurrent requests do not load the same model twice
+        with self.load_lock:
+            with self.lock:
+                if name in self.models:
+                    return self.models[name]
+                source = self.sources[name]
+                version = self.versions[name]
+            registered_model = Registered_Model(name, version, *source)
+            with self.lock:
+                if name not in self.models:
+                    self.add(registered_model)
+                return self.models[name]
+
+    def add(self, registered_model: Registered_Model):
+        """
+        Adds a loaded model and evicts the least recently used models beyond max_bytes. Called with the lock held
+        Args
+            registered_model (Registered_Model): the loaded model
+        """
+        self.models[registered_model.name] = registered_model
+        self.loads += 1
+        total = sum(model.size for model in self.models.values())
+        while total > self.max_bytes and len(self.models) > 1:
+            name, evicted = self.models.popitem(last=False)
+            total -= evicted.size
+            self.evictions += 1
+            logging.info('Evicted model ' + name + ' (' + str(evicted.size) + ' bytes) from the model registry')
+
+    def predict(self, name: str, X: pd.DataFrame, timeout: float = None):
+        """
+        Makes a prediction with a model, batched with the concurrent requests to the same model
+        Args
+            name (string): the name of the model
+            X (DataFrame): the incoming data
+            timeout (float): the maximum number of seconds to wait for the prediction
+        Return
+            yhat (ndarray): the prediction of each row
+            version (integer): the version of the model that made the prediction
+        """
+        future = Future()
+        self.requests.put((name, X, future))
+        return future.result(timeout)
+
+    def next_batch(self):
+        """
+        Waits for the next batch of requests
+        Return
+            batch (list): the name, data and future of each request, in the order received
+        """
+        batch = [self.requests.get()]
+        rows = batch[0][1].shape[0]
+        deadline = time.monotonic() + self.batch_delay
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += request[1].shape[0]
+        return batch
+
+    def work(self):
+        """
+        Makes a single prediction per model for each batch of requests
+        """
+        while True:
+            batch = self.next_batch()
+            by_model = OrderedDict()
+            for name, X, future in batch:
+                by_model.setdefault(name, list()).append((X, future))
+            for name, requests in by_model.items():
+                try:
+                    registered_model = self.get(name)
+                    if len(requests) == 1:
+                        X = requests[0][0]
+                    else:
+                        X = pd.concat([X for X, future in requests], ignore_index=True)
+                    with utils.get_metrics().timer("predict_batch", model=name):
+                        yhat = registered_model.predict(X)
+                    utils.get_metrics().increment("ml_adapter_predictions_total", X.shape[0], model=name)
+                except Exception as e:
+                    for X, future in requests:
+                        future.set_exception(e)
+                    continue
+                start = 0
+                for X, future in requests:
+                    future.set_result((yhat[start:start + X.shape[0]], registered_model.version))
+                    start += X.shape[0]
+            with self.lock:
+                self.predictions += len(batch)
+                self.batches += 1
+
+    def status(self):
+        """
+        Returns the registered and loaded models and the statistics of the registry
+        Return
+            status (dictionary): e.g. {"models": {"adapter/0": {"version": 2, "loaded": True}}, "bytes": 1024}
+        """
+        with self.lock:
+            return {
+                "models": {
+                    name: {
+                        "version": self.versions[name],
+                        "loaded": name in self.models,
+                        "bytes": self.models[name].size if name in self.models else None,
+                        "independent_variables": self.sources[name][2],
+                        "dependent_variables": self.sources[name][3]
+                    }
+                    for name in self.sources
+                },
+                "bytes": sum(model.size for model in self.models.values()),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "swaps": self.swaps,
+                "predictions": self.predictions,
+                "batches": self.batches,
+                "mean_batch_size": self.predictions / max(self.batches, 1)
+            }
+
+
+def get_model_registry():
+    """
+    Returns the model registry configured by the MODEL_REGISTRY_MAX_MB, PREDICT_BATCH_DELAY_SECONDS and
+    PREDICT_MAX_BATCH_ROWS environment variables
+    Return
+        model_registry (Model_Registry): the model registry
+    """
+    global model_registry
+    with model_registry_lock:
+        if model_registry is None:
+            model_registry = Model_Registry(int(float(os.getenv("MODEL_REGISTRY_MAX_MB", "512")) * 1024 * 1024),
+                                            float(os.getenv("PREDICT_BATCH_DELAY_SECONDS", "0.005")),
+                                            int(os.getenv("PREDICT_MAX_BATCH_ROWS", "10000")))
+        return model_registry
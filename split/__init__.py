@@ -0,0 +1,5 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+from .split_methods import SPLIT_METHODS, register_split, split_dataset
+from . import hierarchical_clustering
+from . import kennard_stone
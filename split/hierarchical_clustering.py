@@ -0,0 +1,550 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import logging
+from bisect import bisect_left
+from collections import namedtuple
+from statistics import mode
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+
+from .split_methods import register_split
+
+ProtoTuple = namedtuple('ProtoTuple', ['proto_dist', 'proto_index'])
+
+# Relative difference under which two sums of distances may be equal in exact arithmetic
+TOLERANCE = 1e-9
+
+
+def tie_limit(values):
+    """
+    Returns the largest value that ties with each value
+    """
+    return values + TOLERANCE * np.abs(values)
+
+
+class Cluster():
+    """
+    This class contains all of the information for a given cluster.
+
+    Args:
+        id (int): The unique identifier of the cluster. As clusters are merged, the index increases in size.
+        previous_id (list): The pair of cluster ids that were merged into this cluster. Empty for a single sample.
+        next_id (int): The id of the cluster this cluster was merged into, -1 if it was not merged.
+        proto (ProtoTuple): This includes the proto_dist and proto_index.
+    """
+    # using slots to save time and memory
+    __slots__ = ('id', 'previous_id', 'next_id', 'proto')
+
+    def __init__(self, id: int, previous_id: list, proto: ProtoTuple) -> None:
+        self.id = id
+        self.previous_id = previous_id
+        self.next_id = -1
+        self.proto = proto
+
+
+class Minimax_Linkage():
+    """
+    Hierarchical clustering with the minimax linkage of split/hierarchical_clustering.ipynb, without a distance matrix
+
+    The linkage of two clusters is the radius around their prototype, the sample of the merged cluster with the
+    smallest sum of distances to the other samples. Instead of recomputing sub-matrices of an N x N distance matrix,
+    each sample of an active cluster keeps the sum and maximum of its distances to the samples of its cluster, which
+    are updated when clusters merge. Each nearest neighbor search then only needs the distances between the top of the
+    stack and the active samples, computed in chunks that fit in the memory budget. Memory is bounded, but each of the
+    2N searches reads the distances from the top of the stack to the N samples, so the time grows roughly with N
+    squared.
+
+    Like in the notebook, a cluster may hold a sample twice and a sample may belong to two active clusters (see
+    nearest_neighbor), so the sums and maximums are kept for each position of order rather than for each sample.
+
+    Args:
+        X (ndarray): the samples to cluster
+        memory_bytes (int): the approximate number of bytes used for blocks of distances
+    """
+
+    def __init__(self, X: np.ndarray, memory_bytes: int):
+        self.X = np.ascontiguousarray(X, dtype=np.float64)
+        self.n = self.X.shape[0]
+        self.memory_bytes = memory_bytes
+        self.has_nan = bool(np.isnan(self.X).any())
+
+        # Keep the full distance matrix when it fits in half of the memory budget
+        self.dist_matrix = None
+        if self.n * self.n * 8 <= memory_bytes // 2:
+            self.dist_matrix = self.distances(np.arange(self.n), np.arange(self.n))
+
+        # Active clusters, in the order of the notebook's active_clusters list. The samples of the active clusters are
+        # stored contiguously in order: cluster i owns order[starts[i]:starts[i] + sizes[i]]
+        self.active_ids = np.arange(self.n, dtype=np.int64)
+        self.sizes = np.ones(self.n, dtype=np.int64)
+        self.order = np.arange(self.n, dtype=np.int64)
+        self.clusters = {i: Cluster(i, [], ProtoTuple(0, i)) for i in range(self.n)}
+
+        # Sum and maximum of the distances from the sample at each position of order to the samples of its cluster
+        self.sum_in = np.zeros(self.n)
+        self.max_in = np.zeros(self.n)
+
+    def distances(self, rows: np.ndarray, columns: np.ndarray):
+        """
+        Returns the euclidean distances between two sets of samples, treating missing distances as 0 like np.nansum
+        """
+        if self.dist_matrix is not None:
+            block = self.dist_matrix[np.ix_(rows, columns)]
+        else:
+            block = cdist(self.X[rows], self.X[columns], 'euclidean')
+        if self.has_nan:
+            np.nan_to_num(block, copy=False)
+        return block
+
+    def chunk_rows(self, columns: int, arrays: int = 4):
+        """
+        Returns the number of rows of a block of distances that fits in the memory budget
+        """
+        return max(1, self.memory_bytes // (8 * max(columns, 1) * arrays))
+
+    def starts(self):
+        starts = np.zeros(len(self.sizes), dtype=np.int64)
+        np.cumsum(self.sizes[:-1], out=starts[1:])
+        return starts
+
+    def cluster_samples(self, cluster_id: int):
+        """
+        Returns the samples of a cluster, with the sum and maximum of the distances from each of them to the samples of
+        the cluster. The cluster is not active if the notebook left it on the stack after it was merged
+
+        Return:
+            position (int): the position of the cluster in the active clusters, None if it is not active
+            samples (ndarray): the samples of the cluster, in the order of the notebook's sample_indices
+            sum_in (ndarray): the sum of the distances from each sample to the samples of the cluster
+            max_in (ndarray): the maximum of the distances from each sample to the samples of the cluster
+        """
+        positions = np.flatnonzero(self.active_ids == cluster_id)
+        if len(positions) > 0:
+            position = int(positions[0])
+            start = int(self.starts()[position])
+            rows = slice(start, start + self.sizes[position])
+            return position, self.order[rows], self.sum_in[rows], self.max_in[rows]
+
+        samples = np.asarray(self.sample_indices(cluster_id), dtype=np.int64)
+        sum_in = np.zeros(len(samples))
+        max_in = np.zeros(len(samples))
+        step = self.chunk_rows(len(samples), 2)
+        for i in range(0, len(samples), step):
+            block = self.distances(samples[i:i + step], samples)
+            sum_in[i:i + step] = block.sum(axis=1)
+            max_in[i:i + step] = block.max(axis=1)
+        return None, samples, sum_in, max_in
+
+    def compare_clusters(self, top_id: int):
+        """
+        Determines the cluster that is the closest to the top of the stack
+
+        Return:
+            CompareClusterProto: the id of the closest cluster and the prototype of it merged with the top of the stack
+        """
+        starts = self.starts()
+        top_position, top_samples, top_sum, top_max = self.cluster_samples(top_id)
+        n_active = len(self.active_ids)
+
+        # For each cluster C, the sample x of the top cluster T with the smallest sum of distances to T and C
+        best_top = np.full(n_active, np.inf)
+        proto_top = np.zeros(n_active, dtype=np.int64)
+        radius_top = np.zeros(n_active)
+        ties_top = np.zeros(n_active, dtype=np.int64)
+        # For each position y of order, the sum and maximum of the distances from its sample to T
+        sum_to_top = np.zeros(len(self.order))
+        max_to_top = np.zeros(len(self.order))
+
+        step = self.chunk_rows(len(self.order))
+        columns = np.arange(n_active)
+        for i in range(0, len(top_samples), step):
+            rows = top_samples[i:i + step]
+            block = self.distances(rows, self.order)
+            row_sums = np.add.reduceat(block, starts, axis=1)
+            row_maxes = np.maximum.reduceat(block, starts, axis=1)
+            sum_to_top += block.sum(axis=0)
+            np.maximum(max_to_top, block.max(axis=0), out=max_to_top)
+
+            totals = top_sum[i:i + step][:, None] + row_sums
+            index = totals.argmin(axis=0)
+            best = totals[index, columns]
+            near = (totals <= tie_limit(best)).sum(axis=0)
+            kept = np.where(best_top <= tie_limit(best), ties_top, 0)
+            ties_top = kept + np.where(best <= tie_limit(best_top), near, 0)
+            better = best < best_top
+            best_top[better] = best[better]
+            proto_top[better] = rows[index[better]]
+            radius_top[better] = np.maximum(top_max[i + index[better]], row_maxes[index[better], columns[better]])
+
+        # For each cluster C, the sample y of C with the smallest sum of distances to T and C
+        totals = self.sum_in + sum_to_top
+        segment = np.repeat(columns, self.sizes)
+        best_other = np.minimum.reduceat(totals, starts)
+        minimum = np.flatnonzero(totals == best_other[segment])
+        first = minimum[np.r_[True, segment[minimum][1:] != segment[minimum][:-1]]]
+        proto_other = self.order[first]
+        radius_other = np.maximum(self.max_in[first], max_to_top[first])
+        ties_other = np.add.reduceat(totals <= tie_limit(best_other)[segment], starts)
+
+        # The samples of the top cluster come first in the merged cluster, so they win ties
+        use_top = best_top <= best_other
+        proto = np.where(use_top, proto_top, proto_other)
+        radius = np.where(use_top, radius_top, radius_other)
+        best = np.minimum(best_top, best_other)
+        ties = np.where(best_top <= tie_limit(best), ties_top, 0)
+        ties += np.where(best_other <= tie_limit(best), ties_other, 0)
+
+        # Sums that tie in exact arithmetic differ by rounding errors that depend on the order of the additions. Repeat
+        # the additions of the notebook for these clusters so that the same prototype is chosen. Sums of at most two
+        # distances do not depend on the order
+        if top_position is not None:
+            ties[top_position] = 0
+        for position in np.flatnonzero((ties > 1) & (self.sizes + len(top_samples) > 3)):
+            rows = slice(starts[position], starts[position] + self.sizes[position])
+            radius[position], proto[position] = self.minimax_dist(top_samples, top_sum, rows, sum_to_top[rows])
+
+        # Like the notebook, a top of the stack that is not active is compared to every active cluster
+        if top_position is not None:
+            radius[top_position] = np.inf
+        closest = int(np.argmin(radius))
+        return int(self.active_ids[closest]), ProtoTuple(radius[closest], int(proto[closest]))
+
+    def minimax_dist(self, top_samples: np.ndarray, top_sum: np.ndarray, rows: slice, sum_to_top: np.ndarray):
+        """
+        Determines the minimax radius and prototype of the top of the stack merged with a cluster, adding the distances
+        in the same order as the notebook's minimax_dist
+
+        Args:
+            top_samples (ndarray): the samples of the top of the stack
+            top_sum (ndarray): the sum of the distances from each sample of the top of the stack to the top of the stack
+            rows (slice): the positions of the cluster in order
+            sum_to_top (ndarray): the sum of the distances from each sample of the cluster to the top of the stack
+
+        Return:
+            minimax_dist (ProtoTuple): The minimax radius and prototype index as a list.
+        """
+        samples = self.order[rows]
+        step = self.chunk_rows(len(samples), 2)
+        sums = np.concatenate((top_sum, self.sum_in[rows] + sum_to_top))
+        for i in range(0, len(top_samples), step):
+            top_rows = top_samples[i:i + step]
+            sums[i:i + len(top_rows)] += self.distances(top_rows, samples).sum(axis=1)
+
+        # Only the samples whose sums tie with the minimum can be the prototype
+        cluster_index = np.concatenate((top_samples, samples))
+        candidates = np.flatnonzero(sums <= tie_limit(sums.min()))
+        block = self.distances(cluster_index[candidates], cluster_index)
+        # Each row is summed on its own like the columns of the notebook's sub-matrix
+        min_index = int(np.argmin(block.sum(axis=1)))
+        return ProtoTuple(block[min_index].max(), int(cluster_index[candidates[min_index]]))
+
+    def merge(self, new_id: int, chosen_id: int, top_id: int, proto: ProtoTuple):
+        """
+        Merges the chosen cluster and the top of the stack into a new active cluster. The samples of the chosen cluster
+        come first, followed by the samples of the top of the stack
+        """
+        starts = self.starts()
+        chosen_position = int(np.flatnonzero(self.active_ids == chosen_id)[0])
+        chosen_rows = slice(starts[chosen_position], starts[chosen_position] + self.sizes[chosen_position])
+        chosen_samples = self.order[chosen_rows]
+        chosen_sum = self.sum_in[chosen_rows].copy()
+        chosen_max = self.max_in[chosen_rows].copy()
+        top_position, top_samples, top_sum, top_max = self.cluster_samples(top_id)
+
+        # Update the sums and maximums of the distances within the merged cluster
+        step = self.chunk_rows(len(top_samples), 2)
+        top_sums = np.zeros(len(top_samples))
+        top_maxes = np.zeros(len(top_samples))
+        for i in range(0, len(chosen_samples), step):
+            block = self.distances(chosen_samples[i:i + step], top_samples)
+            chosen_sum[i:i + step] += block.sum(axis=1)
+            np.maximum(chosen_max[i:i + step], block.max(axis=1), out=chosen_max[i:i + step])
+            top_sums += block.sum(axis=0)
+            np.maximum(top_maxes, block.max(axis=0), out=top_maxes)
+
+        # Remove both clusters from the active clusters and add the merged cluster at the end. The top of the stack is
+        # not active if it was merged before
+        removed = [chosen_position] if top_position is None else [chosen_position, top_position]
+        keep = np.ones(len(self.order), dtype=bool)
+        for position in removed:
+            keep[starts[position]:starts[position] + self.sizes[position]] = False
+        self.order = np.concatenate((self.order[keep], chosen_samples, top_samples))
+        self.sum_in = np.concatenate((self.sum_in[keep], chosen_sum, top_sum + top_sums))
+        self.max_in = np.concatenate((self.max_in[keep], chosen_max, np.maximum(top_max, top_maxes)))
+        size = len(chosen_samples) + len(top_samples)
+        self.active_ids = np.append(np.delete(self.active_ids, removed), new_id)
+        self.sizes = np.append(np.delete(self.sizes, removed), size)
+        self.clusters[new_id] = Cluster(new_id, [chosen_id, top_id], proto)
+
+    def nearest_neighbor(self):
+        """
+        Performs hierarchical clustering with the nearest neighbor chain algorithm of the notebook
+
+        Minimax linkage is not reducible, so the chosen cluster is not always the one below the top of the stack. Like
+        the notebook, the top two clusters of the stack are still retired when the top is merged with the chosen
+        cluster: the cluster below the top stays active, and the chosen cluster stays on the stack. Once that cluster
+        is the top of the stack again, it is merged with the closest active cluster, which may already hold its
+        samples. The notebook counts one active cluster less for each merge, so the loop ends after n - 1 merges.
+
+        Return:
+            retired_clusters (Cluster list): A list of all of the clusters obtained by prototypical clustering.
+        """
+        stack = list()
+        retired_clusters = list()
+        num_clusters = self.n
+        len_active_clusters = self.n
+        while len_active_clusters > 1:
+            if len(stack) == 0:
+                stack.append(int(self.active_ids[0]))
+
+            chosen_id, proto = self.compare_clusters(stack[-1])
+            if chosen_id in stack:
+                # merge closest and last stack
+                num_clusters += 1
+                self.merge(num_clusters, chosen_id, stack[-1], proto)
+                # remove the top two clusters from the stack
+                self.clusters[stack[-1]].next_id = num_clusters
+                self.clusters[stack[-2]].next_id = num_clusters
+                retired_clusters.append(self.clusters[stack.pop()])
+                retired_clusters.append(self.clusters[stack.pop()])
+                len_active_clusters -= 1
+            else:
+                stack.append(chosen_id)
+
+        retired_clusters.append(self.clusters[int(self.active_ids[0])])
+        return retired_clusters
+
+    def sample_indices(self, cluster_id: int):
+        """
+        Returns the samples of a cluster in the order of the notebook's Cluster.sample_indices
+        """
+        indices = list()
+        pending = [cluster_id]
+        while pending:
+            cluster = self.clusters[pending.pop()]
+            if cluster.previous_id:
+                # Visit the chosen cluster before the top of the stack
+                pending.append(cluster.previous_id[1])
+                pending.append(cluster.previous_id[0])
+            else:
+                indices.append(cluster.id)
+        return indices
+
+
+def get_clusters(retired_clusters: list, k_clusters: int):
+    """
+    This function cuts the tree to a specified number of clusters
+
+    Args:
+        retired_clusters (Cluster list): A list of all of the clusters obtained by prototypical clustering.
+        k_clusters (int): the number of clusters desired
+
+    Return:
+        clusters (Cluster list): A list of chosen clusters after cutting of the tree
+    """
+    # The positions of each cluster id. The notebook retires a cluster again if it was below the top of the stack
+    positions = dict()
+    for i, cluster in enumerate(retired_clusters):
+        positions.setdefault(cluster.id, list()).append(i)
+    remaining = len(retired_clusters)
+    clusters = list()
+    cluster_options = list()
+    while len(clusters) < k_clusters:
+        if remaining == 0:
+            error = "cannot cut the tree into {0} clusters".format(k_clusters)
+            raise ValueError(error)
+        # Delete last cluster in retired clusters
+        remaining -= 1
+        retired_clust = retired_clusters[remaining]
+        # Add previous ids clusters to cluster options list
+        for previous_id in retired_clust.previous_id:
+            # The last one before the deleted cluster, as the notebook searches the list in reverse
+            j = bisect_left(positions.get(previous_id, []), remaining) - 1
+            if j >= 0:
+                cluster_options.append(retired_clusters[positions[previous_id][j]])
+        if not cluster_options:
+            error = "cannot cut the tree into {0} clusters".format(k_clusters)
+            raise ValueError(error)
+
+        # Pick the cluster with the max distance, the first one on ties
+        max_index = None
+        for i in range(len(cluster_options)):
+            if max_index is None or cluster_options[max_index].proto[0] < cluster_options[i].proto[0]:
+                max_index = i
+        clusters.append(cluster_options.pop(max_index))
+    return clusters
+
+
+def prune_clusters(linkage: Minimax_Linkage, clusters: list):
+    """
+    This function prunes clusters to contain unique sample indices for every cluster (no repeats)
+
+    Return:
+        pruned_clusters (list): (Cluster, sample indices) of each cluster where each sample belongs to one cluster
+        prototype_ids (integer list): A list of row indices of the prototype (center point in a cluster)
+    """
+    pruned_clusters = list()
+    assigned = np.zeros(linkage.n, dtype=bool)
+    # Order the clusters by id
+    for clust in sorted(clusters, key=lambda cluster: cluster.id):
+        sample_indices = np.asarray(linkage.sample_indices(clust.id), dtype=np.int64)
+        sample_indices = sample_indices[~assigned[sample_indices]]
+        if len(sample_indices) > 0:
+            assigned[sample_indices] = True
+            pruned_clusters.append((clust, sample_indices))
+    prototype_ids = [clust.proto[1] for clust, sample_indices in pruned_clusters]
+    return pruned_clusters, prototype_ids
+
+
+def assign_clusters(dataset: np.ndarray, sample_index: np.ndarray, clusters: list, memory_bytes: int):
+    """
+    This function assigns each row in the dataset to a cluster. The sampled rows keep the cluster they were clustered
+    into, and the other rows are assigned to the cluster with the closest prototype
+
+    Return:
+        prototype_id (ndarray): the sample index of the prototype assigned to each row in the dataset
+        assigned_id (ndarray): the position of the cluster assigned to each row in the dataset
+    """
+    N_dataset = dataset.shape[0]
+    cluster_id = np.zeros(N_dataset, dtype=np.int64)
+    prototype_id = np.zeros(N_dataset, dtype=np.int64)
+    assigned_id = np.zeros(N_dataset, dtype=np.int64)
+
+    # Populate array with predetermined cluster assignments by prototypical clustering
+    for i, (clust, sample_indices) in enumerate(clusters):
+        rows = sample_index[sample_indices]
+        cluster_id[rows] = clust.id
+        prototype_id[rows] = clust.proto[1]
+        assigned_id[rows] = i
+
+    # Assign a prototype with the minimum distance to the unassigned rows, in chunks of rows
+    prototypes = dataset[sample_index[[clust.proto[1] for clust, sample_indices in clusters]], :]
+    unassigned = np.flatnonzero((cluster_id == 0) & (prototype_id == 0) & (assigned_id == 0))
+    step = max(1, memory_bytes // (8 * max(len(clusters), 1) * 2))
+    for i in range(0, len(unassigned), step):
+        rows = unassigned[i:i + step]
+        minimum_distance = np.argmin(cdist(dataset[rows], prototypes, 'sqeuclidean'), axis=1)
+        prototype_id[rows] = [clusters[j][0].proto[1] for j in minimum_distance]
+        assigned_id[rows] = minimum_distance
+    return prototype_id, assigned_id
+
+
+def get_training_testing_sets(X: np.ndarray, n_dataset: int, prototype_ids: list, prototype_id: np.ndarray,
+                              assigned_id: np.ndarray, test_size: float):
+    """
+    This function assigns clusters to the training and testing set, following the notebook
+
+    Return:
+        train_index (ndarray): the row positions of the training set
+        test_index (ndarray): the row positions of the testing set
+    """
+    test_index = list()
+    training_set_clusters = list()
+    testing_set_clusters = list()
+    testing_percent = 0.0
+
+    # Determine the cluster that is furthest distance away from all other clusters
+    iterations = 0
+    while not testing_set_clusters:
+        subset_prototype_ids = list(set(prototype_ids) - set(training_set_clusters))
+        prototype_dist = cdist(X[subset_prototype_ids], X[subset_prototype_ids], 'euclidean')
+        max_distance = np.argmax(prototype_dist, axis=1)
+        max_dist_id = prototype_ids[mode(max_distance.tolist())]
+
+        # Get the cluster from the dataset
+        max_dist_indices = np.flatnonzero(prototype_id == max_dist_id)
+        cluster_percentage = float(len(max_dist_indices)) / n_dataset
+
+        # Find a cluster whose size is less than the testing size
+        if cluster_percentage < test_size:
+            test_index.extend(max_dist_indices.tolist())
+            testing_set_clusters.append(max_dist_id)
+            testing_percent = float(len(test_index)) / n_dataset
+        else:
+            prototype_ids.remove(max_dist_id)
+            training_set_clusters.append(max_dist_id)
+
+        # Catch if infinite loop
+        iterations += 1
+        if iterations > len(prototype_ids):
+            break
+
+    assigned_indices = list()
+    for index, val in enumerate(prototype_ids):
+        for clust in training_set_clusters:
+            if val == clust:
+                assigned_indices.append(index)
+        for clust in testing_set_clusters:
+            if val == clust:
+                assigned_indices.append(index)
+
+    # Add clusters to the testing set until bigger than the testing size
+    iterations = 0
+    while testing_percent < test_size and assigned_indices:
+        # Find prototype with the minimum distance from other prototypes in the testing set
+        test_prototype_dist = cdist(X[assigned_indices], X[prototype_ids], 'euclidean')
+        test_prototype_dist[:, assigned_indices] = 1e10
+        minimum_index = np.unravel_index(np.argmin(test_prototype_dist, axis=None), test_prototype_dist.shape)
+
+        # Add the prototype cluster that is the closest distance to the previously selected prototypes
+        min_dist_indices = np.flatnonzero(assigned_id == minimum_index[1])
+        test_index.extend(min_dist_indices.tolist())
+        testing_percent = float(len(test_index)) / n_dataset
+        assigned_indices.append(int(minimum_index[1]))
+
+        # Catch if infinite loop
+        iterations += 1
+        if iterations > len(prototype_ids):
+            break
+
+    # Assign the other rows to the training set
+    test_index = np.asarray(test_index, dtype=np.int64)
+    train_index = np.setdiff1d(np.arange(n_dataset), test_index)
+    return train_index, test_index
+
+
+@register_split("hierarchical_clustering")
+def hierarchical_clustering_split(dataset: pd.DataFrame, params: dict):
+    """
+    Splits the dataset by clustering a sample of N rows with minimax linkage, assigning every row to the cluster with
+    the closest prototype, and then choosing clusters for the testing set until it reaches test_size
+
+    Args
+        params (dictionary): N, the number of rows clustered; max_clusters, the number of clusters; test_size, the
+            approximate decimal percentage of the testing set; memory_mb (optional), the memory budget in megabytes for
+            blocks of distances, 512 by default. The clustering time grows roughly with N squared, e.g. 15 seconds for
+            4000 rows, so N should stay at a few thousand rows even for a dataset of 100000 rows or more
+    """
+    N = params["N"]
+    max_clusters = params["max_clusters"]
+    test_size = params["test_size"]
+    memory_bytes = int(params.get("memory_mb", 512) * 1024 * 1024)
+
+    # Filter dataset to contain only numeric columns
+    dataset_numeric = dataset.select_dtypes(include=[np.number, bool])
+    dataset_array = dataset_numeric.to_numpy(dtype=np.float64)
+    n_dataset = dataset_array.shape[0]
+
+    # Cluster a random sample of the rows
+    if n_dataset > N:
+        sample_index = pd.Series(np.arange(n_dataset)).sample(n=N, random_state=1).to_numpy()
+    else:
+        sample_index = np.arange(n_dataset)
+    X = dataset_array[sample_index]
+
+    linkage = Minimax_Linkage(X, memory_bytes)
+    retired_clusters = linkage.nearest_neighbor()
+    logging.info('Hierarchical clustering of ' + str(len(sample_index)) + ' samples completed')
+
+    # Cut the tree to a specified number of clusters
+    clusters = get_clusters(retired_clusters, max_clusters)
+
+    # Prunes clusters to contain unique sample indices for every cluster (no repeats)
+    pruned_clusters, prototype_ids = prune_clusters(linkage, clusters)
+
+    # Assign each row in the dataset to a cluster
+    prototype_id, assigned_id = assign_clusters(dataset_array, sample_index, pruned_clusters, memory_bytes)
+
+    # Assign clusters to the training and testing set
+    return get_training_testing_sets(X, n_dataset, prototype_ids, prototype_id, assigned_id, test_size)
@@ -0,0 +1,227 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import cdist
+
+from .split_methods import register_split
+
+
+class R_Random():
+    """
+    The Mersenne-Twister random number generator of R, to draw the same samples as set.seed and sample in R (>= 3.6)
+
+    Args:
+        seed (int): the seed passed to set.seed
+    """
+
+    def __init__(self, seed: int):
+        # Initial scrambling of the seed with the linear congruential generator of R's set.seed
+        seed = seed & 0xFFFFFFFF
+        for j in range(50):
+            seed = (69069 * seed + 1) & 0xFFFFFFFF
+        key = np.zeros(625, dtype=np.uint32)
+        for j in range(625):
+            seed = (69069 * seed + 1) & 0xFFFFFFFF
+            key[j] = seed
+        # The first value is the position of R's generator, which starts by generating new numbers
+        self.bit_generator = np.random.MT19937()
+        self.bit_generator.state = {'bit_generator': 'MT19937', 'state': {'key': key[1:], 'pos': 624}}
+
+    def unif_rand(self):
+        """
+        Returns a uniform random number in (0, 1) like R's unif_rand
+        """
+        value = int(self.bit_generator.random_raw()) * 2.3283064365386963e-10
+        if value <= 0.0:
+            return 0.5 * 2.328306437080797e-10
+        if 1.0 - value <= 0.0:
+            return 1.0 - 0.5 * 2.328306437080797e-10
+        return value
+
+    def unif_index(self, dn: int):
+        """
+        Returns a random integer in [0, dn) with the rejection sampling of R's R_unif_index
+        """
+        if dn <= 0:
+            return 0
+        bits = int(math.ceil(math.log2(dn)))
+        while True:
+            v = 0
+            for n in range(0, bits + 1, 16):
+                v = 65536 * v + int(math.floor(self.unif_rand() * 65536))
+            dv = v & ((1 << bits) - 1)
+            if dn > dv:
+                return dv
+
+    def sample(self, n: int, size: int):
+        """
+        Returns size positions in [0, n) sampled without replacement like R's sample(n, size), minus 1
+        """
+        x = np.arange(n, dtype=np.int64)
+        y = np.zeros(size, dtype=np.int64)
+        for i in range(size):
+            j = self.unif_index(n)
+            y[i] = x[j]
+            n -= 1
+            x[j] = x[n]
+        return y
+
+
+class Kennard_Stone():
+    """
+    The Kennard-Stone algorithm of prospectr::kenStone with the euclidean metric, without a distance matrix
+
+    The two samples furthest apart are selected first. Each next sample is the one whose distance to its closest
+    selected sample is the largest. The distance from each sample to its closest selected sample is kept in a vector
+    and updated with the distances to the last selected sample only, computed in blocks of rows. Ties go to the first
+    sample like which.max in R.
+
+    Args:
+        X (ndarray): the samples
+        memory_bytes (int): the approximate number of bytes used for blocks of distances
+        workers (int): the number of threads computing blocks of distances
+    """
+
+    def __init__(self, X: np.ndarray, memory_bytes: int, workers: int = 1):
+        # prospectr centers the samples by default
+        X = np.asarray(X, dtype=np.float64)
+        self.X = np.ascontiguousarray(X - X.mean(axis=0))
+        self.m = self.X.shape[0]
+        self.columns = np.ascontiguousarray(self.X.T)
+        self.squared_norms = np.einsum('ij,ij->i', self.X, self.X)
+        self.memory_bytes = memory_bytes
+        self.workers = max(1, workers)
+        self.executor = None
+
+    def blocks(self, step: int):
+        """
+        Returns the slices of rows of each block
+        """
+        return [slice(i, min(i + step, self.m)) for i in range(0, self.m, step)]
+
+    def map(self, function, blocks: list):
+        """
+        Calls a function on each block, on a thread pool if there is more than one worker
+        """
+        if self.executor is None or len(blocks) == 1:
+            return [function(block) for block in blocks]
+        return list(self.executor.map(function, blocks))
+
+    def furthest_pair(self):
+        """
+        Returns the two samples with the largest distance, in the order of arrayInd(which.max(D)) in R: the first
+        maximum of the distance matrix D in column-major order
+        """
+        step = max(1, self.memory_bytes // (8 * max(self.m, 1) * self.workers))
+
+        # Screen the rows with matrix products, |x - y|^2 = |x|^2 + |y|^2 - 2 x.y, up to rounding errors
+        def furthest(block):
+            distances = -2 * (self.X[block] @ self.X.T)
+            distances += self.squared_norms[block][:, None]
+            distances += self.squared_norms[None, :]
+            return distances.max(axis=1)
+
+        row_maxes = np.concatenate(self.map(furthest, self.blocks(step)))
+        error = 1e-9 * 2 * self.squared_norms.max()
+        candidates = np.flatnonzero(row_maxes >= row_maxes.max() - 2 * error)
+
+        # Compute the exact distances of the rows that may hold the maximum
+        pair = None
+        for i in range(0, len(candidates), step):
+            rows = candidates[i:i + step]
+            distances = cdist(self.X[rows], self.X, 'sqeuclidean')
+            column, row = np.unravel_index(np.argmax(distances), distances.shape)
+            if pair is None or distances[column, row] > pair[0]:
+                pair = (distances[column, row], rows[column], row)
+        return [int(pair[2]), int(pair[1])]
+
+    def select(self, k: int):
+        """
+        Selects k samples
+
+        Return:
+            model (ndarray): the selected samples in the order of selection
+            test (ndarray): the other samples in ascending order
+        """
+        k = min(k, self.m)
+        self.executor = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            model = self.furthest_pair()[:k] if self.m > 1 else list(range(k))
+            # Squared distance from each sample to its closest selected sample, -inf for the selected samples
+            min_distances = np.full(self.m, np.inf)
+            min_distances[model] = -np.inf
+            blocks = self.blocks(-(-self.m // self.workers))
+
+            def update(block, selected):
+                # Add the squared differences feature by feature, which reads contiguous columns of the samples
+                distances = np.zeros(block.stop - block.start)
+                squares = np.empty(block.stop - block.start)
+                for sample in selected:
+                    distances[:] = 0
+                    for feature, column in enumerate(self.columns):
+                        np.subtract(column[block], self.X[sample, feature], out=squares)
+                        squares *= squares
+                        distances += squares
+                    np.minimum(min_distances[block], distances, out=min_distances[block])
+                index = int(np.argmax(min_distances[block]))
+                return min_distances[block][index], block.start + index
+
+            selected = model
+            while len(model) < k:
+                furthest = None
+                for distance, index in self.map(lambda block: update(block, selected), blocks):
+                    if furthest is None or distance > furthest[0]:
+                        furthest = (distance, index)
+                model.append(furthest[1])
+                min_distances[furthest[1]] = -np.inf
+                selected = model[-1:]
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.executor = None
+
+        model = np.asarray(model, dtype=np.int64)
+        return model, np.setdiff1d(np.arange(self.m), model)
+
+
+@register_split("kennard_stone")
+def kennard_stone_split(dataset: pd.DataFrame, params: dict):
+    """
+    Splits the dataset with the Kennard-Stone algorithm. The training set is composed of the k selected rows of a
+    random sample of N rows, drawn like the notebook with set.seed(10000) in R
+
+    Args
+        params (dictionary): N, the number of rows sampled; k, the number of rows in the training set, scaled by the
+            number of rows over N if the dataset has fewer than N rows; memory_mb (optional), the memory budget in
+            megabytes for blocks of distances, 512 by default; workers (optional), the number of threads, 1 by default
+    """
+    N = params["N"]
+    k = params["k"]
+    memory_bytes = int(params.get("memory_mb", 512) * 1024 * 1024)
+    workers = int(params.get("workers", 1))
+
+    # Filter dataset to contain only numeric columns. Like is.numeric in R, logical columns are left out
+    dataset_array = dataset.select_dtypes(include=[np.number]).to_numpy(dtype=np.float64)
+    n_dataset = dataset_array.shape[0]
+
+    # Take a sample of the dataset
+    if n_dataset > N:
+        sample_index = R_Random(10000).sample(n_dataset, N)
+    else:
+        sample_index = np.arange(n_dataset)
+
+    # Determine k proportionately if N is greater than the rows of the sample
+    if N > len(sample_index):
+        k = math.ceil(len(sample_index) * (k / N))
+
+    model, test = Kennard_Stone(dataset_array[sample_index], memory_bytes, workers).select(k)
+    logging.info('Kennard-Stone selected ' + str(len(model)) + ' of ' + str(len(sample_index)) + ' samples')
+
+    # The rows that were not sampled are part of the testing set
+    train_index = sample_index[model]
+    test_index = np.setdiff1d(np.arange(n_dataset), train_index)
+    return train_index, test_index
@@ -0,0 +1,88 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import logging
+import numpy as np
+import pandas as pd
+
+# Registry of split methods by name e.g. {"random": random_split}
+SPLIT_METHODS = dict()
+
+
+def register_split(name: str):
+    """
+    Registers a function as a split method. The function is called with the dataset and the parameters of the split
+    method from the SPLIT environment variable, and returns the row positions of the training and testing sets
+
+    Args
+        name (string): the name of the split method used in SPLIT_METHOD e.g. random
+    """
+
+    def decorator(function):
+        SPLIT_METHODS[name] = function
+        return function
+
+    return decorator
+
+
+def split_dataset(method: str, dataset: pd.DataFrame, params: dict or None):
+    """
+    Splits a dataset into training and testing sets with a registered split method
+
+    Args
+        method (string): the name of the split method e.g. none, random, sequential
+        dataset (DataFrame): the dataset to split
+        params (dictionary): the parameters of the split method from the SPLIT environment variable
+    Return
+        train_index (ndarray): the row positions of the training set
+        test_index (ndarray): the row positions of the testing set
+    """
+    if method not in SPLIT_METHODS:
+        error = 'Unknown split method: \'{0}\'. Choose one of {1}'.format(method, ", ".join(SPLIT_METHODS))
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    train_index, test_index = SPLIT_METHODS[method](dataset, params)
+    return np.asarray(train_index, dtype=np.int64), np.asarray(test_index, dtype=np.int64)
+
+
+@register_split("none")
+def none_split(dataset: pd.DataFrame, params: None):
+    """
+    Does not split the dataset. The entire dataset becomes the training set
+    """
+    return np.arange(dataset.shape[0]), np.array([], dtype=np.int64)
+
+
+@register_split("random")
+def random_split(dataset: pd.DataFrame, params: dict):
+    """
+    Splits the dataset into random training and testing sets
+
+    Args
+        params (dictionary): test_size, a decimal percentage of the dataset or the absolute number of test samples.
+            Optionally, random_state to make the split reproducible
+    """
+    from sklearn.model_selection import train_test_split
+    train_index, test_index = train_test_split(np.arange(dataset.shape[0]),
+                                               test_size=params["test_size"],
+                                               random_state=params.get("random_state"))
+    return train_index, test_index
+
+
+@register_split("sequential")
+def sequential_split(dataset: pd.DataFrame, params: dict):
+    """
+    Splits the dataset sequentially. The testing set is composed of the last rows of the dataset
+
+    Args
+        params (dictionary): test_size with N, the number of test samples if the dataset has more than N rows,
+            and percent, the percentage of test samples otherwise
+    """
+    rows = dataset.shape[0]
+    test_size_N = params["test_size"]["N"]
+    test_size_percent = params["test_size"]["percent"]
+
+    if rows > test_size_N:
+        train_rows = rows - test_size_N
+    else:
+        train_rows = int(rows * (1 - test_size_percent))
+    return np.arange(train_rows), np.arange(train_rows, rows)
@@ -1,4 +1,36 @@
-# Copyright 2021, Battelle Energy Alliance, LLC
-
-from .validate import validate_extension, validate_paths_exist
-from .run_jupyter_notebook import run_jupyter_notebook
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import importlib
+
+# The names of the package and their modules. A module is imported when one of its names is first used, so that
+# importing utils e.g. for validate_paths_exist does not import pandas and Jupyter
+EXPORTS = {
+    "validate_extension": "validate",
+    "validate_paths_exist": "validate",
+    "run_jupyter_notebook": "run_jupyter_notebook",
+    "Kernel_Pool": "kernel_pool",
+    "get_kernel_pool": "kernel_pool",
+    "dataset_format": "dataset_io",
+    "dataset_file": "dataset_io",
+    "read_dataset": "dataset_io",
+    "read_dataset_chunks": "dataset_io",
+    "write_dataset": "dataset_io",
+    "Stage_Cache": "stage_cache",
+    "get_stage_cache": "stage_cache",
+    "Metrics": "metrics",
+    "get_metrics": "metrics"
+}
+
+
+def __getattr__(name: str):
+    """
+    Imports a name of the package, or a module of the package e.g. utils.dataset_io, when first used
+    """
+    if name in EXPORTS:
+        value = getattr(importlib.import_module("." + EXPORTS[name], __name__), name)
+    elif name in EXPORTS.values():
+        value = importlib.import_module("." + name, __name__)
+    else:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    globals()[name] = value
+    return value
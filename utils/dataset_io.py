@@ -0,0 +1,145 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import logging
+import pandas as pd
+
+# Extension of the files of each dataset format
+DATASET_FORMATS = {
+    'csv': '.csv',
+    'feather': '.feather',
+}
+
+
+def dataset_format():
+    """
+    Returns the format of the datasets exchanged between the pipeline stages, configured by the DATASET_FORMAT
+    environment variable: csv (default) or feather (Arrow IPC)
+    """
+    format = os.getenv("DATASET_FORMAT", "csv").strip().lower() or "csv"
+    if format not in DATASET_FORMATS:
+        error = 'Unknown dataset format: \'{0}\'. Choose one of {1}'.format(format, ", ".join(DATASET_FORMATS))
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    return format
+
+
+def memory_map():
+    """
+    Returns True if Arrow IPC files are memory-mapped when read, configured by the DATASET_MEMORY_MAP environment
+    variable. The columns of a memory-mapped file are read from the page cache without a copy
+    """
+    return os.getenv("DATASET_MEMORY_MAP", "false").strip().lower() in ("true", "1", "yes")
+
+
+def dataset_file(name: str, directory: str = "data"):
+    """
+    Returns the path of a dataset in the dataset format
+    Args
+        name (string): the name of the dataset without extension e.g. training_set
+        directory (string): the directory of the dataset
+    Return
+        file_path (string): the path of the dataset e.g. data/training_set.feather
+    """
+    return os.path.join(directory, name + DATASET_FORMATS[dataset_format()])
+
+
+def import_pyarrow():
+    """
+    Imports pyarrow, an optional dependency needed by the feather and parquet formats (poetry install -E arrow)
+    """
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        error = 'Feather and parquet files require pyarrow. Install it with: poetry install -E arrow'
+        logging.getLogger(__name__).error('{0}: {1}'.format('ImportError', error))
+        raise ImportError(error) from e
+    return pyarrow
+
+
+def write_dataset(dataset: pd.DataFrame or pd.Series, file_path: str, index: bool = True):
+    """
+    Writes a dataset in the format of its extension (.csv or .feather)
+    Args
+        dataset (DataFrame or Series): the dataset to write
+        file_path (string): the path of the dataset, see dataset_file
+        index (boolean): whether the index of the dataset is written
+    """
+    if os.path.splitext(file_path)[1].lower() == DATASET_FORMATS['feather']:
+        pyarrow = import_pyarrow()
+        if isinstance(dataset, pd.Series):
+            dataset = dataset.to_frame()
+        table = pyarrow.Table.from_pandas(dataset, preserve_index=index)
+        # Compressed files cannot be memory-mapped without a copy
+        compression = 'uncompressed' if memory_map() else None
+        pyarrow.feather.write_feather(table, file_path, compression=compression)
+    else:
+        dataset.to_csv(file_path, index=index)
+
+
+def read_dataset(file_path: str, columns: list = None, index_col: int = None):
+    """
+    Reads a dataset in the format of its extension (.csv or .feather). Feather files are memory-mapped if
+    DATASET_MEMORY_MAP is true
+
+    Example in a Jupyter Notebook
+        import utils
+        X_train = utils.read_dataset(utils.dataset_file('X_train', data.get("WORKSPACE", "data")), index_col=0)
+    Args
+        file_path (string): the path of the dataset, see dataset_file
+        columns (list): the columns to read. All columns if None
+        index_col (integer): the column of a .csv file used as index. Feather files restore the written index
+    Return
+        dataset (DataFrame): the dataset
+    """
+    if os.path.splitext(file_path)[1].lower() == DATASET_FORMATS['feather']:
+        pyarrow = import_pyarrow()
+        mapped = memory_map()
+        if columns is not None:
+            # Keep the written index, stored as columns of the Arrow table
+            with pyarrow.ipc.open_file(file_path) as reader:
+                schema = reader.schema
+            index_columns = [
+                column for column in (schema.pandas_metadata or dict()).get('index_columns', list())
+                if isinstance(column, str)
+            ]
+            columns = list(columns) + [column for column in index_columns if column not in columns]
+        table = pyarrow.feather.read_table(file_path, columns=columns, memory_map=mapped)
+        # One block per column, so that columns of a memory-mapped file are not copied into a consolidated block
+        return table.to_pandas(split_blocks=mapped)
+    if columns is None:
+        return pd.read_csv(file_path, index_col=index_col)
+    if index_col is not None:
+        return pd.read_csv(file_path, index_col=index_col).loc[:, columns]
+    return pd.read_csv(file_path, usecols=columns).loc[:, columns]
+
+
+def read_dataset_chunks(file_path: str, chunk_rows: int, columns: list = None):
+    """
+    Reads a dataset in chunks of rows, so that memory does not grow with the size of the dataset. Only the columns are
+    read. The record batches of feather files are memory-mapped and sliced without a copy
+    Args
+        file_path (string): the path of the dataset, see dataset_file
+        chunk_rows (integer): the maximum number of rows of a chunk
+        columns (list): the columns to read, in order. All columns if None
+    Return
+        chunks (generator): the chunks of the dataset (DataFrame), in order
+    """
+    chunk_rows = max(1, chunk_rows)
+    if os.path.splitext(file_path)[1].lower() == DATASET_FORMATS['feather']:
+        pyarrow = import_pyarrow()
+        with pyarrow.memory_map(file_path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for start in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(start, chunk_rows).to_pandas()
+        return
+    with pd.read_csv(file_path, usecols=columns, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk if columns is None else chunk.loc[:, columns]
@@ -0,0 +1,218 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import json
+import atexit
+import logging
+import threading
+import time
+from jupyter_client import KernelManager
+
+# Code run in a pooled kernel before each notebook: clears the user namespace and changes to the notebook directory
+RESET_CODE = {
+    'python3': '%reset -f\nimport os as _os\n_os.chdir({path})\ndel _os',
+    'ir': 'rm(list = ls(all.names = TRUE))\nsetwd({path})',
+}
+
+
+def environment_code(kernel: str, env: dict):
+    """
+    Returns the code that sets environment variables in a kernel
+    Args
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+        env (dictionary): the values of the environment variables, None to unset a variable
+    """
+    if kernel == 'ir':
+        code = list()
+        unset = [json.dumps(key) for key, value in env.items() if value is None]
+        values = [json.dumps(key) + ' = ' + json.dumps(value) for key, value in env.items() if value is not None]
+        if unset:
+            code.append('Sys.unsetenv(c(' + ', '.join(unset) + '))')
+        if values:
+            code.append('Sys.setenv(' + ', '.join(values) + ')')
+        return '\n'.join(code)
+    return ('import os as _os\n'
+            'for _key, _value in {0!r}.items():\n'
+            '    _os.environ.pop(_key, None) if _value is None else _os.environ.__setitem__(_key, _value)\n'
+            'del _os, _key, _value').format(env)
+
+
+kernel_pool = None
+kernel_pool_lock = threading.Lock()
+
+
+class Kernel_Pool():
+    """
+    Keeps started Jupyter kernels warm between notebook executions
+
+        1. A kernel is leased by kernel name e.g. python3, ir. An idle kernel is reused, otherwise a new kernel is started
+        2. Before a leased kernel is used, it is checked for a heartbeat and its namespace is reset. Environment
+           variables set for the previous notebook are restored to the values of this process
+        3. Returned kernels are kept up to the pool size per kernel name and shut down after being idle
+
+    Args
+        size (integer): the maximum number of idle kernels kept per kernel name
+        idle_seconds (float): the number of seconds an idle kernel is kept before it is shut down
+        timeout (float): the number of seconds to wait for a kernel to respond to a health check or reset
+    """
+
+    def __init__(self, size: int, idle_seconds: float, timeout: float = 60):
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+        self.kernels = dict()
+        # Names of the environment variables set in each kernel by env
+        self.environments = dict()
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+        # Daemon: shuts down idle kernels in the background
+        self.reaper = threading.Thread(target=self.reap, daemon=True, name="kernel_pool_reaper")
+        self.reaper.start()
+
+    def acquire(self, kernel: str, path: str, env: dict = None):
+        """
+        Leases a kernel whose namespace is reset and whose working directory is the notebook directory
+        Args
+            kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+            path (string): the directory of the Jupyter Notebook
+            env (dictionary): environment variables to set in the kernel, in addition to the environment of this process
+        Return
+            km (KernelManager): a started kernel
+        """
+        self.evict()
+        while True:
+            with self.lock:
+                idle = self.kernels.get(kernel, list())
+                km = idle.pop()[0] if idle else None
+            if km is None:
+                break
+            if self.reset(km, kernel, path, env):
+                return km
+            logging.warning('Discarding unhealthy ' + kernel + ' kernel')
+            self.shutdown_kernel(km)
+
+        # No idle kernel of this name is available
+        km = KernelManager(kernel_name=kernel)
+        km.start_kernel(cwd=path, env={**os.environ, **(env or dict())})
+        with self.lock:
+            self.environments[km] = set(env or dict())
+        return km
+
+    def release(self, kernel: str, km: KernelManager, healthy: bool = True):
+        """
+        Returns a leased kernel to the pool
+        Args
+            kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+            km (KernelManager): the leased kernel
+            healthy (boolean): False if the kernel should be shut down instead of reused
+        """
+        with self.lock:
+            idle = self.kernels.setdefault(kernel, list())
+            if healthy and len(idle) < self.size and not self.stop.is_set():
+                idle.append((km, time.time()))
+                return
+        self.shutdown_kernel(km)
+
+    def reset(self, km: KernelManager, kernel: str, path: str, env: dict = None):
+        """
+        Checks that a kernel is alive, clears its namespace and sets its environment variables
+        Args
+            km (KernelManager): the kernel to reset
+            kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+            path (string): the directory of the Jupyter Notebook
+            env (dictionary): environment variables to set in the kernel, in addition to the environment of this process
+        Return
+            healthy (boolean): whether the kernel responded and the reset succeeded
+        """
+        if not km.is_alive():
+            return False
+        kc = km.client()
+        try:
+            kc.start_channels()
+            kc.wait_for_ready(timeout=self.timeout)
+            code = RESET_CODE[kernel].format(path=json.dumps(path))
+
+            # Restore the variables set for the previous notebook before setting the new ones
+            with self.lock:
+                previous = self.environments.get(km, set())
+            variables = {key: os.environ.get(key) for key in previous}
+            variables.update(env or dict())
+            if variables:
+                code += '\n' + environment_code(kernel, variables)
+
+            reply = kc.execute_interactive(code,
+                                           timeout=self.timeout,
+                                           store_history=False,
+                                           output_hook=lambda msg: None)
+            if reply["content"]["status"] != "ok":
+                return False
+            with self.lock:
+                self.environments[km] = set(env or dict())
+            return True
+        except Exception as e:
+            logging.warning('Kernel health check failed: ' + str(e))
+            return False
+        finally:
+            kc.stop_channels()
+
+    def evict(self):
+        """
+        Shuts down the kernels that have been idle for longer than idle_seconds
+        """
+        now = time.time()
+        expired = list()
+        with self.lock:
+            for kernel, idle in self.kernels.items():
+                expired.extend(km for km, last_used in idle if now - last_used > self.idle_seconds)
+                idle[:] = [(km, last_used) for km, last_used in idle if now - last_used <= self.idle_seconds]
+        for km in expired:
+            self.shutdown_kernel(km)
+
+    def reap(self):
+        """
+        Evicts idle kernels until the pool is shut down
+        """
+        while not self.stop.wait(max(self.idle_seconds / 2, 1)):
+            self.evict()
+
+    def shutdown(self):
+        """
+        Shuts down all idle kernels. Kernels that are leased are shut down when they are released
+        """
+        self.stop.set()
+        with self.lock:
+            kernels = [km for idle in self.kernels.values() for km, last_used in idle]
+            self.kernels = dict()
+        for km in kernels:
+            self.shutdown_kernel(km)
+
+    def shutdown_kernel(self, km: KernelManager):
+        """
+        Shuts down a kernel, ignoring kernels that already died
+        Args
+            km (KernelManager): the kernel to shut down
+        """
+        with self.lock:
+            self.environments.pop(km, None)
+        try:
+            km.shutdown_kernel(now=True)
+        except Exception as e:
+            logging.warning('Error shutting down kernel: ' + str(e))
+
+
+def get_kernel_pool():
+    """
+    Returns the kernel pool configured by the KERNEL_POOL_SIZE and KERNEL_POOL_IDLE_SECONDS environment variables
+    Return
+        kernel_pool (Kernel_Pool): the kernel pool, or None if KERNEL_POOL_SIZE is 0 or not set
+    """
+    global kernel_pool
+    size = int(os.getenv("KERNEL_POOL_SIZE", "0"))
+    if size <= 0:
+        return None
+    with kernel_pool_lock:
+        if kernel_pool is None:
+            kernel_pool = Kernel_Pool(size, float(os.getenv("KERNEL_POOL_IDLE_SECONDS", "600")))
+            atexit.register(kernel_pool.shutdown)
+        return kernel_pool
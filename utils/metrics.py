@@ -0,0 +1,238 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import json
+import time
+import math
+import threading
+from contextlib import contextmanager
+
+metrics = None
+metrics_lock = threading.Lock()
+
+# Upper bounds in seconds of the buckets of the duration histograms
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Help text of the metrics, shown by the /metrics endpoint
+METRIC_HELP = {
+    "ml_adapter_stage_seconds": "Duration of the pipeline stages",
+    "ml_adapter_stage_errors_total": "Number of pipeline stages that raised an error",
+    "ml_adapter_ingest_rows_total": "Number of rows read from the files of received events",
+    "ml_adapter_ingest_bytes_total": "Number of bytes of the files of received events read from the file system",
+    "ml_adapter_ingest_batch_files": "Number of distinct files of the last ingest batch",
+    "ml_adapter_queue_rows": "Number of rows in the queue",
+    "ml_adapter_snapshot_rows": "Number of rows of the queue snapshot of the last retrain cycle",
+    "ml_adapter_models_total": "Number of models trained, by result",
+    "ml_adapter_upload_bytes_total": "Number of bytes of the ML results uploaded to Deep Lynx",
+    "ml_adapter_deep_lynx_retries_total": "Number of Deep Lynx requests retried",
+    "ml_adapter_stage_cache_total": "Number of stage cache lookups, by result",
+    "ml_adapter_predictions_total": "Number of rows predicted by the /predict endpoint",
+}
+
+
+class Metrics():
+    """
+    Durations, counts and sizes of the pipeline stages, exposed in the Prometheus text format
+
+        1. Histograms record durations e.g. the seconds of each split, by ML Adapter object
+        2. Counters record totals e.g. the rows ingested, and gauges record current values e.g. the rows in the queue
+        3. With a log file, every timed stage is also written as a line of JSON
+
+    Args
+        log_file (string): the file of the JSON timing logs, or None
+    """
+
+    def __init__(self, log_file: str = None):
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        # Metric name -> type (histogram, counter, gauge)
+        self.types = dict()
+        # Metric name -> labels (tuple of (name, value)) -> value, or [bucket counts, sum, count] of a histogram
+        self.values = dict()
+
+    @staticmethod
+    def label_key(labels: dict):
+        """
+        Returns the labels of a value as a sortable key, without the labels that are None
+        """
+        return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+    def register(self, name: str, type: str):
+        """
+        Records the type of a metric and returns its values. Called with the lock held
+        """
+        if self.types.setdefault(name, type) != type:
+            raise ValueError('Metric {0} is a {1}, not a {2}'.format(name, self.types[name], type))
+        return self.values.setdefault(name, dict())
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Adds a value to a histogram e.g. a duration in seconds
+        Args
+            name (string): the name of the metric e.g. ml_adapter_stage_seconds
+            value (float): the observed value
+            **labels: the labels of the value e.g. stage="split", adapter="adapter_1"
+        """
+        with self.lock:
+            series = self.register(name, "histogram")
+            key = self.label_key(labels)
+            if key not in series:
+                series[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            histogram = series[key]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """
+        Adds a value to a counter
+        Args
+            name (string): the name of the metric, ending with _total
+            value (float): the increment
+            **labels: the labels of the counter
+        """
+        with self.lock:
+            series = self.register(name, "counter")
+            key = self.label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """
+        Sets the value of a gauge
+        Args
+            name (string): the name of the metric
+            value (float): the current value
+            **labels: the labels of the gauge
+        """
+        with self.lock:
+            self.register(name, "gauge")[self.label_key(labels)] = value
+
+    def record(self, stage: str, seconds: float, error: bool = False, **labels):
+        """
+        Records the duration of a pipeline stage, and writes it to the JSON timing log
+        Args
+            stage (string): the name of the stage e.g. split
+            seconds (float): the duration of the stage
+            error (boolean): whether the stage raised an error
+            **labels: the labels of the stage e.g. adapter="adapter_1", model=0
+        """
+        self.observe("ml_adapter_stage_seconds", seconds, stage=stage, **labels)
+        if error:
+            self.increment("ml_adapter_stage_errors_total", stage=stage, **labels)
+        if self.log_file:
+            entry = {"time": time.time(), "stage": stage, "seconds": seconds, "error": error}
+            entry.update((name, value) for name, value in labels.items() if value is not None)
+            line = json.dumps(entry, default=str) + "\n"
+            with self.lock:
+                with open(self.log_file, 'a') as f:
+                    f.write(line)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """
+        Records the duration of the code in a with statement as a pipeline stage
+
+        Example
+            with utils.get_metrics().timer("split", adapter=name):
+                ...
+        Args
+            stage (string): the name of the stage e.g. split
+            **labels: the labels of the stage e.g. adapter="adapter_1"
+        """
+        start = time.time()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(stage, time.time() - start, error, **labels)
+
+    def snapshot(self):
+        """
+        Returns a copy of the current values, e.g. to compare the metrics before and after a benchmark
+        Return
+            values (dictionary): metric name -> {"type": type, "values": {labels (dictionary) -> value}}. The value of
+                a histogram is {"buckets": [...], "sum": seconds, "count": count}
+        """
+        with self.lock:
+            snapshot = dict()
+            for name, type in self.types.items():
+                values = dict()
+                for labels, value in self.values[name].items():
+                    if type == "histogram":
+                        value = {"buckets": list(value[0]), "sum": value[1], "count": value[2]}
+                    values[labels] = value
+                snapshot[name] = {"type": type, "values": values}
+            return snapshot
+
+    def reset(self):
+        """
+        Removes all values e.g. between the scenarios of a benchmark
+        """
+        with self.lock:
+            self.types.clear()
+            self.values.clear()
+
+    @staticmethod
+    def format_labels(labels: tuple, extra: tuple = ()):
+        """
+        Returns labels in the Prometheus format e.g. {stage="split",adapter="adapter_1"}
+        """
+        labels = labels + extra
+        if not labels:
+            return ""
+        escaped = ('{0}="{1}"'.format(name,
+                                      value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for name, value in labels)
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def format_value(value: float):
+        """
+        Returns a value in the Prometheus format
+        """
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value))
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        Return
+            text (string): the metrics
+        """
+        lines = list()
+        with self.lock:
+            for name in sorted(self.types):
+                type = self.types[name]
+                lines.append("# HELP {0} {1}".format(name, METRIC_HELP.get(name, name)))
+                lines.append("# TYPE {0} {1}".format(name, type))
+                for labels, value in sorted(self.values[name].items()):
+                    if type != "histogram":
+                        lines.append(name + self.format_labels(labels) + " " + self.format_value(value))
+                        continue
+                    buckets, total, count = value
+                    for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                        lines.append(name + "_bucket" + self.format_labels(labels, (("le", str(bound)), )) + " " +
+                                     str(bucket))
+                    lines.append(name + "_bucket" + self.format_labels(labels, (("le", "+Inf"), )) + " " + str(count))
+                    lines.append(name + "_sum" + self.format_labels(labels) + " " + self.format_value(total))
+                    lines.append(name + "_count" + self.format_labels(labels) + " " + str(count))
+        return "\n".join(lines) + "\n"
+
+
+def get_metrics():
+    """
+    Returns the metrics of the adapter. The JSON timing log is written to METRICS_LOG_FILE if set
+    Return
+        metrics (Metrics): the metrics
+    """
+    global metrics
+    with metrics_lock:
+        if metrics is None:
+            metrics = Metrics(os.getenv("METRICS_LOG_FILE") or None)
+        return metrics
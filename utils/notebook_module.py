@@ -0,0 +1,235 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import sys
+import ast
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+
+NOTEBOOK_EXECUTIONS = ("kernel", "module")
+SHELL_COMMANDS = ("run", "skip")
+# Kernels whose notebooks can be compiled to a Python module run by the interpreter of the adapter
+MODULE_KERNELS = ("python3", )
+# Line magics supported by the runner. load_ext only loads the dotenv extension
+LINE_MAGICS = ("load_ext", "dotenv", "pwd", "cd", "env", "matplotlib")
+# Bump when the compiled form of a notebook changes, so that modules compiled before are not reused
+COMPILER_VERSION = "1"
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "notebook_runner.py")
+
+# The compiled module of each notebook: {file_path: (mtime_ns, size, module_file)}. module_file is None for a
+# notebook that cannot be compiled
+modules = dict()
+modules_lock = threading.Lock()
+
+
+def notebook_execution():
+    """
+    Returns how python3 Jupyter Notebooks are run, configured by the NOTEBOOK_EXECUTION environment variable: kernel
+    (default) or module
+    """
+    execution = os.getenv("NOTEBOOK_EXECUTION", "kernel").strip().lower() or "kernel"
+    if execution not in NOTEBOOK_EXECUTIONS:
+        error = 'Unknown notebook execution: \'{0}\'. Choose one of {1}'.format(execution,
+                                                                                ", ".join(NOTEBOOK_EXECUTIONS))
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    return execution
+
+
+def shell_commands():
+    """
+    Returns how the shell commands of a compiled notebook e.g. !pip install pygam are handled, configured by the
+    NOTEBOOK_SHELL_COMMANDS environment variable: run (default) or skip
+    """
+    policy = os.getenv("NOTEBOOK_SHELL_COMMANDS", "run").strip().lower() or "run"
+    if policy not in SHELL_COMMANDS:
+        error = 'Unknown notebook shell commands: \'{0}\'. Choose one of {1}'.format(policy, ", ".join(SHELL_COMMANDS))
+        logging.getLogger(__name__).error('{0}: {1}'.format('ValueError', error))
+        raise ValueError(error)
+    return policy
+
+
+def unsupported_ipython(code: str):
+    """
+    Returns the first IPython-only call of a transformed cell that the runner does not support, or None
+        * cell magics e.g. %%time
+        * line magics other than LINE_MAGICS e.g. %timeit, and extensions other than dotenv
+        * shell commands that expand Python variables e.g. !pip install {package}
+    Args
+        code (string): the code of a cell transformed by IPython
+    """
+    tree = ast.parse(code)
+    supported = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+            continue
+        shell = node.func.value
+        if not (isinstance(shell, ast.Call) and isinstance(shell.func, ast.Name) and shell.func.id == 'get_ipython'):
+            continue
+        args = [arg.value if isinstance(arg, ast.Constant) else None for arg in node.args]
+        if node.func.attr == 'run_line_magic' and len(args) == 2 and args[0] in LINE_MAGICS:
+            if args[0] != 'load_ext' or args[1].strip() == 'dotenv':
+                supported.add(shell.func)
+                continue
+        if node.func.attr in ('system', 'getoutput') and len(args) == 1 and isinstance(args[0], str):
+            if '$' not in args[0] and '{' not in args[0]:
+                supported.add(shell.func)
+                continue
+        return ast.unparse(node)
+    # Any other use of get_ipython() e.g. get_ipython().user_ns
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == 'get_ipython' and node not in supported:
+            return ast.unparse(node)
+    return None
+
+
+def compile_notebook(file_path: str):
+    """
+    Compiles the code cells of a python3 Jupyter Notebook to the source of a Python module run by notebook_runner.py
+        1. The IPython-only lines of each cell are transformed by IPython to calls of get_ipython() e.g. %dotenv to
+           get_ipython().run_line_magic('dotenv', ''), which the runner provides
+        2. Each cell is preceded by a call of __notebook__.cell(), so that the runner times the cells and reports the
+           cell that raised an error
+        3. A ValueError is raised if a cell uses IPython features the runner does not support, and a SyntaxError if
+           a cell does not compile. Such a notebook is run on a kernel, which reports the error of the cell as usual
+    Args
+        file_path (string): the path of the Jupyter Notebook
+    Return
+        source (string): the source of the module
+    """
+    import nbformat
+    from IPython.core.inputtransformer2 import TransformerManager
+
+    with open(file_path) as f:
+        nb = nbformat.read(f, as_version=4)
+    transformer = TransformerManager()
+    lines = ["# Compiled from " + os.path.abspath(file_path) + " by utils/notebook_module.py. Do not edit"]
+    for index, cell in enumerate(nb.cells):
+        if cell.cell_type != 'code' or not cell.source.strip():
+            continue
+        code = transformer.transform_cell(cell.source)
+        unsupported = unsupported_ipython(code)
+        if unsupported is not None:
+            error = 'cell {0} uses {1}'.format(index, unsupported)
+            raise ValueError(error)
+        lines += ["", "# In[{0}]".format(index), "__notebook__.cell({0}, {1})".format(index, repr(cell.source)), code]
+    return "\n".join(lines) + "\n"
+
+
+def module_directory():
+    """
+    Returns the directory of the compiled modules, configured by the NOTEBOOK_MODULE_DIRECTORY environment variable
+    """
+    return os.getenv("NOTEBOOK_MODULE_DIRECTORY") or os.path.join("data", "compiled_notebooks")
+
+
+def get_notebook_module(file_path: str, kernel: str):
+    """
+    Returns the compiled module of a Jupyter Notebook if notebooks are run as modules (NOTEBOOK_EXECUTION module)
+
+        1. A notebook is compiled once, to a file named by a hash of its contents in NOTEBOOK_MODULE_DIRECTORY, and
+           compiled again if it changed. The modules compiled before for the notebook are removed
+        2. A notebook is only compiled again once its modification time or size changed; only then is it hashed
+        3. A notebook of another kernel, or one that uses IPython features the runner does not support, is run on a
+           kernel (None is returned). The reason is logged once
+
+    Args
+        file_path (string): the path of the Jupyter Notebook
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+    Return
+        module_file (string): the path of the compiled module, or None to run the notebook on a kernel
+    """
+    if notebook_execution() != "module" or kernel not in MODULE_KERNELS:
+        return None
+    import IPython
+
+    shell_commands()
+    file_path = os.path.abspath(file_path)
+    status = os.stat(file_path)
+    with modules_lock:
+        cached = modules.get(file_path)
+        if cached is not None and cached[:2] == (status.st_mtime_ns, status.st_size):
+            return cached[2]
+
+        with open(file_path, 'rb') as f:
+            digest = hashlib.sha256((COMPILER_VERSION + IPython.__version__).encode() + b':' + f.read()).hexdigest()
+        directory = module_directory()
+        prefix = os.path.splitext(os.path.basename(file_path))[0] + '-' + hashlib.sha256(
+            file_path.encode()).hexdigest()[:8] + '-'
+        module_file = os.path.abspath(os.path.join(directory, prefix + digest[:16] + '.py'))
+        if not os.path.exists(module_file):
+            try:
+                source = compile_notebook(file_path)
+            except (ValueError, SyntaxError) as e:
+                logging.getLogger(__name__).warning('Running ' + file_path + ' on a kernel: ' + str(e))
+                module_file = None
+            else:
+                os.makedirs(directory, exist_ok=True)
+                # Written to a temporary file and renamed, so that a module is never run half written
+                fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=directory)
+                with os.fdopen(fd, 'w') as f:
+                    f.write(source)
+                os.replace(temporary, module_file)
+                for name in os.listdir(directory):
+                    if name.startswith(prefix) and name != os.path.basename(module_file):
+                        os.remove(os.path.join(directory, name))
+                logging.getLogger(__name__).info('Compiled ' + file_path + ' to ' + module_file)
+        modules[file_path] = (status.st_mtime_ns, status.st_size, module_file)
+        return module_file
+
+
+def run_notebook_module(module_file: str, path: str, env: dict = None, timeout: float = 600, profile=None):
+    """
+    Runs a compiled Jupyter Notebook in a new Python interpreter, without a Jupyter kernel
+
+        1. The module runs in the notebook's directory, with the environment of this process updated by env, like a
+           kernel started for the notebook. Its output is discarded, like the outputs of the cells of a notebook
+        2. IPython-only lines are handled by notebook_runner.py: %load_ext dotenv and %matplotlib do nothing, %dotenv
+           loads the .env file, %pwd, %cd and %env act as in IPython, and shell commands e.g. !pip install pygam are
+           run or skipped (NOTEBOOK_SHELL_COMMANDS)
+        3. An error raised by a cell is raised as a CellExecutionError, as if the notebook ran on a kernel
+
+    Args
+        module_file (string): the path of the compiled module
+        path (string): the directory of the notebook
+        env (dictionary): environment variables that override the environment of this process
+        timeout (float): the number of seconds a cell may run
+        profile (Notebook_Profile): the profile to which the cells are added, or None
+    """
+    from nbconvert.preprocessors import CellExecutionError
+
+    fd, result_file = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        command = [sys.executable, RUNNER, module_file, result_file, str(timeout)]
+        process = subprocess.run(command,
+                                 cwd=os.path.abspath(path or '.'),
+                                 env={
+                                     **os.environ,
+                                     **(env or dict())
+                                 },
+                                 stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE)
+        try:
+            with open(result_file) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = None
+    finally:
+        os.remove(result_file)
+
+    if result is None:
+        stderr = process.stderr.decode(errors='replace').strip().splitlines()
+        error = 'The notebook process of {0} exited with code {1}: {2}'.format(module_file, process.returncode,
+                                                                               "\n".join(stderr[-20:]))
+        logging.getLogger(__name__).error('{0}: {1}'.format('RuntimeError', error))
+        raise RuntimeError(error)
+    if profile is not None:
+        profile.add_cells(result["cells"], result["peak_rss_scope"])
+    if result["error"] is not None:
+        raise CellExecutionError(result["error"]["traceback"], result["error"]["ename"], result["error"]["evalue"])
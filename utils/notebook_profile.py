@@ -0,0 +1,206 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import json
+import time
+import logging
+
+# Number of characters of the source of a cell kept in the profile
+SOURCE_LENGTH = 80
+
+
+def kernel_pid(km):
+    """
+    Returns the process id of a kernel started on this host, or None e.g. for a remote kernel
+    Args
+        km (KernelManager): the kernel
+    """
+    provisioner = getattr(km, "provisioner", None)
+    return getattr(provisioner, "pid", None)
+
+
+def reset_peak_rss(pid: int):
+    """
+    Resets the peak resident set size of a process, so that the next read returns the peak since the reset. Linux only
+    Args
+        pid (integer): the process id
+    Return
+        reset (boolean): whether the peak was reset
+    """
+    try:
+        with open('/proc/{0}/clear_refs'.format(pid), 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_rss(pid: int):
+    """
+    Returns the peak and current resident set size of a process. Linux only
+    Args
+        pid (integer): the process id
+    Return
+        peak_rss (integer): the peak resident set size in bytes, or None if not available
+        rss (integer): the current resident set size in bytes, or None if not available
+    """
+    values = dict()
+    try:
+        with open('/proc/{0}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith(('VmHWM:', 'VmRSS:')):
+                    name, value = line.split(':', 1)
+                    values[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    return values.get('VmHWM'), values.get('VmRSS')
+
+
+def source_summary(source: str):
+    """
+    Returns the first line of a cell that is not blank or a comment, e.g. !pip install pygam, shortened
+    """
+    lines = [line.strip() for line in source.splitlines() if line.strip()]
+    code = [line for line in lines if not line.startswith('#')]
+    line = (code or lines or [''])[0]
+    return line if len(line) <= SOURCE_LENGTH else line[:SOURCE_LENGTH - 3] + '...'
+
+
+class Notebook_Profile():
+    """
+    The wall time and peak memory of each cell of a Jupyter Notebook run, written to NOTEBOOK_PROFILE_FILE
+
+        1. The cells are timed by the hooks of the ExecutePreprocessor, from the execute request to the execute reply
+        2. On Linux, the peak resident set size (RSS) of the kernel process is reset before each cell and read after
+           it, so that each cell reports its own peak. If the peak cannot be reset, the peak since the kernel started
+           is reported, and peak_rss_scope is "kernel". Elsewhere, the RSS is None. The memory of processes started
+           by a cell e.g. !pip install is not included
+        3. The profile is appended to the report file as a line of JSON, tagged with the notebook, kernel and labels
+        4. A notebook compiled to a module (NOTEBOOK_EXECUTION module) is timed by utils/notebook_runner.py, which
+           adds its cells once the module ran; the RSS is the one of the interpreter running the module
+
+    Args
+        ep (ExecutePreprocessor): the preprocessor that runs the notebook, or None for a compiled notebook
+        file_path (string): the path of the Jupyter Notebook
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+        labels (dictionary): the labels of the run e.g. {"adapter": "ML_Object_1", "stage": "model"}
+    """
+
+    def __init__(self, ep, file_path: str, kernel: str, labels: dict = None):
+        self.ep = ep
+        self.file_path = os.path.abspath(file_path)
+        self.kernel = kernel
+        self.labels = labels or dict()
+        self.start = time.time()
+        self.cells = list()
+        self.running = None
+        self.peak_rss_scope = None
+        self.execution = "kernel" if ep is not None else "module"
+        if ep is not None:
+            ep.on_cell_execute = self.cell_started
+            ep.on_cell_executed = self.cell_executed
+
+    def cell_started(self, cell, cell_index: int):
+        """
+        Hook of the ExecutePreprocessor called before a code cell is sent to the kernel
+        """
+        pid = kernel_pid(self.ep.km)
+        if pid is not None:
+            self.peak_rss_scope = "cell" if reset_peak_rss(pid) else "kernel"
+        self.running = {
+            "index": cell_index,
+            "source": source_summary(cell.source),
+            "start": time.monotonic(),
+            "pid": pid
+        }
+
+    def cell_executed(self, cell, cell_index: int, execute_reply: dict):
+        """
+        Hook of the ExecutePreprocessor called once a code cell replied
+        """
+        status = (execute_reply or dict()).get("content", dict()).get("status", "ok")
+        self.finish_cell(status, cell.get("execution_count"))
+
+    def finish_cell(self, status: str, execution_count: int = None):
+        """
+        Records the cell that is running
+        Args
+            status (string): ok, error, or interrupted if the cell did not reply e.g. on a timeout
+            execution_count (integer): the execution count of the cell
+        """
+        if self.running is None:
+            return
+        running, self.running = self.running, None
+        peak_rss, rss = read_rss(running["pid"]) if running["pid"] is not None else (None, None)
+        self.cells.append({
+            "index": running["index"],
+            "source": running["source"],
+            "execution_count": execution_count,
+            "status": status,
+            "seconds": time.monotonic() - running["start"],
+            "peak_rss_bytes": peak_rss,
+            "rss_bytes": rss
+        })
+
+    def add_cells(self, cells: list, peak_rss_scope: str = None):
+        """
+        Adds the cells of a compiled notebook, timed by utils/notebook_runner.py
+        Args
+            cells (list): the cells that ran, in the format of the cells of the profile
+            peak_rss_scope (string): cell, kernel, or None if the RSS is not available
+        """
+        self.cells.extend(cells)
+        self.peak_rss_scope = peak_rss_scope
+
+    def write(self, report_file: str, error: str = None):
+        """
+        Appends the profile to the report file as a line of JSON. A failure to write is logged, and does not fail the
+        notebook
+        Args
+            report_file (string): the JSON lines file of the profiles
+            error (string): the error raised by the notebook, or None
+        """
+        self.finish_cell("interrupted")
+        entry = {
+            "time": self.start,
+            "notebook": self.file_path,
+            "kernel": self.kernel,
+            "execution": self.execution,
+            "seconds": time.time() - self.start,
+            "error": error,
+            "peak_rss_scope": self.peak_rss_scope,
+            "cells": self.cells
+        }
+        entry.update((name, value) for name, value in self.labels.items() if value is not None)
+        logger = logging.getLogger(__name__)
+        if self.cells:
+            slowest = max(self.cells, key=lambda cell: cell["seconds"])
+            logger.info('Slowest cell of ' + self.file_path + ': cell ' + str(slowest["index"]) + ' (' +
+                        str(round(slowest["seconds"], 3)) + ' seconds) ' + slowest["source"])
+        try:
+            directory = os.path.dirname(os.path.abspath(report_file))
+            os.makedirs(directory, exist_ok=True)
+            # A single append of the whole line, so that the lines of worker processes do not interleave
+            fd = os.open(report_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, (json.dumps(entry, default=str) + "\n").encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            logger.exception('Could not write the profile of ' + self.file_path + ' to ' + report_file)
+
+
+def create_notebook_profile(ep, file_path: str, kernel: str, labels: dict = None):
+    """
+    Profiles the cells run by an ExecutePreprocessor if the NOTEBOOK_PROFILE_FILE environment variable is set
+    Args
+        ep (ExecutePreprocessor): the preprocessor that runs the notebook, or None for a compiled notebook
+        file_path (string): the path of the Jupyter Notebook
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+        labels (dictionary): the labels of the run e.g. {"adapter": "ML_Object_1", "stage": "model"}
+    Return
+        profile (Notebook_Profile): the profile, or None if NOTEBOOK_PROFILE_FILE is not set
+    """
+    if not os.getenv("NOTEBOOK_PROFILE_FILE"):
+        return None
+    return Notebook_Profile(ep, file_path, kernel, labels)
@@ -0,0 +1,160 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+"""
+Runs a Jupyter Notebook compiled by utils/notebook_module.py in this interpreter, without a Jupyter kernel:
+
+    python utils/notebook_runner.py <module file> <result file> <cell timeout seconds>
+
+The result file is written as JSON: the cells that ran and the error raised by a cell, if any. Only the standard
+library and the notebook's own imports are loaded, so that the interpreter starts quickly
+"""
+
+import os
+import sys
+import json
+import time
+import runpy
+import signal
+import subprocess
+import traceback
+
+# The directory of this script is first on sys.path
+from notebook_profile import reset_peak_rss, read_rss, source_summary
+
+# Like in a kernel, modules are imported from the working directory and not from the directory of this script
+sys.path[0] = ''
+
+
+class Shell():
+    """
+    The IPython-only lines of a compiled notebook, which call get_ipython()
+        * %load_ext dotenv and %matplotlib do nothing: there is no extension to load nor inline backend
+        * %dotenv loads the .env file of the working directory or its parents, or the file given. -o overrides the
+          environment variables that are set
+        * %pwd, %cd and %env act as in IPython
+        * shell commands e.g. !pip install pygam are run by the shell, or skipped with NOTEBOOK_SHELL_COMMANDS skip
+
+    Args
+        commands (string): run or skip the shell commands
+    """
+
+    def __init__(self, commands: str):
+        self.commands = commands
+
+    def run_line_magic(self, name: str, line: str):
+        args = line.split()
+        if name == 'dotenv':
+            from dotenv import load_dotenv, find_dotenv
+            files = [arg for arg in args if not arg.startswith('-')]
+            load_dotenv(files[0] if files else find_dotenv(usecwd=True), override='-o' in args or '--override' in args)
+        elif name == 'pwd':
+            return os.getcwd()
+        elif name == 'cd':
+            os.chdir(os.path.expanduser(line.strip() or '~'))
+        elif name == 'env':
+            if '=' in line:
+                variable, value = line.split('=', 1)
+                os.environ[variable.strip()] = value.strip()
+            elif line.strip():
+                return os.environ.get(line.strip())
+            else:
+                return dict(os.environ)
+        return None
+
+    def system(self, command: str):
+        if self.commands == 'skip':
+            print('Skipped shell command: ' + command, file=sys.stderr)
+            return
+        sys.stdout.flush()
+        subprocess.run(command, shell=True)
+
+    def getoutput(self, command: str):
+        if self.commands == 'skip':
+            print('Skipped shell command: ' + command, file=sys.stderr)
+            return []
+        process = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return process.stdout.decode(errors='replace').splitlines()
+
+
+class Notebook():
+    """
+    Times the cells of a compiled notebook, called by __notebook__.cell() before each cell. With NOTEBOOK_PROFILE_FILE
+    set, the peak resident set size of this process is reset before each cell and read after it, see Notebook_Profile
+    Args
+        timeout (float): the number of seconds a cell may run before a TimeoutError is raised in it
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.profile = bool(os.getenv("NOTEBOOK_PROFILE_FILE"))
+        self.peak_rss_scope = None
+        self.cells = list()
+        self.running = None
+        if self.timeout > 0 and hasattr(signal, 'SIGALRM'):
+            signal.signal(signal.SIGALRM, self.timed_out)
+
+    def timed_out(self, signum, frame):
+        raise TimeoutError('Cell execution timed out after {0} seconds'.format(self.timeout))
+
+    def cell(self, index: int, source: str):
+        self.finish_cell("ok")
+        if self.profile:
+            self.peak_rss_scope = "cell" if reset_peak_rss(os.getpid()) else "kernel"
+        self.running = {
+            "index": index,
+            "source": source_summary(source),
+            "execution_count": len(self.cells) + 1,
+            "start": time.monotonic()
+        }
+        if self.timeout > 0 and hasattr(signal, 'SIGALRM'):
+            signal.setitimer(signal.ITIMER_REAL, self.timeout)
+
+    def finish_cell(self, status: str):
+        if self.running is None:
+            return
+        if self.timeout > 0 and hasattr(signal, 'SIGALRM'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        running, self.running = self.running, None
+        peak_rss, rss = read_rss(os.getpid()) if self.profile else (None, None)
+        self.cells.append({
+            "index": running["index"],
+            "source": running["source"],
+            "execution_count": running["execution_count"],
+            "status": status,
+            "seconds": time.monotonic() - running["start"],
+            "peak_rss_bytes": peak_rss,
+            "rss_bytes": rss
+        })
+
+
+def main():
+    module_file, result_file, timeout = sys.argv[1], sys.argv[2], float(sys.argv[3])
+    sys.argv = [module_file]
+    notebook = Notebook(timeout)
+    shell = Shell(os.getenv("NOTEBOOK_SHELL_COMMANDS", "run").strip().lower() or "run")
+    error = None
+    try:
+        runpy.run_path(module_file,
+                       init_globals={
+                           "__notebook__": notebook,
+                           "get_ipython": lambda: shell,
+                           "display": print
+                       },
+                       run_name="__main__")
+        notebook.finish_cell("ok")
+    except BaseException as e:
+        notebook.finish_cell("error")
+        # The traceback starts at the notebook: the frames of this runner are left out, as the frames of a kernel are
+        frames = traceback.extract_tb(e.__traceback__)
+        notebook_frames = [i for i, frame in enumerate(frames) if frame.filename == module_file]
+        frames = frames[notebook_frames[0]:] if notebook_frames else frames
+        error = {
+            "ename": type(e).__name__,
+            "evalue": str(e),
+            "traceback": "".join(traceback.format_list(frames) + traceback.format_exception_only(type(e), e))
+        }
+    with open(result_file, 'w') as f:
+        json.dump({"cells": notebook.cells, "peak_rss_scope": notebook.peak_rss_scope, "error": error}, f, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,91 @@
 # Copyright 2021, Battelle Energy Alliance, LLC
 
 import os
-import nbformat
-from nbconvert.preprocessors import ExecutePreprocessor
+from jupyter_client import KernelManager
 
+from .kernel_pool import RESET_CODE, get_kernel_pool
+from .notebook_profile import create_notebook_profile
+from .notebook_module import get_notebook_module, run_notebook_module
 
-def run_jupyter_notebook(file_path: str, kernel: str):
+
+def run_jupyter_notebook(file_path: str, kernel: str, env: dict = None, labels: dict = None):
     """
-    Runs a Jupyter Notebook programmatically
+    Runs a Jupyter Notebook programmatically. With NOTEBOOK_PROFILE_FILE set, the wall time and peak memory of each
+    cell are appended to that file, see Notebook_Profile. With NOTEBOOK_EXECUTION module, a python3 notebook is compiled
+    to a Python module once and run without a Jupyter kernel, see run_notebook_module
 
     Args
         file_path (string): the file path to the Jupyter Notebook
-        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir) 
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+        env (dictionary): environment variables of the kernel that override the environment of this process e.g.
+            {"ML_ADAPTER_OBJECT_LOCATION": "data/models/0/ml_adapter_object.json"}
+        labels (dictionary): the labels of the notebook profile e.g. {"adapter": "ML_Object_1", "stage": "model"}
     """
+    # Imported here, so that importing utils in a compiled notebook does not import nbconvert
+    import nbformat
+    from nbconvert.preprocessors import ExecutePreprocessor, CellExecutionError
+
     path = os.path.split(file_path)
-    with open(file_path) as f:
-        nb = nbformat.read(f, as_version=4)
-    ep = ExecutePreprocessor(timeout=600, kernel_name=kernel)
-    ep.preprocess(nb, {'metadata': {'path': path[0]}})
\ No newline at end of file
+    module_file = get_notebook_module(file_path, kernel)
+    ep = None
+    if module_file is None:
+        with open(file_path) as f:
+            nb = nbformat.read(f, as_version=4)
+        ep = ExecutePreprocessor(timeout=600, kernel_name=kernel)
+    profile = create_notebook_profile(ep, file_path, kernel, labels)
+    error = None
+    try:
+        if module_file is None:
+            execute_notebook(ep, nb, path[0], kernel, env)
+        else:
+            run_notebook_module(module_file, path[0], env, 600, profile)
+    except BaseException as e:
+        error = repr(e) if not isinstance(e, CellExecutionError) else 'CellExecutionError: ' + str(e.ename)
+        raise
+    finally:
+        if profile is not None:
+            profile.write(os.getenv("NOTEBOOK_PROFILE_FILE"), error)
+
+
+def execute_notebook(ep, nb, path: str, kernel: str, env: dict = None):
+    """
+    Executes the cells of a notebook with a new kernel, or with a warm kernel of the kernel pool
+    Args
+        ep (ExecutePreprocessor): the preprocessor that runs the notebook
+        nb (NotebookNode): the notebook
+        path (string): the directory of the notebook, the working directory of the kernel
+        kernel (string): name of Jupyter Notebook kernel e.g. (python3, ir)
+        env (dictionary): environment variables of the kernel that override the environment of this process
+    """
+    from nbconvert.preprocessors import CellExecutionError
+
+    # Start a new kernel if kernels are not pooled or the kernel cannot be reset between notebooks
+    kernel_pool = get_kernel_pool()
+    if kernel_pool is None or kernel not in RESET_CODE:
+        if env is None:
+            ep.preprocess(nb, {'metadata': {'path': path}})
+            return
+        km = KernelManager(kernel_name=kernel)
+        km.start_kernel(cwd=os.path.abspath(path), env={**os.environ, **env})
+        try:
+            ep.preprocess(nb, {'metadata': {'path': path}}, km=km)
+        finally:
+            if ep.kc is not None:
+                ep.kc.stop_channels()
+            km.shutdown_kernel(now=True)
+        return
+
+    # Run the notebook on a warm kernel from the pool
+    km = kernel_pool.acquire(kernel, os.path.abspath(path), env)
+    healthy = False
+    try:
+        ep.preprocess(nb, {'metadata': {'path': path}}, km=km)
+        healthy = True
+    except CellExecutionError:
+        # An error raised by a cell does not affect the kernel itself
+        healthy = True
+        raise
+    finally:
+        if ep.kc is not None:
+            ep.kc.stop_channels()
+        kernel_pool.release(kernel, km, healthy)
@@ -0,0 +1,169 @@
+# Copyright 2021, Battelle Energy Alliance, LLC
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import pandas as pd
+
+from .metrics import get_metrics
+
+stage_cache = None
+stage_cache_lock = threading.Lock()
+
+
+class Stage_Cache():
+    """
+    A size-bounded cache on disk of the outputs of pipeline stages, keyed by a hash of their inputs
+
+        1. An entry is a directory of files named by the key e.g. the split indices or the variable selection file
+        2. An entry is written to a temporary directory and renamed, so that it is never read half written
+        3. Reading an entry marks it as recently used. Once the entries hold more than max_bytes, the least recently
+           used entries are removed
+
+    Args
+        directory (string): the directory of the entries
+        max_bytes (integer): the maximum number of bytes held by the entries
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        Returns the key of an entry, a SHA-256 hash of its inputs
+        Args
+            *parts (bytes or string): the inputs of the stage e.g. the hash of the dataset, the notebook contents
+        Return
+            key (string): the hexadecimal hash
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            part = part if isinstance(part, bytes) else str(part).encode()
+            # The length prefix keeps ("ab", "c") and ("a", "bc") apart
+            digest.update(str(len(part)).encode() + b':' + part)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_dataset(dataset: pd.DataFrame):
+        """
+        Returns a hash of the values, index, columns and dtypes of a dataset
+        Args
+            dataset (DataFrame): the dataset e.g. the queue snapshot
+        Return
+            hash (string): the hexadecimal hash
+        """
+        digest = hashlib.sha256()
+        digest.update(repr(list(zip(dataset.columns, dataset.dtypes.astype(str)))).encode())
+        digest.update(pd.util.hash_pandas_object(dataset, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_file(file_path: str):
+        """
+        Returns a hash of the contents of a file e.g. a Jupyter Notebook
+        Args
+            file_path (string): the path of the file
+        Return
+            hash (string): the hexadecimal hash
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, key: str, read):
+        """
+        Reads an entry, and marks it as recently used. The entry's files are read with the lock held, so that the
+        entry is not evicted by another thread while it is read. An entry whose files cannot be read is a miss
+        Args
+            key (string): the key of the entry
+            read (function): the function called with the directory of the entry, which reads or copies its files
+        Return
+            hit (boolean): whether the entry was cached and read
+        """
+        entry = os.path.join(self.directory, key)
+        with self.lock:
+            hit = os.path.isdir(entry)
+            if hit:
+                try:
+                    read(entry)
+                    os.utime(entry)
+                except OSError as e:
+                    logging.warning('Stage cache entry ' + key + ' could not be read: ' + repr(e))
+                    hit = False
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            get_metrics().increment("ml_adapter_stage_cache_total", result="hit" if hit else "miss")
+            return hit
+
+    def put(self, key: str, write):
+        """
+        Adds an entry and removes the least recently used entries beyond max_bytes
+        Args
+            key (string): the key of the entry
+            write (function): the function called with the directory of the entry, which writes the entry's files
+        """
+        temporary = tempfile.mkdtemp(prefix='.' + key + '.', dir=self.directory)
+        try:
+            write(temporary)
+            with self.lock:
+                entry = os.path.join(self.directory, key)
+                if os.path.isdir(entry):
+                    # Written by another thread at the same time
+                    shutil.rmtree(temporary)
+                else:
+                    os.replace(temporary, entry)
+                self.evict()
+        except Exception:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the entries hold at most max_bytes. Called with the lock held
+        """
+        entries = list()
+        total = 0
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+            total += size
+        for used, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            logging.info('Evicted stage cache entry ' + os.path.basename(entry) + ' (' + str(size) + ' bytes)')
+
+
+def get_stage_cache():
+    """
+    Returns the stage cache configured by the STAGE_CACHE_MAX_MB and STAGE_CACHE_DIRECTORY environment variables
+    Return
+        stage_cache (Stage_Cache): the stage cache, or None if STAGE_CACHE_MAX_MB is 0 or not set
+    """
+    global stage_cache
+    max_mb = float(os.getenv("STAGE_CACHE_MAX_MB", "0"))
+    if max_mb <= 0:
+        return None
+    with stage_cache_lock:
+        if stage_cache is None:
+            stage_cache = Stage_Cache(
+                os.getenv("STAGE_CACHE_DIRECTORY") or os.path.join("data", "cache"), int(max_mb * 1024 * 1024))
+        return stage_cache